@@ -1,4 +1,4 @@
-from .data import SampleAdmin
+from .data import SampleAdmin, RetentionPolicyAdmin
 from .devices import QuantityAdmin, NodeProtocolAdmin, NodeModelAdmin, NodeAdmin
 from .inventory import (
     AddressAdmin,
@@ -1,9 +1,14 @@
 from django.contrib import admin
 
-from core.models import Sample
+from core.models import RetentionPolicy, Sample
 
 
 @admin.register(Sample)
 class SampleAdmin(admin.ModelAdmin):
     list_display = ("timestamp_iso", "node", "co2_ppm")
     list_filter = ["node"]
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ("organization", "after_months", "action")
@@ -0,0 +1,354 @@
+"""Cold storage of the samples of closed months in compressed blocks.
+
+Old samples are only ever read in bulk, by month or longer. Once a UTC month is closed
+for SAMPLE_COLD_STORAGE_AFTER_MONTHS months, pack moves the samples of each node within
+the month out of the sample table into a SampleBlock. A block stores the samples column
+by column, which compresses well:
+
+- the timestamp of the first sample as uint32, and the deltas of the following
+  timestamps as uint32,
+- the CO2 concentrations as int16,
+- the temperatures in tenths of a degree as int16, missing values as -32768,
+- the relative humidities as uint8, missing values as 255,
+- a bitmap of the samples with replacement values, and one of those with errors,
+
+all little endian, compressed with zlib. Samples delivered late for a packed month are
+stored in the sample table as usual, and merged into the block by the next pack.
+
+The read functions combine both tiers. Ingestion checks the samples of closed months
+against the blocks as well, see packed_keys. A sample that still ends up in both
+tiers, like one inserted while its month is packed, is read and counted once, from the
+block, and the next pack drops the other one.
+"""
+
+import logging
+import struct
+import sys
+import zlib
+from array import array
+from decimal import Decimal
+from heapq import merge
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from core.models import Sample, SampleBlock
+from core.partitions import month_bounds, months, months_ago
+
+logger = logging.getLogger(__name__)
+
+# The fields of the rows of samples read and written by this module.
+COLUMNS = [
+    "timestamp_s",
+    "co2_ppm",
+    "temperature_celsius",
+    "rel_humidity_percent",
+    "measurement_status",
+]
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<BII")  # Format version, sample count, first timestamp.
+MISSING_TEMPERATURE = -32768
+MISSING_HUMIDITY = 255
+MAX_TIMESTAMP_S = 2**31 - 1
+_FLAGGED_STATUSES = (Sample.REPLACEMENT, Sample.ERROR)
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _bitmap(flags):
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for index, flag in enumerate(flags):
+        if flag:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    return bytes(bitmap)
+
+
+def encode(rows):
+    """Encode the rows of sample values in the order of COLUMNS, sorted by their
+    timestamps, into the compressed data of a block."""
+    if not rows:
+        raise ValueError("Cannot encode an empty block.")
+    timestamps = [row[0] for row in rows]
+    deltas = array("I", (b - a for a, b in zip(timestamps, timestamps[1:])))
+    co2 = array("h", (row[1] for row in rows))
+    temperatures = array(
+        "h",
+        (
+            MISSING_TEMPERATURE if row[2] is None else int(Decimal(str(row[2])) * 10)
+            for row in rows
+        ),
+    )
+    humidities = array(
+        "B", (MISSING_HUMIDITY if row[3] is None else row[3] for row in rows)
+    )
+    parts = [
+        HEADER.pack(FORMAT_VERSION, len(rows), timestamps[0]),
+        _little_endian(deltas).tobytes(),
+        _little_endian(co2).tobytes(),
+        _little_endian(temperatures).tobytes(),
+        humidities.tobytes(),
+    ]
+    for status in _FLAGGED_STATUSES:
+        parts.append(_bitmap([row[4] == status for row in rows]))
+    return zlib.compress(b"".join(parts), 9)
+
+
+def decode(data):
+    """Decode the compressed data of a block into rows of sample values in the order of
+    COLUMNS."""
+    try:
+        payload = zlib.decompress(data)
+        version, count, first_timestamp_s = HEADER.unpack_from(payload)
+    except (zlib.error, struct.error) as error:
+        raise DecodeError(f"Corrupt sample block: {error}") from error
+    if version != FORMAT_VERSION:
+        raise DecodeError(f"Unknown sample block format {version}.")
+    if not count:
+        raise DecodeError("Empty sample block.")
+    bitmap_size = (count + 7) // 8
+    sizes = [4 * (count - 1), 2 * count, 2 * count, count, bitmap_size, bitmap_size]
+    if len(payload) != HEADER.size + sum(sizes):
+        raise DecodeError("Truncated sample block.")
+    offset = HEADER.size
+    columns = []
+    for typecode, size in zip("IhhB", sizes):
+        values = array(typecode)
+        values.frombytes(payload[offset : offset + size])
+        columns.append(_little_endian(values))
+        offset += size
+    bitmaps = []
+    for size in sizes[4:]:
+        bitmaps.append(payload[offset : offset + size])
+        offset += size
+    deltas, co2, temperatures, humidities = columns
+    rows = []
+    timestamp_s = first_timestamp_s
+    for index in range(count):
+        if index:
+            timestamp_s += deltas[index - 1]
+        temperature = temperatures[index]
+        humidity = humidities[index]
+        status = Sample.MEASUREMENT
+        for flagged_status, bitmap in zip(_FLAGGED_STATUSES, bitmaps):
+            if bitmap[index >> 3] & (1 << (index & 7)):
+                status = flagged_status
+        rows.append(
+            (
+                timestamp_s,
+                co2[index],
+                (
+                    None
+                    if temperature == MISSING_TEMPERATURE
+                    else Decimal(temperature).scaleb(-1)
+                ),
+                None if humidity == MISSING_HUMIDITY else humidity,
+                status,
+            )
+        )
+    return rows
+
+
+def _blocks(node_id, from_s, to_s):
+    return SampleBlock.objects.filter(
+        node_id=node_id, start_s__lte=to_s, end_s__gt=from_s
+    )
+
+
+def _hot(node_id, from_s, to_s):
+    return Sample.objects.filter(
+        node_id=node_id, timestamp_s__gte=from_s, timestamp_s__lte=to_s
+    )
+
+
+def _cold_rows(node_id, from_s, to_s):
+    rows = []
+    for data in _blocks(node_id, from_s, to_s).values_list("data", flat=True):
+        rows.extend(row for row in decode(data) if from_s <= row[0] <= to_s)
+    return rows
+
+
+def _combine(cold, hot, timestamp):
+    """Merge the sorted cold and hot items. Of items in both tiers, keep the cold one."""
+    if not cold:
+        return list(hot)
+    cold_timestamps = {timestamp(item) for item in cold}
+    hot = [item for item in hot if timestamp(item) not in cold_timestamps]
+    return list(merge(cold, hot, key=timestamp))
+
+
+def read_rows(node_id, from_s=0, to_s=MAX_TIMESTAMP_S):
+    """Return the rows of sample values in the order of COLUMNS of the node from from_s
+    to to_s, inclusive, of both tiers, ordered by their timestamps."""
+    return _combine(
+        _cold_rows(node_id, from_s, to_s),
+        _hot(node_id, from_s, to_s).values_list(*COLUMNS),
+        lambda row: row[0],
+    )
+
+
+def read_samples(node_id, from_s=0, to_s=MAX_TIMESTAMP_S):
+    """Return the samples of the node from from_s to to_s, inclusive, of both tiers,
+    ordered by their timestamps. Samples of the cold tier are unsaved."""
+    cold = [
+        Sample(node_id=node_id, **dict(zip(COLUMNS, row)))
+        for row in _cold_rows(node_id, from_s, to_s)
+    ]
+    return _combine(cold, _hot(node_id, from_s, to_s), attrgetter("timestamp_s"))
+
+
+def summarize(node_id, from_s=0, to_s=MAX_TIMESTAMP_S):
+    """Return the sample count, the first and the last timestamp, and the latest sample
+    of the node from from_s to to_s, inclusive, of both tiers. Samples in both tiers are
+    counted once. Decode only the blocks that are not entirely within the time slice,
+    that hold the latest sample, or that overlap samples delivered late."""
+    hot = _hot(node_id, from_s, to_s)
+    summary = hot.aggregate(
+        sample_count=Count("pk"),
+        first_timestamp_s=Min("timestamp_s"),
+        last_timestamp_s=Max("timestamp_s"),
+    )
+    latest_sample = hot.last() if summary["sample_count"] else None
+    blocks = list(_blocks(node_id, from_s, to_s))
+    late_timestamps = set()
+    if blocks and summary["sample_count"]:
+        late_timestamps = set(
+            hot.filter(timestamp_s__lt=blocks[-1].end_s).values_list(
+                "timestamp_s", flat=True
+            )
+        )
+    for block in blocks:
+        rows = None
+        late = {t for t in late_timestamps if block.start_s <= t < block.end_s}
+        if from_s <= block.first_timestamp_s and block.last_timestamp_s <= to_s:
+            count = block.sample_count
+            first_s, last_s = block.first_timestamp_s, block.last_timestamp_s
+            if late:
+                rows = decode(block.data)
+                count -= len(late.intersection(row[0] for row in rows))
+        else:
+            rows = decode(block.data)
+            timestamps = [row[0] for row in rows if from_s <= row[0] <= to_s]
+            if not timestamps:
+                continue
+            count = len(timestamps) - len(late.intersection(timestamps))
+            first_s, last_s = timestamps[0], timestamps[-1]
+        summary["sample_count"] += count
+        if (
+            summary["first_timestamp_s"] is None
+            or first_s < summary["first_timestamp_s"]
+        ):
+            summary["first_timestamp_s"] = first_s
+        if summary["last_timestamp_s"] is None or last_s >= summary["last_timestamp_s"]:
+            summary["last_timestamp_s"] = last_s
+            if rows is None:
+                rows = decode(block.data)
+            row = next(row for row in rows if row[0] == last_s)
+            latest_sample = Sample(node_id=node_id, **dict(zip(COLUMNS, row)))
+    summary["latest_sample"] = latest_sample
+    return summary
+
+
+def packed_keys(keys):
+    """Return those of the given (node ID, timestamp) keys of samples in the cold tier.
+    Only closed months are packed, so keys of the present month are not looked up."""
+    horizon_s = months_ago(0)
+    keys = {key for key in keys if key[1] < horizon_s}
+    if not keys:
+        return set()
+    timestamps = [timestamp_s for _, timestamp_s in keys]
+    blocks = SampleBlock.objects.filter(
+        node_id__in={node_id for node_id, _ in keys},
+        start_s__lte=max(timestamps),
+        end_s__gt=min(timestamps),
+    ).values_list("node_id", "start_s", "end_s", "data")
+    packed = set()
+    for block_node_id, start_s, end_s, data in blocks:
+        candidates = {
+            timestamp_s
+            for node_id, timestamp_s in keys
+            if node_id == block_node_id and start_s <= timestamp_s < end_s
+        }
+        if candidates:
+            packed.update(
+                (block_node_id, row[0]) for row in decode(data) if row[0] in candidates
+            )
+    return packed
+
+
+def pack(node_id, year, month):
+    """Move the samples of the node within the UTC month from the sample table into the
+    block of the month, merged with the samples already in the block. Return the
+    number of samples moved."""
+    from_s, to_s = month_bounds(year, month)
+    with transaction.atomic():
+        block = (
+            SampleBlock.objects.select_for_update()
+            .filter(node_id=node_id, start_s=from_s)
+            .first()
+        )
+        hot = list(
+            Sample.objects.filter(
+                node_id=node_id, timestamp_s__gte=from_s, timestamp_s__lt=to_s
+            )
+            .order_by("timestamp_s")
+            .values_list("pk", *COLUMNS)
+        )
+        if not hot:
+            return 0
+        rows = [row[1:] for row in hot]
+        if block is not None:
+            cold = decode(block.data)
+            cold_timestamps = {row[0] for row in cold}
+            rows = list(
+                merge(
+                    cold,
+                    (row for row in rows if row[0] not in cold_timestamps),
+                    key=lambda row: row[0],
+                )
+            )
+        else:
+            block = SampleBlock(node_id=node_id, start_s=from_s, end_s=to_s)
+        block.sample_count = len(rows)
+        block.first_timestamp_s = rows[0][0]
+        block.last_timestamp_s = rows[-1][0]
+        block.data = encode(rows)
+        block.save()
+        # Delete the samples read only. Samples inserted meanwhile go to the next block.
+        pks = [row[0] for row in hot]
+        for offset in range(0, len(pks), 1000):
+            Sample.objects.filter(pk__in=pks[offset : offset + 1000]).delete()
+    return len(hot)
+
+
+def pack_closed_months(after_months=None):
+    """Pack the samples of all nodes within the months closed for at least the given
+    number of months, SAMPLE_COLD_STORAGE_AFTER_MONTHS by default. Return the number of
+    samples moved."""
+    if after_months is None:
+        after_months = settings.SAMPLE_COLD_STORAGE_AFTER_MONTHS
+    if not after_months:
+        return 0
+    cutoff_s = months_ago(after_months)
+    oldest = (
+        Sample.objects.filter(timestamp_s__lt=cutoff_s)
+        .values("node_id")
+        .annotate(oldest_s=Min("timestamp_s"))
+        .values_list("node_id", "oldest_s")
+    )
+    moved = 0
+    for node_id, oldest_s in oldest:
+        for year, month in months(oldest_s, cutoff_s - 1):
+            moved += pack(node_id, year, month)
+    if moved:
+        logger.info("Moved %d samples into cold storage.", moved)
+    return moved
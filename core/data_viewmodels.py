@@ -43,6 +43,32 @@ class NodeTimeseriesViewModel(NodeTimeseriesListViewModel):
         self.samples = samples
 
 
+class NodeAggregateViewModel(NodeTimeseriesListViewModel):
+    def __init__(
+        self,
+        pk,
+        node_alias: str,
+        bucket: str,
+        rollups,
+        query_timestamp_s: int = round(datetime.now().timestamp()),
+        from_timestamp_s: int = 0,
+        to_timestamp_s: int = round(datetime.now().timestamp()),
+    ):
+        super().__init__(
+            pk=pk,
+            node_alias=node_alias,
+            sample_count=sum(rollup.sample_count for rollup in rollups),
+            query_timestamp_s=query_timestamp_s,
+            from_timestamp_s=from_timestamp_s,
+            to_timestamp_s=to_timestamp_s,
+        )
+        self.bucket = bucket
+        self.rollups = rollups
+
+    class JSONAPIMeta:
+        resource_name = "node-aggregates"
+
+
 class InstallationTimeseriesListViewModel:
     def __init__(
         self,
@@ -88,6 +114,35 @@ class InstallationTimeseriesViewModel(InstallationTimeseriesListViewModel):
         )
         self.samples = samples
 
+
+class InstallationAggregateViewModel(InstallationTimeseriesListViewModel):
+    def __init__(
+        self,
+        pk,
+        node_id,
+        node_alias: str,
+        bucket: str,
+        rollups,
+        query_timestamp_s: int = round(datetime.now().timestamp()),
+        from_timestamp_s: int = 0,
+        to_timestamp_s: int = round(datetime.now().timestamp()),
+    ):
+        super().__init__(
+            pk=pk,
+            node_id=node_id,
+            node_alias=node_alias,
+            sample_count=sum(rollup.sample_count for rollup in rollups),
+            query_timestamp_s=query_timestamp_s,
+            from_timestamp_s=from_timestamp_s,
+            to_timestamp_s=to_timestamp_s,
+        )
+        self.bucket = bucket
+        self.rollups = rollups
+
+    class JSONAPIMeta:
+        resource_name = "installation-aggregates"
+
+
 class RoomAirQualityViewModel:
     def __init__(
         self,
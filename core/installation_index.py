@@ -0,0 +1,131 @@
+"""Per-process interval index of node installations.
+
+The index answers which installations of a node, or in a room, were active at a point
+in time or during a time slice, without querying the DB. It is built from all
+installations on first use. Saving or deleting an installation in the present process
+invalidates the index. Changes made by other processes are picked up once the index is
+older than INSTALLATION_INDEX_MAX_AGE_S.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import RoomNodeInstallation
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalList:
+    """Installations sorted by their start time, for lookup by bisection. A segment
+    tree over the sorted installations keeps the latest end time within each range of
+    positions, so a lookup descends only into ranges that hold an active installation.
+    A lookup that returns k installations out of n takes O((k + 1) log n), even if a
+    long-running installation overlaps many others."""
+
+    def __init__(self, installations):
+        self.installations = sorted(installations, key=lambda i: i.from_timestamp_s)
+        self.from_timestamps = [i.from_timestamp_s for i in self.installations]
+        self._size = 1
+        while self._size < len(self.installations):
+            self._size *= 2
+        # Node 1 is the root, the children of node i are 2i and 2i + 1, and the leaves
+        # from node _size on are the installations. Empty leaves never match.
+        self._max_to_timestamps = [-1] * (2 * self._size)
+        for position, installation in enumerate(self.installations):
+            self._max_to_timestamps[self._size + position] = installation.to_timestamp_s
+        for node in range(self._size - 1, 0, -1):
+            self._max_to_timestamps[node] = max(
+                self._max_to_timestamps[2 * node], self._max_to_timestamps[2 * node + 1]
+            )
+
+    def overlapping(self, from_s, to_s):
+        """Return the installations active at any time from from_s to to_s, ordered by
+        their start time."""
+        result = []
+        # Only installations up to this position start before the end of the slice.
+        last = bisect_right(self.from_timestamps, to_s) - 1
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low > last or self._max_to_timestamps[node] < from_s:
+                continue
+            if high - low == 1:
+                result.append(self.installations[low])
+                continue
+            middle = (low + high) // 2
+            # Visit the lower half first to report the installations in order.
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+        return result
+
+
+class InstallationIndex:
+    # Fields to normalize lookup keys given as strings to node UUIDs and room IDs.
+    _node_field = RoomNodeInstallation._meta.get_field("node")
+    _room_field = RoomNodeInstallation._meta.get_field("room")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_node = None
+        self._by_room = None
+        self._built_at_s = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._by_node = None
+            self._by_room = None
+
+    def active(self, node_id, timestamp_s):
+        """Return the installations of the node that were active at the given time."""
+        return self.for_node(node_id, timestamp_s, timestamp_s)
+
+    def for_node(self, node_id, from_s, to_s):
+        """Return the installations of the node that were active during the given time
+        slice, ordered by their start time."""
+        by_node, _ = self._get_lists()
+        intervals = by_node.get(self._node_field.to_python(node_id))
+        return intervals.overlapping(from_s, to_s) if intervals else []
+
+    def in_room(self, room_id, from_s, to_s):
+        """Return the installations in the room that were active during the given time
+        slice, ordered by their start time."""
+        _, by_room = self._get_lists()
+        intervals = by_room.get(self._room_field.to_python(room_id))
+        return intervals.overlapping(from_s, to_s) if intervals else []
+
+    def _get_lists(self):
+        with self._lock:
+            age_s = time.monotonic() - self._built_at_s
+            if self._by_node is None or age_s > settings.INSTALLATION_INDEX_MAX_AGE_S:
+                self._build()
+            return (self._by_node, self._by_room)
+
+    def _build(self):
+        by_node = {}
+        by_room = {}
+        for installation in RoomNodeInstallation.objects.all():
+            by_node.setdefault(installation.node_id, []).append(installation)
+            by_room.setdefault(installation.room_id, []).append(installation)
+        self._by_node = {key: IntervalList(value) for key, value in by_node.items()}
+        self._by_room = {key: IntervalList(value) for key, value in by_room.items()}
+        self._built_at_s = time.monotonic()
+        logger.debug("Indexed the installations of %d nodes.", len(self._by_node))
+
+
+installation_index = InstallationIndex()
+
+
+@receiver(post_save, sender=RoomNodeInstallation)
+@receiver(post_delete, sender=RoomNodeInstallation)
+def invalidate_installation_index(sender, **kwargs):
+    installation_index.invalidate()
+    # A lookup within the same transaction might rebuild the index from uncommitted
+    # rows. Invalidate again once the transaction is committed.
+    transaction.on_commit(installation_index.invalidate)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Downsample or drop the samples of the months due as of the retention "
+        "policies, after securing their rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the samples that would be removed, without removing them.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        reports = retention.apply(dry_run=dry_run)
+        for report in reports:
+            if report["removed_count"]:
+                self.stdout.write(
+                    f"{report['node_id']} {report['month']}: {report['action']} "
+                    f"{report['removed_count']} of {report['sample_count']} samples"
+                )
+        removed_count = sum(report["removed_count"] for report in reports)
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed_count} samples."))
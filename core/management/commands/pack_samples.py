@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import coldstorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the samples of the closed months into the compressed blocks of the cold "
+        "storage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--after-months",
+            type=int,
+            default=settings.SAMPLE_COLD_STORAGE_AFTER_MONTHS,
+            help=(
+                "Pack the months that ended at least this many months ago. Defaults to "
+                "SAMPLE_COLD_STORAGE_AFTER_MONTHS."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        moved = coldstorage.pack_closed_months(options["after_months"])
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} samples."))
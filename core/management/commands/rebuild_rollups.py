@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly and daily rollups of the samples of all nodes, or of the "
+        "given nodes, from their samples."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--node",
+            action="append",
+            dest="nodes",
+            help="ID of a node to rebuild the rollups of. May be given repeatedly.",
+        )
+        parser.add_argument(
+            "--from",
+            type=int,
+            dest="from_s",
+            help="Rebuild the rollups from the day of this timestamp on.",
+        )
+        parser.add_argument(
+            "--to",
+            type=int,
+            dest="to_s",
+            help="Rebuild the rollups up to the day of this timestamp.",
+        )
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild(options["nodes"], options["from_s"], options["to_s"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollups."))
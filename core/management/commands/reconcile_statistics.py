@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import statistics
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the sample statistics of all nodes and installations, or of the "
+        "given nodes and their installations, from their samples."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--node",
+            action="append",
+            dest="nodes",
+            help="ID of a node to reconcile the statistics of. May be given repeatedly.",
+        )
+
+    def handle(self, *args, **options):
+        corrected = statistics.reconcile(options["nodes"])
+        self.stdout.write(self.style.SUCCESS(f"Corrected {corrected} statistics."))
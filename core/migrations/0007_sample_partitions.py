@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+from core.partitions import partition_sample_table, unpartition_sample_table
+
+
+def partition_samples(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        partition_sample_table(
+            schema_editor.connection, settings.SAMPLE_PARTITION_MONTHS_AHEAD
+        )
+
+
+def unpartition_samples(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        unpartition_sample_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """Partition the sample table by month on PostgreSQL. See core.partitions."""
+
+    dependencies = [
+        ("core", "0006_address_latitude_address_longitude"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_samples, unpartition_samples),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_sample_partitions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SampleRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.CharField(
+                        choices=[("H", "hourly aggregate"), ("D", "daily aggregate")],
+                        default="H",
+                        max_length=1,
+                    ),
+                ),
+                ("start_s", models.IntegerField()),
+                ("sample_count", models.PositiveIntegerField(default=0)),
+                ("first_timestamp_s", models.PositiveIntegerField()),
+                ("last_timestamp_s", models.PositiveIntegerField()),
+                ("co2_ppm_min", models.PositiveSmallIntegerField()),
+                ("co2_ppm_max", models.PositiveSmallIntegerField()),
+                ("co2_ppm_sum", models.BigIntegerField(default=0)),
+                ("temperature_count", models.PositiveIntegerField(default=0)),
+                (
+                    "temperature_celsius_min",
+                    models.DecimalField(decimal_places=1, max_digits=3, null=True),
+                ),
+                (
+                    "temperature_celsius_max",
+                    models.DecimalField(decimal_places=1, max_digits=3, null=True),
+                ),
+                (
+                    "temperature_celsius_sum",
+                    models.DecimalField(decimal_places=1, default=0, max_digits=12),
+                ),
+                ("rel_humidity_count", models.PositiveIntegerField(default=0)),
+                (
+                    "rel_humidity_percent_min",
+                    models.PositiveSmallIntegerField(null=True),
+                ),
+                (
+                    "rel_humidity_percent_max",
+                    models.PositiveSmallIntegerField(null=True),
+                ),
+                ("rel_humidity_percent_sum", models.BigIntegerField(default=0)),
+                (
+                    "node",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="core.node",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["start_s"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="samplerollup",
+            constraint=models.UniqueConstraint(
+                fields=("node", "bucket", "start_s"), name="unique_rollups_per_node"
+            ),
+        ),
+    ]
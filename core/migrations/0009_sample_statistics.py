@@ -0,0 +1,98 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_samplerollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InstallationStatistics",
+            fields=[
+                ("sample_count", models.PositiveIntegerField(default=0)),
+                ("first_timestamp_s", models.PositiveIntegerField(null=True)),
+                ("last_timestamp_s", models.PositiveIntegerField(null=True)),
+                ("latest_co2_ppm", models.PositiveSmallIntegerField(null=True)),
+                (
+                    "latest_temperature_celsius",
+                    models.DecimalField(decimal_places=1, max_digits=3, null=True),
+                ),
+                (
+                    "latest_rel_humidity_percent",
+                    models.PositiveSmallIntegerField(null=True),
+                ),
+                (
+                    "latest_measurement_status",
+                    models.CharField(
+                        choices=[
+                            ("M", "measured value"),
+                            ("R", "replacement value"),
+                            ("E", "measurement error"),
+                        ],
+                        max_length=1,
+                        null=True,
+                    ),
+                ),
+                (
+                    "installation",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="statistics",
+                        serialize=False,
+                        to="core.roomnodeinstallation",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="NodeStatistics",
+            fields=[
+                ("sample_count", models.PositiveIntegerField(default=0)),
+                ("first_timestamp_s", models.PositiveIntegerField(null=True)),
+                ("last_timestamp_s", models.PositiveIntegerField(null=True)),
+                ("latest_co2_ppm", models.PositiveSmallIntegerField(null=True)),
+                (
+                    "latest_temperature_celsius",
+                    models.DecimalField(decimal_places=1, max_digits=3, null=True),
+                ),
+                (
+                    "latest_rel_humidity_percent",
+                    models.PositiveSmallIntegerField(null=True),
+                ),
+                (
+                    "latest_measurement_status",
+                    models.CharField(
+                        choices=[
+                            ("M", "measured value"),
+                            ("R", "replacement value"),
+                            ("E", "measurement error"),
+                        ],
+                        max_length=1,
+                        null=True,
+                    ),
+                ),
+                (
+                    "node",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="statistics",
+                        serialize=False,
+                        to="core.node",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
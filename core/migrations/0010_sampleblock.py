@@ -0,0 +1,51 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_sample_statistics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SampleBlock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_s", models.PositiveIntegerField()),
+                ("end_s", models.PositiveIntegerField()),
+                ("sample_count", models.PositiveIntegerField()),
+                ("first_timestamp_s", models.PositiveIntegerField()),
+                ("last_timestamp_s", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                (
+                    "node",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="blocks",
+                        to="core.node",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["start_s"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="sampleblock",
+            constraint=models.UniqueConstraint(
+                fields=("node", "start_s"), name="unique_blocks_per_node"
+            ),
+        ),
+    ]
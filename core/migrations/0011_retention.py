@@ -0,0 +1,60 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_sampleblock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RetentionPolicy",
+            fields=[
+                (
+                    "organization",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="retention_policy",
+                        serialize=False,
+                        to="core.organization",
+                    ),
+                ),
+                ("after_months", models.PositiveIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("downsample", "Downsample to the analysis grid"),
+                            ("drop", "Drop"),
+                        ],
+                        default="downsample",
+                        max_length=10,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "retention policies",
+            },
+        ),
+        migrations.CreateModel(
+            name="SampleRetention",
+            fields=[
+                (
+                    "node",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="retention",
+                        serialize=False,
+                        to="core.node",
+                    ),
+                ),
+                ("horizon_s", models.PositiveIntegerField()),
+            ],
+        ),
+    ]
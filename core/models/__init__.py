@@ -1,4 +1,12 @@
-from .data import Sample
+from .data import (
+    Sample,
+    SampleRollup,
+    NodeStatistics,
+    InstallationStatistics,
+    SampleBlock,
+    RetentionPolicy,
+    SampleRetention,
+)
 from .devices import Quantity, NodeModel, NodeProtocol, Node, NodeFidelity
 from .inventory import (
     Organization,
@@ -50,3 +50,182 @@ class Sample(models.Model):
 
     def timestamp_iso(self):
         return datetime.fromtimestamp(self.timestamp_s)
+
+
+class SampleRollup(models.Model):
+    """Aggregate of the samples of a node over an hour or a day. Maintained on ingest
+    and rebuilt from the samples by the rebuild_rollups command. See core.rollups."""
+
+    HOUR = "H"
+    DAY = "D"
+    BUCKETS = [
+        (HOUR, "hourly aggregate"),
+        (DAY, "daily aggregate"),
+    ]
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name="rollups")
+    bucket = models.CharField(
+        max_length=1, null=False, blank=False, choices=BUCKETS, default=HOUR
+    )
+    # The day of samples close to the epoch starts before it.
+    start_s = models.IntegerField(null=False, blank=False)
+    sample_count = models.PositiveIntegerField(default=0)
+    first_timestamp_s = models.PositiveIntegerField(null=False, blank=False)
+    last_timestamp_s = models.PositiveIntegerField(null=False, blank=False)
+    co2_ppm_min = models.PositiveSmallIntegerField(null=False, blank=False)
+    co2_ppm_max = models.PositiveSmallIntegerField(null=False, blank=False)
+    co2_ppm_sum = models.BigIntegerField(default=0)
+    # Temperature and humidity are optional. Their means are taken over the samples
+    # that have them.
+    temperature_count = models.PositiveIntegerField(default=0)
+    temperature_celsius_min = models.DecimalField(
+        null=True, decimal_places=1, max_digits=3
+    )
+    temperature_celsius_max = models.DecimalField(
+        null=True, decimal_places=1, max_digits=3
+    )
+    temperature_celsius_sum = models.DecimalField(
+        default=0, decimal_places=1, max_digits=12
+    )
+    rel_humidity_count = models.PositiveIntegerField(default=0)
+    rel_humidity_percent_min = models.PositiveSmallIntegerField(null=True)
+    rel_humidity_percent_max = models.PositiveSmallIntegerField(null=True)
+    rel_humidity_percent_sum = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["node", "bucket", "start_s"], name="unique_rollups_per_node"
+            ),
+        ]
+        ordering = ["start_s"]
+
+    @property
+    def co2_ppm_mean(self):
+        return self.co2_ppm_sum / self.sample_count
+
+    @property
+    def temperature_celsius_mean(self):
+        if not self.temperature_count:
+            return None
+        return self.temperature_celsius_sum / self.temperature_count
+
+    @property
+    def rel_humidity_percent_mean(self):
+        if not self.rel_humidity_count:
+            return None
+        return self.rel_humidity_percent_sum / self.rel_humidity_count
+
+
+class SampleStatistics(models.Model):
+    """Running statistics of the samples of a node or an installation, along with its
+    latest sample. Maintained on ingest and reconciled with the samples regularly. See
+    core.statistics."""
+
+    sample_count = models.PositiveIntegerField(default=0)
+    first_timestamp_s = models.PositiveIntegerField(null=True)
+    last_timestamp_s = models.PositiveIntegerField(null=True)
+    # The latest sample, at last_timestamp_s.
+    latest_co2_ppm = models.PositiveSmallIntegerField(null=True)
+    latest_temperature_celsius = models.DecimalField(
+        null=True, decimal_places=1, max_digits=3
+    )
+    latest_rel_humidity_percent = models.PositiveSmallIntegerField(null=True)
+    latest_measurement_status = models.CharField(
+        max_length=1, null=True, choices=Sample.MEASUREMENT_STATUS
+    )
+
+    class Meta:
+        abstract = True
+
+    @property
+    def latest_sample(self):
+        """Return the latest sample, unsaved, or None if there are no samples."""
+        if self.last_timestamp_s is None:
+            return None
+        return Sample(
+            timestamp_s=self.last_timestamp_s,
+            co2_ppm=self.latest_co2_ppm,
+            temperature_celsius=self.latest_temperature_celsius,
+            rel_humidity_percent=self.latest_rel_humidity_percent,
+            measurement_status=self.latest_measurement_status,
+        )
+
+
+class NodeStatistics(SampleStatistics):
+    node = models.OneToOneField(
+        Node, primary_key=True, on_delete=models.CASCADE, related_name="statistics"
+    )
+
+
+class InstallationStatistics(SampleStatistics):
+    installation = models.OneToOneField(
+        "core.RoomNodeInstallation",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="statistics",
+    )
+
+
+class SampleBlock(models.Model):
+    """Compressed block of the samples of a node within a closed UTC month, moved out of
+    the sample table into cold storage. See core.coldstorage."""
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name="blocks")
+    start_s = models.PositiveIntegerField(null=False, blank=False)
+    end_s = models.PositiveIntegerField(null=False, blank=False)
+    sample_count = models.PositiveIntegerField(null=False, blank=False)
+    first_timestamp_s = models.PositiveIntegerField(null=False, blank=False)
+    last_timestamp_s = models.PositiveIntegerField(null=False, blank=False)
+    data = models.BinaryField(null=False, blank=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["node", "start_s"], name="unique_blocks_per_node"
+            ),
+        ]
+        ordering = ["start_s"]
+
+
+class RetentionPolicy(models.Model):
+    """Retention of the raw samples of the nodes of an organization, overriding the
+    global policy of the settings. See core.retention."""
+
+    DOWNSAMPLE = "downsample"
+    DROP = "drop"
+    ACTIONS = [
+        (DOWNSAMPLE, "Downsample to the analysis grid"),
+        (DROP, "Drop"),
+    ]
+
+    organization = models.OneToOneField(
+        "core.Organization",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="retention_policy",
+    )
+    # Months after the end of a month until the policy applies to its samples. 0 keeps
+    # the samples forever.
+    after_months = models.PositiveIntegerField(null=False, blank=False)
+    action = models.CharField(
+        max_length=10, choices=ACTIONS, default=DOWNSAMPLE, null=False, blank=False
+    )
+
+    class Meta:
+        verbose_name_plural = "retention policies"
+
+    def __str__(self):
+        """For representation in the Admin UI."""
+        return f"{self.organization}: {self.action} after {self.after_months} months"
+
+
+class SampleRetention(models.Model):
+    """The horizon up to which the retention policy was applied to the samples of a
+    node. The rollups of the hours before the horizon are no longer rebuilt from the
+    samples."""
+
+    node = models.OneToOneField(
+        Node, primary_key=True, on_delete=models.CASCADE, related_name="retention"
+    )
+    horizon_s = models.PositiveIntegerField(null=False, blank=False)
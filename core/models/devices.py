@@ -70,7 +70,17 @@ class Node(models.Model):
         check_time_s = round(datetime.now().timestamp())
         logger.info("Run fidelity check for node %s.", self.id)
         fidelity = {"node": self, "last_check_s": check_time_s}
-        latest_sample = self.samples.latest()
+        # Look for recent samples first, which are found in the most recent partitions
+        # of the sample table only.
+        recent_samples = self.samples.filter(
+            timestamp_s__gte=check_time_s - 2 * lookback_interval_s
+        )
+        latest_sample = recent_samples.last()
+        if latest_sample is None:
+            # The latest sample might have been moved into cold storage.
+            from core.coldstorage import summarize
+
+            latest_sample = summarize(self.id)["latest_sample"]
         if latest_sample is None:
             fidelity["fidelity"] = NodeFidelity.UNKNOWN
             fidelity["last_contact_s"] = None
@@ -0,0 +1,125 @@
+"""Per-process registry of nodes for sample ingestion.
+
+The registry resolves a node by its UUID or by its EUI-64 without querying the DB,
+once the node was looked up before. It keeps up to NODE_REGISTRY_CAPACITY nodes and
+evicts the least recently used ones. Saving or deleting a node in the present process
+evicts the node. Changes made by other processes are picked up once the registry
+entry of a node is older than NODE_REGISTRY_MAX_AGE_S. Until then, the samples of a node
+deleted by another process fail to insert, see violates_node_reference.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Node
+
+
+class NodeRegistry:
+    _pk_field = Node._meta.pk
+    # The protocol determines the expected sampling cadence of a node.
+    _queryset = Node.objects.select_related("protocol")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes = OrderedDict()  # Node and time of lookup, by node ID.
+        self._ids_by_eui64 = {}
+
+    def invalidate(self, node_id=None):
+        """Evict the given node, or all nodes."""
+        with self._lock:
+            if node_id is None:
+                self._nodes.clear()
+                self._ids_by_eui64.clear()
+            else:
+                self._evict(self._pk_field.to_python(node_id))
+
+    def get(self, node_id):
+        """Return the node with the given UUID, or None if there is none. Raise a
+        ValidationError if the node_id is not a valid UUID."""
+        node_id = self._pk_field.to_python(node_id)
+        node = self._lookup(node_id)
+        if node is None:
+            node = self._load(self._queryset.filter(pk=node_id).first())
+        return node
+
+    def get_by_eui64(self, eui64):
+        """Return the node with the given EUI-64, or None if there is none."""
+        with self._lock:
+            node_id = self._ids_by_eui64.get(eui64)
+        node = self._lookup(node_id) if node_id else None
+        if node is None:
+            node = self._load(self._queryset.filter(eui64=eui64).first())
+        return node
+
+    def get_many(self, node_ids):
+        """Return a dict of the existing nodes among the given UUIDs, with a single
+        query for all nodes not registered yet."""
+        nodes = {}
+        missing = set()
+        for node_id in node_ids:
+            node = self._lookup(self._pk_field.to_python(node_id))
+            if node is None:
+                missing.add(node_id)
+            else:
+                nodes[node.id] = node
+        if missing:
+            for node in self._queryset.filter(pk__in=missing):
+                nodes[node.id] = self._load(node)
+        return nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _lookup(self, node_id):
+        with self._lock:
+            entry = self._nodes.get(node_id)
+            if entry is None:
+                return None
+            node, loaded_at_s = entry
+            if time.monotonic() - loaded_at_s > settings.NODE_REGISTRY_MAX_AGE_S:
+                self._evict(node_id)
+                return None
+            self._nodes.move_to_end(node_id)
+            return node
+
+    def _load(self, node):
+        if node is None:
+            return None
+        with self._lock:
+            self._evict(node.id)
+            self._nodes[node.id] = (node, time.monotonic())
+            self._ids_by_eui64[node.eui64] = node.id
+            while len(self._nodes) > settings.NODE_REGISTRY_CAPACITY:
+                _, (evicted, _) = self._nodes.popitem(last=False)
+                self._ids_by_eui64.pop(evicted.eui64, None)
+        return node
+
+    def _evict(self, node_id):
+        entry = self._nodes.pop(node_id, None)
+        if entry is not None:
+            self._ids_by_eui64.pop(entry[0].eui64, None)
+
+
+node_registry = NodeRegistry()
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
+def invalidate_node_registry(sender, instance, **kwargs):
+    node_registry.invalidate(instance.pk)
+    # A lookup within the same transaction might register the uncommitted node.
+    # Evict it again once the transaction is committed.
+    transaction.on_commit(lambda: node_registry.invalidate(instance.pk))
+
+
+def violates_node_reference(error):
+    """Return whether the IntegrityError of an insert of samples violates the reference
+    of a sample to its node, the only foreign key of a sample, as the node was deleted
+    by another process while still registered in the present one."""
+    return "foreign key" in str(error).lower()
@@ -0,0 +1,276 @@
+"""Monthly range partitions of the sample table on PostgreSQL.
+
+The sample table is partitioned by the range of timestamp_s, one partition per UTC
+month, such that queries of a time slice scan the partitions of the slice only, and
+old months do not weigh on the index maintenance of recent ones. A default partition
+takes samples of months without a partition of their own, like those of a bulk load
+of historical data. ensure_partitions creates the partitions of the upcoming
+SAMPLE_PARTITION_MONTHS_AHEAD months and of all months in the default partition, and
+moves the samples of these months out of the default partition. It runs after each
+migration and can be scheduled as task core.tasks.create_sample_partitions.
+
+On other DBMS, the sample table is not partitioned and all functions are no-ops.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection as default_connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+TABLE = "core_sample"
+DEFAULT_PARTITION = f"{TABLE}_default"
+UNIQUE_CONSTRAINT = "unique_sampling_times_per_node"
+
+
+def month_of(timestamp_s):
+    moment = datetime.fromtimestamp(timestamp_s, timezone.utc)
+    return (moment.year, moment.month)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def previous_month(year, month):
+    return (year - 1, 12) if month == 1 else (year, month - 1)
+
+
+def months_ago(count, now_s=None):
+    """Return the start timestamp of the UTC month count months before the present
+    one."""
+    month = month_of(int(time.time()) if now_s is None else now_s)
+    for _ in range(count):
+        month = previous_month(*month)
+    return month_bounds(*month)[0]
+
+
+def month_bounds(year, month):
+    """Return the start and end timestamps of the UTC month, end exclusive."""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(*next_month(year, month), 1, tzinfo=timezone.utc)
+    return (int(start.timestamp()), int(end.timestamp()))
+
+
+def months(from_s, to_s):
+    """Yield the months from the month of from_s up to the month of to_s."""
+    month = month_of(from_s)
+    last = month_of(to_s)
+    while month <= last:
+        yield month
+        month = next_month(*month)
+
+
+def partition_name(year, month):
+    return f"{TABLE}_p{year:04d}{month:02d}"
+
+
+def is_partitioned(connection=default_connection):
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s))",
+            [TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def partitions(connection=default_connection):
+    """Return the names of the partitions of the sample table."""
+    if not is_partitioned(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname",
+            [TABLE],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def ensure_partitions(months_ahead=None, connection=default_connection):
+    """Create the missing partitions of the present and the upcoming months, and of
+    the months of samples in the default partition. Return the names of the partitions
+    created."""
+    if not is_partitioned(connection):
+        return []
+    if months_ahead is None:
+        months_ahead = settings.SAMPLE_PARTITION_MONTHS_AHEAD
+    existing = set(partitions(connection))
+    now_s = int(time.time())
+    wanted = list(months(now_s, now_s))
+    for _ in range(months_ahead):
+        wanted.append(next_month(*wanted[-1]))
+    wanted.extend(_default_partition_months(connection))
+    created = []
+    for year, month in sorted(set(wanted)):
+        name = partition_name(year, month)
+        if name not in existing:
+            _create_partition(connection, year, month)
+            created.append(name)
+    if created:
+        logger.info("Created the sample partitions %s.", ", ".join(created))
+    return created
+
+
+def ensure_partitions_after_migrate(sender, using, **kwargs):
+    """Create the upcoming partitions on each migration, as of the post_migrate
+    signal."""
+    ensure_partitions(connection=connections[using])
+
+
+def partition_sample_table(connection, months_ahead):
+    """Convert the sample table into a table partitioned by month, with partitions
+    for all months from the oldest sample up to months_ahead from now."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(TABLE)
+    new_table = quote_name(f"{TABLE}_partitioned")
+    with connection.cursor() as cursor:
+        # Keep samples from being ingested while the table is copied.
+        cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+        cursor.execute(
+            f"CREATE TABLE {new_table} "
+            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (timestamp_s)"
+        )
+        cursor.execute(f"SELECT min(timestamp_s), max(id) FROM {table}")
+        oldest_s, max_id = cursor.fetchone()
+        now_s = int(time.time())
+        last_month = month_of(now_s)
+        for _ in range(months_ahead):
+            last_month = next_month(*last_month)
+        last_s = month_bounds(*last_month)[0]
+        for year, month in months(min(oldest_s or now_s, now_s), last_s):
+            from_s, to_s = month_bounds(year, month)
+            cursor.execute(
+                f"CREATE TABLE {quote_name(partition_name(year, month))} "
+                f"PARTITION OF {new_table} FOR VALUES FROM (%s) TO (%s)",
+                [from_s, to_s],
+            )
+        cursor.execute(
+            f"CREATE TABLE {quote_name(DEFAULT_PARTITION)} "
+            f"PARTITION OF {new_table} DEFAULT"
+        )
+        cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {table}")
+        _replace_table(cursor, connection, new_table, max_id)
+        cursor.execute(
+            f"ALTER TABLE {table} "
+            f"ADD CONSTRAINT {quote_name(TABLE + '_pkey')} PRIMARY KEY (id, timestamp_s)"
+        )
+        _add_constraints(cursor, connection)
+
+
+def unpartition_sample_table(connection):
+    """Convert the partitioned sample table back into a single table."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(TABLE)
+    new_table = quote_name(f"{TABLE}_unpartitioned")
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+        cursor.execute(
+            f"CREATE TABLE {new_table} "
+            f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(f"SELECT max(id) FROM {table}")
+        max_id = cursor.fetchone()[0]
+        cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {table}")
+        _replace_table(cursor, connection, new_table, max_id)
+        cursor.execute(
+            f"ALTER TABLE {table} "
+            f"ADD CONSTRAINT {quote_name(TABLE + '_pkey')} PRIMARY KEY (id)"
+        )
+        _add_constraints(cursor, connection)
+        cursor.execute(
+            f"CREATE INDEX {quote_name(TABLE + '_node_id_idx')} ON {table} (node_id)"
+        )
+
+
+def _replace_table(cursor, connection, new_table, max_id):
+    """Replace the sample table with the new table, with the IDs of new samples
+    continuing after those of the existing samples."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(TABLE)
+    # The sequence of the ID column is dropped along with the old table, be it a
+    # serial or an identity column. Give the new table a sequence of its own.
+    sequence = quote_name(f"{TABLE}_id_seq_new")
+    cursor.execute(
+        f"CREATE SEQUENCE {sequence} AS integer START WITH {(max_id or 0) + 1} "
+        f"OWNED BY {new_table}.id"
+    )
+    cursor.execute(
+        f"ALTER TABLE {new_table} ALTER COLUMN id SET DEFAULT nextval(%s)",
+        [f"{TABLE}_id_seq_new"],
+    )
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    cursor.execute(
+        f"ALTER SEQUENCE {sequence} RENAME TO {quote_name(TABLE + '_id_seq')}"
+    )
+
+
+def _add_constraints(cursor, connection):
+    quote_name = connection.ops.quote_name
+    table = quote_name(TABLE)
+    cursor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {quote_name(UNIQUE_CONSTRAINT)} "
+        "UNIQUE (node_id, timestamp_s)"
+    )
+    cursor.execute(
+        f"ALTER TABLE {table} "
+        f"ADD CONSTRAINT {quote_name(TABLE + '_node_id_fk_core_node_id')} "
+        f"FOREIGN KEY (node_id) REFERENCES {quote_name('core_node')} (id) "
+        "DEFERRABLE INITIALLY DEFERRED"
+    )
+
+
+def _default_partition_months(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT "
+            "date_part('year', to_timestamp(timestamp_s) AT TIME ZONE 'UTC'), "
+            "date_part('month', to_timestamp(timestamp_s) AT TIME ZONE 'UTC') "
+            f"FROM {connection.ops.quote_name(DEFAULT_PARTITION)}"
+        )
+        return [(int(year), int(month)) for year, month in cursor.fetchall()]
+
+
+def _create_partition(connection, year, month):
+    """Create the partition of the month. Move the samples of the month from the
+    default partition into it, which must not hold them while the partition is
+    created."""
+    quote_name = connection.ops.quote_name
+    table = quote_name(TABLE)
+    default_partition = quote_name(DEFAULT_PARTITION)
+    from_s, to_s = month_bounds(year, month)
+    in_month = "timestamp_s >= %s AND timestamp_s < %s"
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default_partition} WHERE {in_month})",
+            [from_s, to_s],
+        )
+        has_samples = cursor.fetchone()[0]
+        if has_samples:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default_partition}")
+        cursor.execute(
+            f"CREATE TABLE {quote_name(partition_name(year, month))} "
+            f"PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            [from_s, to_s],
+        )
+        if has_samples:
+            cursor.execute(
+                f"INSERT INTO {table} SELECT * FROM {default_partition} "
+                f"WHERE {in_month}",
+                [from_s, to_s],
+            )
+            cursor.execute(
+                f"DELETE FROM {default_partition} WHERE {in_month}", [from_s, to_s]
+            )
+            cursor.execute(
+                f"ALTER TABLE {table} ATTACH PARTITION {default_partition} DEFAULT"
+            )
@@ -0,0 +1,202 @@
+"""Retention policies of the raw samples.
+
+The raw samples accumulate without bound, while the air quality analysis of old months
+needs the samples on its grid of TARGET_RATE_S only. A retention policy applies to the
+samples of each node within a UTC month that ended at least after_months months ago:
+
+- downsample keeps the first sample within each interval of TARGET_RATE_S, aligned to
+  the epoch like the grid of the analysis,
+- drop deletes all samples.
+
+The policy of a node is the RetentionPolicy of its owner, or else the global policy of
+the settings SAMPLE_RETENTION_AFTER_MONTHS and SAMPLE_RETENTION_ACTION. A policy with
+after_months 0 keeps the samples forever.
+
+Before the samples of a month are thinned out, the rollups of its days are rebuilt from
+the complete samples, in the same transaction. The retention horizon of each node, the
+end of the latest month the policy was applied to, protects the rollups of the hours
+before it from later rebuilds, see core.rollups.rebuild. The day across the horizon is
+rebuilt from the rollups of its hours before it and the samples after it. apply
+processes one month of one node per transaction, in both tiers of core.coldstorage, and
+deletes the samples in chunks. Schedule it as task core.tasks.apply_retention_policies.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, Exists, F, Min, OuterRef
+
+from core import coldstorage, rollups, statistics
+from core.data_analysis import TARGET_RATE_S
+from core.models import Node, RetentionPolicy, Sample, SampleBlock, SampleRetention
+from core.partitions import month_bounds, month_of, months, months_ago
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 1000
+
+
+def global_policy():
+    """Return the months after which and the action by which the global policy applies
+    to the samples of a month."""
+    action = settings.SAMPLE_RETENTION_ACTION
+    if action not in dict(RetentionPolicy.ACTIONS):
+        raise ImproperlyConfigured(f"Unknown SAMPLE_RETENTION_ACTION {action!r}.")
+    return (settings.SAMPLE_RETENTION_AFTER_MONTHS, action)
+
+
+def downsample(rows):
+    """Return the first of the rows sorted by their timestamps, the first item of each
+    row, within each interval of TARGET_RATE_S."""
+    retained = []
+    interval = None
+    for row in rows:
+        if row[0] // TARGET_RATE_S != interval:
+            interval = row[0] // TARGET_RATE_S
+            retained.append(row)
+    return retained
+
+
+def _retained(rows, action):
+    return downsample(rows) if action == RetentionPolicy.DOWNSAMPLE else []
+
+
+def _report(node_id, year, month, action, sample_count, removed_count):
+    return {
+        "node_id": node_id,
+        "month": f"{year:04d}-{month:02d}",
+        "action": action,
+        "sample_count": sample_count,
+        "removed_count": removed_count,
+    }
+
+
+def apply_month(node_id, year, month, action, dry_run=False):
+    """Apply the action to the samples of the node within the UTC month, after securing
+    the rollups of its days. Return the report of the month."""
+    from_s, to_s = month_bounds(year, month)
+    if dry_run:
+        rows = coldstorage.read_rows(node_id, from_s, to_s - 1)
+        removed_count = len(rows) - len(_retained(rows, action))
+        return _report(node_id, year, month, action, len(rows), removed_count)
+    with transaction.atomic():
+        rollups.rebuild([node_id], from_s, to_s - 1)
+        if SampleBlock.objects.filter(node_id=node_id, start_s=from_s).exists():
+            # Merge the samples of the month in the sample table into the block first.
+            coldstorage.pack(node_id, year, month)
+            block = SampleBlock.objects.select_for_update().get(
+                node_id=node_id, start_s=from_s
+            )
+            rows = coldstorage.decode(block.data)
+            retained = _retained(rows, action)
+            if not retained:
+                block.delete()
+            elif len(retained) < len(rows):
+                block.sample_count = len(retained)
+                block.first_timestamp_s = retained[0][0]
+                block.last_timestamp_s = retained[-1][0]
+                block.data = coldstorage.encode(retained)
+                block.save()
+            sample_count, removed_count = len(rows), len(rows) - len(retained)
+        else:
+            rows = list(
+                Sample.objects.filter(
+                    node_id=node_id, timestamp_s__gte=from_s, timestamp_s__lt=to_s
+                )
+                .order_by("timestamp_s")
+                .values_list("timestamp_s", "pk")
+            )
+            retained = {row[1] for row in _retained(rows, action)}
+            pks = [row[1] for row in rows if row[1] not in retained]
+            for offset in range(0, len(pks), DELETE_CHUNK_SIZE):
+                Sample.objects.filter(
+                    pk__in=pks[offset : offset + DELETE_CHUNK_SIZE]
+                ).delete()
+            sample_count, removed_count = len(rows), len(pks)
+        retention, _ = SampleRetention.objects.select_for_update().get_or_create(
+            node_id=node_id, defaults={"horizon_s": to_s}
+        )
+        if retention.horizon_s < to_s:
+            retention.horizon_s = to_s
+            retention.save()
+    return _report(node_id, year, month, action, sample_count, removed_count)
+
+
+def late_months(node_id, horizon_s, action):
+    """Return the months before the retention horizon of the node with samples delivered
+    late. With the drop action, these are the months with any samples in the sample
+    table. Downsampled months keep a sample per interval of TARGET_RATE_S there, unless
+    in cold storage, such that only several samples within an interval, or samples of a
+    month with a block, were delivered late."""
+    samples = Sample.objects.filter(node_id=node_id, timestamp_s__lt=horizon_s)
+    if action == RetentionPolicy.DROP:
+        timestamps = list(samples.values_list("timestamp_s", flat=True))
+    else:
+        blocks = SampleBlock.objects.filter(
+            node_id=node_id,
+            start_s__lte=OuterRef("timestamp_s"),
+            end_s__gt=OuterRef("timestamp_s"),
+        )
+        timestamps = list(
+            samples.filter(Exists(blocks)).values_list("timestamp_s", flat=True)
+        )
+        intervals = (
+            samples.order_by()
+            .annotate(interval=F("timestamp_s") / TARGET_RATE_S)
+            .values("interval")
+            .annotate(count=Count("pk"))
+            .filter(count__gt=1)
+            .values_list("interval", flat=True)
+        )
+        timestamps += [interval * TARGET_RATE_S for interval in intervals]
+    return {month_of(timestamp_s) for timestamp_s in timestamps}
+
+
+def apply_node(node_id, cutoff_s, action, dry_run=False):
+    """Apply the action to the samples of the node within the months before cutoff_s:
+    those from the retention horizon of the node on, and those before it with samples
+    delivered late, see late_months. Return the reports of the months."""
+    retention = SampleRetention.objects.filter(node_id=node_id).first()
+    horizon_s = retention.horizon_s if retention else 0
+    hot = Sample.objects.filter(node_id=node_id, timestamp_s__lt=cutoff_s)
+    blocks = SampleBlock.objects.filter(
+        node_id=node_id, start_s__gte=horizon_s, start_s__lt=cutoff_s
+    )
+    oldest = [
+        hot.aggregate(oldest_s=Min("timestamp_s"))["oldest_s"],
+        blocks.aggregate(oldest_s=Min("start_s"))["oldest_s"],
+    ]
+    oldest = [oldest_s for oldest_s in oldest if oldest_s is not None]
+    if not oldest:
+        return []
+    late = late_months(node_id, horizon_s, action) if horizon_s else set()
+    reports = []
+    for year, month in months(min(oldest), cutoff_s - 1):
+        if month_bounds(year, month)[1] <= horizon_s and (year, month) not in late:
+            continue
+        reports.append(apply_month(node_id, year, month, action, dry_run))
+    if not dry_run and settings.SAMPLE_STATISTICS:
+        if any(report["removed_count"] for report in reports):
+            statistics.reconcile([node_id])
+    return reports
+
+
+def apply(dry_run=False):
+    """Apply the retention policies to the samples of all nodes. Return the reports of
+    the months processed, of the samples that would be removed with dry_run."""
+    default_policy = global_policy()
+    policies = {
+        policy.organization_id: (policy.after_months, policy.action)
+        for policy in RetentionPolicy.objects.all()
+    }
+    reports = []
+    for node_id, owner_id in Node.objects.values_list("pk", "owner_id").iterator():
+        after_months, action = policies.get(owner_id, default_policy)
+        if after_months:
+            reports += apply_node(node_id, months_ago(after_months), action, dry_run)
+    removed_count = sum(report["removed_count"] for report in reports)
+    if removed_count and not dry_run:
+        logger.info("Removed %d samples by the retention policies.", removed_count)
+    return reports
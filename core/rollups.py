@@ -0,0 +1,238 @@
+"""Hourly and daily rollups of the samples of each node.
+
+A rollup holds the count, the minimum, the maximum, and the sum of each quantity of the
+samples of a node within an hour or a day, along with the first and last timestamp, such
+that charts of long time slices read a row per hour or day instead of every sample.
+Hours are UTC hours, days are days in ROLLUP_TIME_ZONE, as are the days of the air
+quality analysis.
+
+With SAMPLE_ROLLUPS enabled, the ingest paths add the samples they insert to the
+rollups, in the transaction of the insert, with a single upsert that merges the
+aggregates of the samples into the stored rollups. See core.upserts.
+rebuild recomputes the rollups from the samples of both tiers of core.coldstorage,
+after bulk loads and for data ingested while rollups were disabled. See the management
+command rebuild_rollups.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+
+from core import upserts
+from core.coldstorage import MAX_TIMESTAMP_S, read_rows
+from core.models import Node, SampleRetention, SampleRollup
+
+# Time zone of the daily rollups, the time zone of the air quality analysis.
+ROLLUP_TIME_ZONE = ZoneInfo("Europe/Berlin")
+HOUR_S = 3600
+BUCKET_NAMES = {"hour": SampleRollup.HOUR, "day": SampleRollup.DAY}
+SAMPLE_FIELDS = [
+    "node_id",
+    "timestamp_s",
+    "co2_ppm",
+    "temperature_celsius",
+    "rel_humidity_percent",
+]
+_MERGES = {
+    "sample_count": upserts.ADD,
+    "first_timestamp_s": upserts.LEAST,
+    "last_timestamp_s": upserts.GREATEST,
+    "co2_ppm_min": upserts.LEAST,
+    "co2_ppm_max": upserts.GREATEST,
+    "co2_ppm_sum": upserts.ADD,
+    "temperature_count": upserts.ADD,
+    "temperature_celsius_min": upserts.LEAST,
+    "temperature_celsius_max": upserts.GREATEST,
+    "temperature_celsius_sum": upserts.ADD,
+    "rel_humidity_count": upserts.ADD,
+    "rel_humidity_percent_min": upserts.LEAST,
+    "rel_humidity_percent_max": upserts.GREATEST,
+    "rel_humidity_percent_sum": upserts.ADD,
+}
+_COMBINE = {upserts.ADD: sum, upserts.LEAST: min, upserts.GREATEST: max}
+
+
+def bucket_start(bucket, timestamp_s):
+    """Return the start of the hour or the day of the timestamp."""
+    if bucket == SampleRollup.HOUR:
+        return timestamp_s - timestamp_s % HOUR_S
+    day = datetime.fromtimestamp(timestamp_s, ROLLUP_TIME_ZONE).date()
+    return int(
+        datetime(day.year, day.month, day.day, tzinfo=ROLLUP_TIME_ZONE).timestamp()
+    )
+
+
+def day_end(timestamp_s):
+    """Return the end of the day of the timestamp, exclusive."""
+    day = datetime.fromtimestamp(timestamp_s, ROLLUP_TIME_ZONE).date() + timedelta(
+        days=1
+    )
+    return int(
+        datetime(day.year, day.month, day.day, tzinfo=ROLLUP_TIME_ZONE).timestamp()
+    )
+
+
+def aggregate(rows):
+    """Aggregate the rows of sample values in the order of SAMPLE_FIELDS into rollups,
+    by (node ID, bucket, start)."""
+    rollups = {}
+    for node_id, timestamp_s, co2_ppm, temperature, humidity in rows:
+        for bucket in (SampleRollup.HOUR, SampleRollup.DAY):
+            key = (node_id, bucket, bucket_start(bucket, timestamp_s))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = SampleRollup(
+                    node_id=node_id,
+                    bucket=bucket,
+                    start_s=key[2],
+                    first_timestamp_s=timestamp_s,
+                    last_timestamp_s=timestamp_s,
+                    co2_ppm_min=co2_ppm,
+                    co2_ppm_max=co2_ppm,
+                    temperature_celsius_sum=Decimal(0),
+                )
+            _add(rollup, timestamp_s, co2_ppm, temperature, humidity)
+    return rollups
+
+
+def _add(rollup, timestamp_s, co2_ppm, temperature, humidity):
+    rollup.sample_count += 1
+    rollup.first_timestamp_s = min(rollup.first_timestamp_s, timestamp_s)
+    rollup.last_timestamp_s = max(rollup.last_timestamp_s, timestamp_s)
+    rollup.co2_ppm_min = min(rollup.co2_ppm_min, co2_ppm)
+    rollup.co2_ppm_max = max(rollup.co2_ppm_max, co2_ppm)
+    rollup.co2_ppm_sum += co2_ppm
+    if temperature is not None:
+        temperature = Decimal(str(temperature))
+        rollup.temperature_count += 1
+        rollup.temperature_celsius_sum += temperature
+        rollup.temperature_celsius_min = _min(
+            rollup.temperature_celsius_min, temperature
+        )
+        rollup.temperature_celsius_max = _max(
+            rollup.temperature_celsius_max, temperature
+        )
+    if humidity is not None:
+        rollup.rel_humidity_count += 1
+        rollup.rel_humidity_percent_sum += humidity
+        rollup.rel_humidity_percent_min = _min(
+            rollup.rel_humidity_percent_min, humidity
+        )
+        rollup.rel_humidity_percent_max = _max(
+            rollup.rel_humidity_percent_max, humidity
+        )
+
+
+def _min(value, other):
+    return other if value is None else min(value, other)
+
+
+def _max(value, other):
+    return other if value is None else max(value, other)
+
+
+def add_samples(samples):
+    """Add the newly inserted samples to the rollups of their hours and days. Call
+    within the transaction of the insert."""
+    add_rows(
+        [
+            (
+                sample.node_id,
+                sample.timestamp_s,
+                sample.co2_ppm,
+                sample.temperature_celsius,
+                sample.rel_humidity_percent,
+            )
+            for sample in samples
+        ]
+    )
+
+
+def add_rows(rows):
+    """Add the newly inserted rows of sample values in the order of SAMPLE_FIELDS to
+    the rollups of their hours and days."""
+    upserts.merge(
+        SampleRollup,
+        list(aggregate(rows).values()),
+        ["node", "bucket", "start_s"],
+        _MERGES,
+    )
+
+
+def merge(rollup, other):
+    """Merge the aggregates of the other rollup into the rollup."""
+    for field, merge in _MERGES.items():
+        values = [
+            value
+            for value in (getattr(rollup, field), getattr(other, field))
+            if value is not None
+        ]
+        setattr(rollup, field, _COMBINE[merge](values) if values else None)
+
+
+def rebuild(node_ids=None, from_s=None, to_s=None):
+    """Recompute the rollups of the given nodes, or of all nodes, from their samples.
+    Limit the rollups to the days from the day of from_s to the day of to_s, if given,
+    and to the hours from the retention horizon of each node on, see core.retention.
+    Return the number of rollups written."""
+    if node_ids is None:
+        node_ids = Node.objects.values_list("pk", flat=True)
+    horizons = {
+        str(node_id): horizon_s
+        for node_id, horizon_s in SampleRetention.objects.values_list(
+            "node_id", "horizon_s"
+        )
+    }
+    count = 0
+    for node_id in list(node_ids):
+        # Rebuild whole days, such that the daily rollups cover all their hours.
+        start_s, end_s = 0, MAX_TIMESTAMP_S + 1
+        if from_s is not None:
+            start_s = bucket_start(SampleRollup.DAY, from_s)
+        if to_s is not None:
+            end_s = day_end(to_s)
+        hours_start_s = start_s
+        horizon_s = horizons.get(str(node_id))
+        if horizon_s is not None and horizon_s > start_s:
+            # The samples before the horizon, the end of a UTC month and thus of an
+            # hour, are downsampled or dropped. Keep the rollups of the hours before
+            # it, and merge those of the day across it into the rebuilt day.
+            start_s, hours_start_s = (
+                bucket_start(SampleRollup.DAY, horizon_s),
+                horizon_s,
+            )
+        if hours_start_s >= end_s:
+            continue
+        rollups = SampleRollup.objects.filter(node_id=node_id, start_s__lt=end_s)
+        with transaction.atomic():
+            rollups.filter(
+                bucket=SampleRollup.HOUR, start_s__gte=hours_start_s
+            ).delete()
+            rollups.filter(bucket=SampleRollup.DAY, start_s__gte=start_s).delete()
+            # Aggregate the samples of both tiers of core.coldstorage.
+            aggregated = aggregate(
+                (node_id, *row[:4])
+                for row in read_rows(node_id, hours_start_s, end_s - 1)
+            )
+            kept_hours = rollups.filter(
+                bucket=SampleRollup.HOUR,
+                start_s__gte=start_s,
+                start_s__lt=hours_start_s,
+            )
+            key = (node_id, SampleRollup.DAY, start_s)
+            for hour in kept_hours if start_s < hours_start_s else []:
+                day = aggregated.get(key)
+                if day is None:
+                    aggregated[key] = SampleRollup(
+                        node_id=node_id,
+                        bucket=SampleRollup.DAY,
+                        start_s=start_s,
+                        **{field: getattr(hour, field) for field in _MERGES},
+                    )
+                else:
+                    merge(day, hour)
+            SampleRollup.objects.bulk_create(aggregated.values(), batch_size=1000)
+        count += len(aggregated)
+    return count
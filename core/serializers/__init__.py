@@ -1,9 +1,12 @@
 from .data import (
     SimpleSampleSerializer,
+    SampleRollupSerializer,
     NodeTimeseriesListSerializer,
     NodeTimeseriesSerializer,
+    NodeAggregateSerializer,
     InstallationTimeseriesListSerializer,
     InstallationTimeSeriesSerializer,
+    InstallationAggregateSerializer,
     RoomAirQualitySerializer
 )
 from .devices import (
@@ -3,11 +3,13 @@ from rest_framework_json_api import serializers
 from core.data_viewmodels import (
     NodeTimeseriesListViewModel,
     NodeTimeseriesViewModel,
+    NodeAggregateViewModel,
     InstallationTimeseriesListViewModel,
     InstallationTimeseriesViewModel,
+    InstallationAggregateViewModel,
     RoomAirQualityViewModel,
 )
-from core.models import Sample
+from core.models import Sample, SampleRollup
 
 
 class SimpleSampleSerializer(serializers.ModelSerializer):
@@ -16,6 +18,16 @@ class SimpleSampleSerializer(serializers.ModelSerializer):
         exclude = ["node"]
 
 
+class SampleRollupSerializer(serializers.ModelSerializer):
+    co2_ppm_mean = serializers.FloatField(read_only=True)
+    temperature_celsius_mean = serializers.FloatField(read_only=True)
+    rel_humidity_percent_mean = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = SampleRollup
+        exclude = ["id", "node", "bucket"]
+
+
 class NodeTimeseriesListSerializer(serializers.Serializer):
     node_alias = serializers.CharField(max_length=100)
     query_timestamp_s = serializers.IntegerField()
@@ -44,6 +56,18 @@ class NodeTimeseriesSerializer(NodeTimeseriesListSerializer):
         resource_name = "Node-Timeseries"
 
 
+class NodeAggregateSerializer(NodeTimeseriesListSerializer):
+    bucket = serializers.CharField()
+    rollups = serializers.ListField(child=SampleRollupSerializer(), read_only=True)
+
+    class Meta:
+        model = NodeAggregateViewModel
+        fields = ["url"]
+
+    class JSONAPIMeta:
+        resource_name = "Node-Aggregates"
+
+
 class InstallationTimeseriesListSerializer(serializers.Serializer):
     node_id = serializers.CharField()
     node_alias = serializers.CharField(max_length=100)
@@ -75,6 +99,18 @@ class InstallationTimeSeriesSerializer(InstallationTimeseriesListSerializer):
         resource_name = "Installation-Timeseries"
 
 
+class InstallationAggregateSerializer(InstallationTimeseriesListSerializer):
+    bucket = serializers.CharField()
+    rollups = serializers.ListField(child=SampleRollupSerializer(), read_only=True)
+
+    class Meta:
+        model = InstallationAggregateViewModel
+        fields = ["url"]
+
+    class JSONAPIMeta:
+        resource_name = "Installation-Aggregates"
+
+
 class RoomAirQualitySerializer(serializers.Serializer):
     year_month = serializers.CharField(read_only=True)
     query_timestamp_s = serializers.IntegerField(read_only=True)
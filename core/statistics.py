@@ -0,0 +1,245 @@
+"""Running statistics of the samples of each node and installation.
+
+The lists of nodes and installations show the sample count and the latest sample of
+each entry. Instead of counting the samples of every entry on every request, the
+statistics keep the count, the first and last timestamp, and the latest sample of each
+node and installation.
+
+With SAMPLE_STATISTICS enabled, the ingest paths add the samples they insert to the
+statistics of their nodes, and of the installations active at the time of each sample
+as of the installation index, in the transaction of the insert. The statistics of a
+node are upserted, see core.upserts. Those of an installation are updated only, as they
+are created along with the installation. The statistics may drift from the samples:
+the installation index of a process lags behind installations edited in other
+processes, and samples may be deleted. reconcile recomputes the statistics from the
+samples of both tiers of core.coldstorage. Schedule it as task
+core.tasks.reconcile_sample_statistics.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core import upserts
+from core.coldstorage import MAX_TIMESTAMP_S, summarize
+from core.installation_index import installation_index
+from core.models import (
+    InstallationStatistics,
+    Node,
+    NodeStatistics,
+    RoomNodeInstallation,
+)
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FIELDS = [
+    "node_id",
+    "timestamp_s",
+    "co2_ppm",
+    "temperature_celsius",
+    "rel_humidity_percent",
+    "measurement_status",
+]
+_LATEST_FIELDS = {
+    "latest_co2_ppm": "co2_ppm",
+    "latest_temperature_celsius": "temperature_celsius",
+    "latest_rel_humidity_percent": "rel_humidity_percent",
+    "latest_measurement_status": "measurement_status",
+}
+_MERGES = {
+    "sample_count": upserts.ADD,
+    "first_timestamp_s": upserts.LEAST,
+    "last_timestamp_s": upserts.GREATEST,
+    **{name: upserts.latest("last_timestamp_s") for name in _LATEST_FIELDS},
+}
+
+
+def _add(statistics, row):
+    values = dict(zip(SAMPLE_FIELDS, row))
+    timestamp_s = values["timestamp_s"]
+    statistics.sample_count += 1
+    if (
+        statistics.first_timestamp_s is None
+        or timestamp_s < statistics.first_timestamp_s
+    ):
+        statistics.first_timestamp_s = timestamp_s
+    if (
+        statistics.last_timestamp_s is None
+        or timestamp_s >= statistics.last_timestamp_s
+    ):
+        statistics.last_timestamp_s = timestamp_s
+        for name, field in _LATEST_FIELDS.items():
+            setattr(statistics, name, values[field])
+
+
+def add_samples(samples):
+    """Add the newly inserted samples to the statistics of their nodes and
+    installations. Call within the transaction of the insert."""
+    add_rows([[getattr(sample, name) for name in SAMPLE_FIELDS] for sample in samples])
+
+
+def add_rows(rows):
+    """Add the newly inserted rows of sample values in the order of SAMPLE_FIELDS to the
+    statistics of their nodes and installations."""
+    by_node = {}
+    by_installation = {}
+    for row in rows:
+        node_id, timestamp_s = row[0], row[1]
+        statistics = by_node.get(node_id)
+        if statistics is None:
+            statistics = by_node[node_id] = NodeStatistics(node_id=node_id)
+        _add(statistics, row)
+        for installation in installation_index.active(node_id, timestamp_s):
+            statistics = by_installation.get(installation.pk)
+            if statistics is None:
+                statistics = by_installation[installation.pk] = InstallationStatistics(
+                    installation_id=installation.pk
+                )
+            _add(statistics, row)
+    upserts.merge(NodeStatistics, list(by_node.values()), ["node"], _MERGES)
+    # Update in the order of the IDs, such that concurrent updates do not deadlock.
+    for installation_id in sorted(by_installation):
+        _update(by_installation[installation_id])
+
+
+def _update(statistics):
+    """Merge the statistics into the stored ones of the installation, if any. An
+    installation deleted meanwhile has none."""
+    first_s = statistics.first_timestamp_s
+    last_s = statistics.last_timestamp_s
+    updates = {
+        "sample_count": F("sample_count") + statistics.sample_count,
+        "first_timestamp_s": Case(
+            When(first_timestamp_s__lte=first_s, then=F("first_timestamp_s")),
+            default=Value(first_s),
+        ),
+        "last_timestamp_s": Case(
+            When(last_timestamp_s__gt=last_s, then=F("last_timestamp_s")),
+            default=Value(last_s),
+        ),
+    }
+    for name in _LATEST_FIELDS:
+        updates[name] = Case(
+            When(last_timestamp_s__gt=last_s, then=F(name)),
+            default=Value(
+                getattr(statistics, name),
+                output_field=InstallationStatistics._meta.get_field(name),
+            ),
+        )
+    InstallationStatistics.objects.filter(pk=statistics.installation_id).update(
+        **updates
+    )
+
+
+def _recompute(statistics, node_id, from_s=0, to_s=MAX_TIMESTAMP_S):
+    """Recompute the statistics from the samples of the node from from_s to to_s, of
+    both tiers of core.coldstorage. Return True if they changed."""
+    summary = summarize(node_id, from_s, to_s)
+    latest = summary.pop("latest_sample")
+    for name, field in _LATEST_FIELDS.items():
+        summary[name] = getattr(latest, field) if latest else None
+    changed = [
+        name for name, value in summary.items() if getattr(statistics, name) != value
+    ]
+    for name in changed:
+        setattr(statistics, name, summary[name])
+    statistics.save()
+    return bool(changed)
+
+
+def reconcile_node(node_id):
+    """Recompute the statistics of the node. Return True if they changed."""
+    with transaction.atomic():
+        # Lock the statistics before counting the samples. Inserts committed after the
+        # count wait for the lock, and then add their samples to the count.
+        statistics, _ = NodeStatistics.objects.select_for_update().get_or_create(
+            node_id=node_id
+        )
+        return _recompute(statistics, node_id)
+
+
+def reconcile_installation(installation):
+    """Recompute the statistics of the installation. Return True if they changed."""
+    with transaction.atomic():
+        queryset = InstallationStatistics.objects.select_for_update()
+        statistics, _ = queryset.get_or_create(installation_id=installation.pk)
+        return _recompute(
+            statistics,
+            installation.node_id,
+            installation.from_timestamp_s,
+            installation.to_timestamp_s,
+        )
+
+
+def reconcile(node_ids=None):
+    """Recompute the statistics of the given nodes and of their installations, or of
+    all nodes and installations. Return the number of statistics corrected."""
+    nodes = Node.objects.all()
+    installations = RoomNodeInstallation.objects.select_related("node")
+    if node_ids is not None:
+        nodes = nodes.filter(pk__in=node_ids)
+        installations = installations.filter(node__in=node_ids)
+    corrected = 0
+    for node_id in nodes.values_list("pk", flat=True).iterator():
+        corrected += reconcile_node(node_id)
+    for installation in installations.iterator():
+        corrected += reconcile_installation(installation)
+    if corrected:
+        logger.info("Corrected %d sample statistics.", corrected)
+    return corrected
+
+
+def attach_node_statistics(nodes):
+    """Set the sample count and the latest sample of each of the given nodes. Without
+    SAMPLE_STATISTICS, summarize the samples of both tiers of core.coldstorage."""
+    if settings.SAMPLE_STATISTICS:
+        statistics = NodeStatistics.objects.in_bulk([node.pk for node in nodes])
+        for node in nodes:
+            _attach(node, statistics.get(node.pk))
+        return
+    for node in nodes:
+        _attach_summary(node, summarize(node.pk))
+
+
+def attach_installation_statistics(installations):
+    """Set the sample count and the latest sample of each of the given
+    installations. Without SAMPLE_STATISTICS, summarize the samples of both tiers of
+    core.coldstorage."""
+    if settings.SAMPLE_STATISTICS:
+        statistics = InstallationStatistics.objects.in_bulk(
+            [installation.pk for installation in installations]
+        )
+        for installation in installations:
+            _attach(installation, statistics.get(installation.pk))
+        return
+    for installation in installations:
+        summary = summarize(
+            installation.node_id,
+            installation.from_timestamp_s,
+            installation.to_timestamp_s,
+        )
+        _attach_summary(installation, summary)
+
+
+def _attach_summary(instance, summary):
+    instance.sample_count = summary["sample_count"]
+    if summary["latest_sample"]:
+        instance.latest_sample = summary["latest_sample"]
+
+
+def _attach(instance, statistics):
+    instance.sample_count = statistics.sample_count if statistics else 0
+    latest_sample = statistics.latest_sample if statistics else None
+    if latest_sample:
+        instance.latest_sample = latest_sample
+
+
+@receiver(post_save, sender=RoomNodeInstallation)
+def reconcile_saved_installation(sender, instance, **kwargs):
+    """Recompute the statistics of an installation created or moved in time."""
+    if settings.SAMPLE_STATISTICS:
+        transaction.on_commit(lambda: reconcile_installation(instance))
@@ -1,6 +1,10 @@
 from datetime import timedelta
 
+from core.coldstorage import pack_closed_months
 from core.models import Node
+from core.partitions import ensure_partitions
+from core.retention import apply
+from core.statistics import reconcile
 
 
 def check_node_fidelity(lookback_interval: timedelta = timedelta(hours=2)):
@@ -8,3 +12,19 @@ def check_node_fidelity(lookback_interval: timedelta = timedelta(hours=2)):
     nodes = Node.objects.all()
     for node in nodes:
         node.check_fidelity(lookback_interval_s)
+
+
+def create_sample_partitions():
+    ensure_partitions()
+
+
+def reconcile_sample_statistics():
+    reconcile()
+
+
+def pack_cold_samples():
+    pack_closed_months()
+
+
+def apply_retention_policies():
+    apply()
@@ -0,0 +1,248 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core import coldstorage, rollups, statistics
+from core.models import (
+    NodeFidelity,
+    NodeStatistics,
+    Sample,
+    SampleBlock,
+    SampleRollup,
+)
+from ingest.persistence import store_samples
+from core.partitions import month_bounds
+from .utils import TokenAuthMixin, setup_basic_test_data
+
+# 2021-03-01T00:00:00 UTC.
+MARCH_1_S, APRIL_1_S = month_bounds(2021, 3)
+
+
+class EncodingTestCase(TestCase):
+    def test_round_trip(self):
+        rows = [
+            (MARCH_1_S, 400, Decimal("20.5"), 40, Sample.MEASUREMENT),
+            (MARCH_1_S + 600, 1200, None, 55, Sample.REPLACEMENT),
+            (MARCH_1_S + 1210, 0, Decimal("-12.3"), None, Sample.ERROR),
+            (MARCH_1_S + 1800, 10000, Decimal("45.0"), 100, Sample.MEASUREMENT),
+        ]
+        self.assertEqual(coldstorage.decode(coldstorage.encode(rows)), rows)
+
+    def test_compression(self):
+        rows = [
+            (
+                MARCH_1_S + i * 600,
+                400 + i % 200,
+                Decimal(200 + i % 30) / 10,
+                40,
+                Sample.MEASUREMENT,
+            )
+            for i in range(31 * 24 * 6)
+        ]
+        data = coldstorage.encode(rows)
+        # Less than a byte per sample.
+        self.assertLess(len(data), len(rows))
+        self.assertEqual(coldstorage.decode(data), rows)
+
+    def test_corrupt_data(self):
+        data = coldstorage.encode([(MARCH_1_S, 400, None, None, Sample.MEASUREMENT)])
+        with self.assertRaises(coldstorage.DecodeError):
+            coldstorage.decode(data[:-2])
+        with self.assertRaises(ValueError):
+            coldstorage.encode([])
+
+
+class ColdStorageTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = setup_basic_test_data()["node1"]
+
+    def create_samples(self, *timestamps, co2_ppm=400):
+        Sample.objects.bulk_create(
+            Sample(
+                node=self.node,
+                timestamp_s=timestamp_s,
+                co2_ppm=co2_ppm,
+                temperature_celsius=Decimal("21.5"),
+                rel_humidity_percent=45,
+            )
+            for timestamp_s in timestamps
+        )
+
+    def test_pack(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, APRIL_1_S)
+        self.assertEqual(coldstorage.pack(self.node.pk, 2021, 3), 2)
+        self.assertEqual(
+            list(Sample.objects.values_list("timestamp_s", flat=True)), [APRIL_1_S]
+        )
+        block = SampleBlock.objects.get()
+        self.assertEqual((block.start_s, block.end_s), (MARCH_1_S, APRIL_1_S))
+        self.assertEqual(block.sample_count, 2)
+        # Samples delivered late are merged into the block by the next pack.
+        self.create_samples(MARCH_1_S + 300, MARCH_1_S + 600, co2_ppm=500)
+        self.assertEqual(coldstorage.pack(self.node.pk, 2021, 3), 2)
+        self.assertEqual(Sample.objects.count(), 1)
+        block.refresh_from_db()
+        self.assertEqual(
+            [(row[0], row[1]) for row in coldstorage.decode(block.data)],
+            [(MARCH_1_S, 400), (MARCH_1_S + 300, 500), (MARCH_1_S + 600, 400)],
+        )
+        self.assertEqual(coldstorage.pack(self.node.pk, 2021, 3), 0)
+
+    def test_read_both_tiers(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, APRIL_1_S)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        # A duplicate of a packed sample, ingested later.
+        self.create_samples(MARCH_1_S + 600, co2_ppm=500)
+        samples = coldstorage.read_samples(self.node.pk, MARCH_1_S + 1, APRIL_1_S)
+        self.assertEqual(
+            [(sample.timestamp_s, sample.co2_ppm, sample.pk) for sample in samples],
+            [
+                (MARCH_1_S + 600, 400, None),
+                (APRIL_1_S, 400, Sample.objects.get(timestamp_s=APRIL_1_S).pk),
+            ],
+        )
+        self.assertEqual(samples[0].temperature_celsius, Decimal("21.5"))
+        self.assertEqual(
+            [row[0] for row in coldstorage.read_rows(self.node.pk)],
+            [MARCH_1_S, MARCH_1_S + 600, APRIL_1_S],
+        )
+
+    def test_summarize(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, MARCH_1_S + 1200)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        summary = coldstorage.summarize(self.node.pk)
+        self.assertEqual(summary["sample_count"], 3)
+        self.assertEqual(summary["latest_sample"].timestamp_s, MARCH_1_S + 1200)
+        self.create_samples(APRIL_1_S)
+        summary = coldstorage.summarize(self.node.pk, MARCH_1_S + 1, APRIL_1_S)
+        self.assertEqual(summary["sample_count"], 3)
+        self.assertEqual(
+            (summary["first_timestamp_s"], summary["last_timestamp_s"]),
+            (MARCH_1_S + 600, APRIL_1_S),
+        )
+        self.assertEqual(summary["latest_sample"].pk, Sample.objects.get().pk)
+
+    def test_summarize_late_duplicates_once(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, APRIL_1_S)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        # A duplicate of a packed sample, ingested while its month was packed.
+        self.create_samples(MARCH_1_S + 600, co2_ppm=500)
+        with self.assertNumQueries(4):
+            summary = coldstorage.summarize(self.node.pk)
+        self.assertEqual(summary["sample_count"], 3)
+        summary = coldstorage.summarize(self.node.pk, MARCH_1_S + 1, MARCH_1_S + 600)
+        self.assertEqual(summary["sample_count"], 1)
+        self.assertEqual(summary["latest_sample"].co2_ppm, 400)
+
+    def test_ingest_skips_packed_duplicates(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        stored = store_samples(
+            [
+                Sample(node=self.node, timestamp_s=MARCH_1_S + 600, co2_ppm=500),
+                Sample(node=self.node, timestamp_s=MARCH_1_S + 900, co2_ppm=500),
+            ]
+        )
+        self.assertEqual(stored, [False, True])
+        self.assertEqual(
+            list(Sample.objects.values_list("timestamp_s", flat=True)),
+            [MARCH_1_S + 900],
+        )
+
+    def test_attach_statistics_of_both_tiers(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, APRIL_1_S)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        self.create_samples(MARCH_1_S + 600, co2_ppm=500)
+        statistics.attach_node_statistics([self.node])
+        self.assertEqual(self.node.sample_count, 3)
+        self.assertEqual(self.node.latest_sample.timestamp_s, APRIL_1_S)
+
+    def test_fidelity_of_packed_samples(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        fidelity, _ = self.node.check_fidelity(600)
+        self.assertEqual(fidelity.fidelity, NodeFidelity.DEAD)
+        self.assertEqual(fidelity.last_contact_s, MARCH_1_S + 600)
+
+    def test_derived_data_count_both_tiers(self):
+        self.create_samples(MARCH_1_S, MARCH_1_S + 600, APRIL_1_S)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        statistics.reconcile([self.node.pk])
+        self.assertEqual(NodeStatistics.objects.get(node=self.node).sample_count, 3)
+        rollups.rebuild([self.node.pk])
+        self.assertEqual(
+            sum(
+                SampleRollup.objects.filter(bucket=SampleRollup.DAY).values_list(
+                    "sample_count", flat=True
+                )
+            ),
+            3,
+        )
+
+    def test_pack_closed_months(self):
+        self.create_samples(MARCH_1_S, APRIL_1_S)
+        self.assertEqual(coldstorage.pack_closed_months(0), 0)
+        stdout = StringIO()
+        call_command("pack_samples", "--after-months", "1", stdout=stdout)
+        self.assertIn("Moved 2 samples.", stdout.getvalue())
+        self.assertEqual(SampleBlock.objects.count(), 2)
+
+
+class ColdStorageApiTestCase(TokenAuthMixin, APITestCase):
+    fixtures = ["user-fixtures.json", "inventory-fixtures.json", "data-fixtures.json"]
+    node_id = "3b95a1b2-74e7-9e98-52c4-4acae441f0ae"
+
+    def setUp(self):
+        self.authenticate(username="veraVersuch", password="versuch")
+
+    def tearDown(self):
+        self.logout()
+
+    def test_api_reads_both_tiers(self):
+        # Fix the end of the time slices, which defaults to the time of the request.
+        to_s = {"filter[to]": 1700000000}
+        urls = [
+            (reverse("node-timeseries-detail", kwargs={"pk": self.node_id}), to_s),
+            (reverse("installation-timeseries-detail", kwargs={"pk": 2}), to_s),
+            (
+                reverse("node-detail", kwargs={"pk": self.node_id}),
+                {**to_s, "include_timeseries": "true"},
+            ),
+            (
+                reverse("installation-detail", kwargs={"pk": 2}),
+                {**to_s, "include_timeseries": "true"},
+            ),
+            (reverse("room-airquality", kwargs={"pk": 3, "year_month": "2020-10"}), {}),
+            (reverse("node-list"), {}),
+            (reverse("node-timeseries-list"), {}),
+            (reverse("installation-timeseries-list"), {}),
+            (reverse("installation-list"), {}),
+        ]
+        before = [self.client.get(url, params) for url, params in urls]
+        self.assertTrue(all(response.status_code == 200 for response in before))
+        coldstorage.pack_closed_months(1)
+        self.assertFalse(Sample.objects.filter(node=self.node_id).exists())
+        after = [self.client.get(url, params) for url, params in urls]
+        for url, response_before, response_after in zip(urls, before, after):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.without_ids(response_after.data),
+                    self.without_ids(response_before.data),
+                )
+
+    def without_ids(self, data):
+        """Drop the IDs of samples, as samples read from blocks have none."""
+        if isinstance(data, dict):
+            return {
+                key: self.without_ids(value)
+                for key, value in data.items()
+                if key not in ("id", "query_timestamp_s")
+            }
+        if isinstance(data, list):
+            return [self.without_ids(item) for item in data]
+        return data
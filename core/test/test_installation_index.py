@@ -0,0 +1,90 @@
+import random
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, TestCase
+
+from core.installation_index import IntervalList, installation_index
+from core.models import RoomNodeInstallation
+from core.test.utils import setup_basic_test_data
+
+
+class InstallationIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+        cls.room = cls.test_data["room1"]
+        cls.first = RoomNodeInstallation.objects.create(
+            node=cls.node, room=cls.room, from_timestamp_s=1000, to_timestamp_s=1999
+        )
+        cls.second = RoomNodeInstallation.objects.create(
+            node=cls.node, room=cls.room, from_timestamp_s=3000
+        )
+
+    def setUp(self):
+        # Installations of other test cases are rolled back without notice.
+        installation_index.invalidate()
+
+    def test_point_lookup(self):
+        self.assertEqual(installation_index.active(self.node.id, 999), [])
+        self.assertEqual(installation_index.active(self.node.id, 1000), [self.first])
+        self.assertEqual(installation_index.active(self.node.id, 1999), [self.first])
+        self.assertEqual(installation_index.active(self.node.id, 2500), [])
+        self.assertEqual(installation_index.active(self.node.id, 10**9), [self.second])
+        self.assertEqual(
+            installation_index.active(self.test_data["node2"].id, 1500), []
+        )
+
+    def test_range_lookup(self):
+        self.assertEqual(
+            installation_index.in_room(self.room.id, 1500, 3500),
+            [self.first, self.second],
+        )
+        self.assertEqual(installation_index.in_room(self.room.id, 2000, 2999), [])
+        self.assertEqual(
+            installation_index.for_node(str(self.node.id), 0, 1000), [self.first]
+        )
+
+    def test_overlapping_installations(self):
+        overlapping = RoomNodeInstallation.objects.create(
+            node=self.node, room=self.room, from_timestamp_s=1500, to_timestamp_s=1600
+        )
+        self.assertEqual(
+            installation_index.active(self.node.id, 1550), [self.first, overlapping]
+        )
+
+    def test_invalidate_on_change(self):
+        self.assertEqual(installation_index.active(self.node.id, 2500), [])
+        self.first.to_timestamp_s = 2999
+        self.first.save()
+        self.assertEqual(installation_index.active(self.node.id, 2500), [self.first])
+        self.first.delete()
+        self.assertEqual(installation_index.active(self.node.id, 2500), [])
+
+
+class IntervalListTestCase(SimpleTestCase):
+    def test_overlapping(self):
+        rng = random.Random(0)
+        installations = [
+            SimpleNamespace(from_timestamp_s=start, to_timestamp_s=start + length)
+            for start, length in (
+                (rng.randrange(10000), rng.randrange(500)) for _ in range(200)
+            )
+        ]
+        # A long-running installation that overlaps all others.
+        installations.append(SimpleNamespace(from_timestamp_s=0, to_timestamp_s=10**6))
+        intervals = IntervalList(installations)
+        for from_s, to_s in [(0, 0), (5000, 5000), (2000, 2600), (10**5, 10**5)]:
+            expected = sorted(
+                (
+                    i
+                    for i in installations
+                    if i.from_timestamp_s <= to_s and i.to_timestamp_s >= from_s
+                ),
+                key=lambda i: i.from_timestamp_s,
+            )
+            self.assertEqual(
+                [id(i) for i in intervals.overlapping(from_s, to_s)],
+                [id(i) for i in expected],
+            )
+        self.assertEqual(IntervalList([]).overlapping(0, 10**6), [])
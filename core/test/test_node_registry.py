@@ -0,0 +1,78 @@
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from core.models import Node
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+
+
+class NodeRegistryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def setUp(self):
+        # Nodes of other test cases are rolled back without notice.
+        node_registry.invalidate()
+
+    def tearDown(self):
+        node_registry.invalidate()
+
+    def test_resolve_without_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(node_registry.get(self.node.id), self.node)
+        with self.assertNumQueries(0):
+            self.assertEqual(node_registry.get(str(self.node.id)), self.node)
+            self.assertEqual(node_registry.get_by_eui64(self.node.eui64), self.node)
+
+    def test_resolve_by_eui64(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(node_registry.get_by_eui64(self.node.eui64), self.node)
+        with self.assertNumQueries(0):
+            self.assertEqual(node_registry.get(self.node.id), self.node)
+
+    def test_unknown_node(self):
+        self.assertIsNone(node_registry.get(uuid.uuid4()))
+        self.assertIsNone(node_registry.get_by_eui64("0000000000000000"))
+        with self.assertRaises(ValidationError):
+            node_registry.get("node-1")
+
+    def test_get_many(self):
+        node2 = self.test_data["node2"]
+        node_registry.get(self.node.id)
+        with self.assertNumQueries(1):
+            nodes = node_registry.get_many([self.node.id, node2.id, uuid.uuid4()])
+        self.assertEqual(nodes, {self.node.id: self.node, node2.id: node2})
+        with self.assertNumQueries(0):
+            node_registry.get_many([self.node.id, node2.id])
+
+    @override_settings(NODE_REGISTRY_CAPACITY=1)
+    def test_evict_least_recently_used(self):
+        node2 = self.test_data["node2"]
+        node_registry.get(self.node.id)
+        node_registry.get(node2.id)
+        self.assertEqual(len(node_registry), 1)
+        with self.assertNumQueries(0):
+            node_registry.get_by_eui64(node2.eui64)
+        with self.assertNumQueries(1):
+            node_registry.get_by_eui64(self.node.eui64)
+
+    @override_settings(NODE_REGISTRY_MAX_AGE_S=-1)
+    def test_expire(self):
+        node_registry.get(self.node.id)
+        with self.assertNumQueries(1):
+            node_registry.get(self.node.id)
+
+    def test_invalidate_on_change(self):
+        node_registry.get(self.node.id)
+        old_eui64 = self.node.eui64
+        self.node.eui64 = "fefffffffdff00ff"
+        self.node.save()
+        self.assertEqual(node_registry.get(self.node.id).eui64, "fefffffffdff00ff")
+        self.assertIsNone(node_registry.get_by_eui64(old_eui64))
+        Node.objects.get(pk=self.node.id).delete()
+        self.assertIsNone(node_registry.get(self.node.id))
+        self.assertIsNone(node_registry.get_by_eui64("fefffffffdff00ff"))
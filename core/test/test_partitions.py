@@ -0,0 +1,83 @@
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core import partitions
+from core.models import Sample
+from core.test.utils import setup_basic_test_data
+
+# 2021-03-01T00:00:00Z
+MARCH_2021_S = 1614556800
+
+
+class MonthTestCase(SimpleTestCase):
+    def test_month_bounds(self):
+        self.assertEqual(
+            partitions.month_bounds(2021, 3),
+            (MARCH_2021_S, int(datetime(2021, 4, 1, tzinfo=timezone.utc).timestamp())),
+        )
+        self.assertEqual(
+            partitions.month_bounds(2020, 12)[1],
+            int(datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp()),
+        )
+
+    def test_months(self):
+        self.assertEqual(
+            list(partitions.months(MARCH_2021_S - 1, MARCH_2021_S)),
+            [(2021, 2), (2021, 3)],
+        )
+        self.assertEqual(
+            list(partitions.months(MARCH_2021_S, MARCH_2021_S + 3600)), [(2021, 3)]
+        )
+        self.assertEqual(
+            len(list(partitions.months(MARCH_2021_S, MARCH_2021_S + 400 * 86400))),
+            14,
+        )
+
+    def test_partition_name(self):
+        self.assertEqual(partitions.partition_name(2021, 3), "core_sample_p202103")
+
+
+class PartitionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    @unittest.skipIf(connection.vendor == "postgresql", "Not on PostgreSQL")
+    def test_noop_without_postgresql(self):
+        self.assertFalse(partitions.is_partitioned())
+        with self.assertNumQueries(0):
+            self.assertEqual(partitions.ensure_partitions(), [])
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL only")
+    def test_move_samples_from_default_partition(self):
+        self.assertTrue(partitions.is_partitioned())
+        # Samples of a month without a partition land in the default partition.
+        Sample.objects.create(node=self.node, timestamp_s=3600, co2_ppm=500)
+        self.assertIn(partitions.DEFAULT_PARTITION, partitions.partitions())
+        with mock.patch("core.partitions.time.time", return_value=MARCH_2021_S):
+            created = partitions.ensure_partitions(months_ahead=1)
+        self.assertIn("core_sample_p197001", created)
+        self.assertIn("core_sample_p202104", created)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM core_sample_p197001")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute(f"SELECT count(*) FROM {partitions.DEFAULT_PARTITION}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(Sample.objects.filter(timestamp_s=3600).count(), 1)
+        self.assertEqual(partitions.ensure_partitions(months_ahead=0), [])
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL only")
+    def test_prune_partitions(self):
+        # The partition of the present month is created by the migration.
+        year, month = partitions.month_of(time.time())
+        from_s, to_s = partitions.month_bounds(year, month)
+        queryset = Sample.objects.filter(timestamp_s__gte=from_s, timestamp_s__lt=to_s)
+        plan = queryset.explain()
+        self.assertIn(partitions.partition_name(year, month), plan)
+        self.assertNotIn(partitions.DEFAULT_PARTITION, plan)
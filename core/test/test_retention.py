@@ -0,0 +1,155 @@
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import coldstorage, retention, rollups
+from core.models import (
+    RetentionPolicy,
+    Sample,
+    SampleBlock,
+    SampleRetention,
+    SampleRollup,
+)
+from core.partitions import month_bounds
+from .utils import setup_basic_test_data
+
+MARCH_1_S, APRIL_1_S = month_bounds(2021, 3)
+
+
+@override_settings(SAMPLE_RETENTION_AFTER_MONTHS=0)
+class RetentionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_data = setup_basic_test_data()
+        cls.node = test_data["node1"]
+        cls.other_node = test_data["node2"]
+
+    def create_samples(self, node, from_s, count, interval_s=120):
+        Sample.objects.bulk_create(
+            Sample(node=node, timestamp_s=from_s + i * interval_s, co2_ppm=400 + i)
+            for i in range(count)
+        )
+
+    def rollup_values(self):
+        return sorted(
+            SampleRollup.objects.values_list(
+                "node", "bucket", "start_s", "sample_count", "co2_ppm_sum"
+            )
+        )
+
+    def test_downsample(self):
+        rows = [(600,), (700,), (1199,), (1200,), (2400,), (2500,)]
+        self.assertEqual(retention.downsample(rows), [(600,), (1200,), (2400,)])
+
+    def test_downsample_month(self):
+        # Two hours at the end of March, and the first hour of April.
+        self.create_samples(self.node, APRIL_1_S - 7200, 90)
+        rollups.rebuild()
+        expected = self.rollup_values()
+        report = retention.apply_month(
+            self.node.pk, 2021, 3, RetentionPolicy.DOWNSAMPLE
+        )
+        self.assertEqual((report["sample_count"], report["removed_count"]), (60, 48))
+        samples = Sample.objects.filter(node=self.node, timestamp_s__lt=APRIL_1_S)
+        self.assertEqual(
+            list(samples.values_list("timestamp_s", flat=True)),
+            list(range(APRIL_1_S - 7200, APRIL_1_S, 600)),
+        )
+        self.assertEqual(self.node.retention.horizon_s, APRIL_1_S)
+        # The rollups of the month stay exact, also when rebuilt later on.
+        self.assertEqual(self.rollup_values(), expected)
+        rollups.rebuild()
+        self.assertEqual(self.rollup_values(), expected)
+
+    def test_rebuild_day_across_horizon(self):
+        # The day of April 1 in Europe/Berlin starts two hours before the horizon.
+        self.create_samples(self.node, APRIL_1_S - 7200, 90)
+        retention.apply_month(self.node.pk, 2021, 3, RetentionPolicy.DOWNSAMPLE)
+        # Samples of the hours after the horizon delivered without rollups.
+        self.create_samples(self.node, APRIL_1_S + 7200, 30)
+        rollups.rebuild()
+        day = SampleRollup.objects.get(
+            bucket=SampleRollup.DAY, start_s=APRIL_1_S - 7200
+        )
+        self.assertEqual(day.sample_count, 60 + 30 + 30)
+        self.assertEqual(day.first_timestamp_s, APRIL_1_S - 7200)
+        self.assertEqual(day.co2_ppm_min, 400)
+
+    def test_drop_cold_month(self):
+        self.create_samples(self.node, MARCH_1_S, 30)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        # A sample delivered late, after packing.
+        self.create_samples(self.node, MARCH_1_S + 60, 1)
+        report = retention.apply_month(self.node.pk, 2021, 3, RetentionPolicy.DROP)
+        self.assertEqual((report["sample_count"], report["removed_count"]), (31, 31))
+        self.assertFalse(SampleBlock.objects.exists())
+        self.assertFalse(Sample.objects.exists())
+        day = SampleRollup.objects.get(bucket=SampleRollup.DAY)
+        self.assertEqual(day.sample_count, 31)
+
+    def test_downsample_cold_month(self):
+        self.create_samples(self.node, MARCH_1_S, 30)
+        coldstorage.pack(self.node.pk, 2021, 3)
+        retention.apply_month(self.node.pk, 2021, 3, RetentionPolicy.DOWNSAMPLE)
+        block = SampleBlock.objects.get()
+        self.assertEqual(block.sample_count, 6)
+        self.assertEqual(
+            [row[0] for row in coldstorage.read_rows(self.node.pk)],
+            list(range(MARCH_1_S, MARCH_1_S + 3600, 600)),
+        )
+
+    def test_apply_policies(self):
+        RetentionPolicy.objects.create(
+            organization=self.node.owner, after_months=1, action=RetentionPolicy.DROP
+        )
+        self.create_samples(self.node, MARCH_1_S, 10)
+        self.create_samples(self.other_node, MARCH_1_S, 10)
+        # The global policy keeps the samples of the other node.
+        retention.apply()
+        self.assertFalse(Sample.objects.filter(node=self.node).exists())
+        self.assertEqual(Sample.objects.filter(node=self.other_node).count(), 10)
+        # Samples delivered late for a month before the horizon.
+        self.create_samples(self.node, MARCH_1_S, 1)
+        reports = retention.apply()
+        self.assertEqual(
+            [(report["month"], report["removed_count"]) for report in reports],
+            [("2021-03", 1)],
+        )
+        self.assertEqual(retention.apply(), [])
+
+    @override_settings(SAMPLE_RETENTION_AFTER_MONTHS=1)
+    def test_apply_downsampled_months_once(self):
+        self.create_samples(self.node, MARCH_1_S, 10)
+        self.create_samples(self.node, APRIL_1_S, 10)
+        self.assertTrue(retention.apply())
+        self.assertEqual(retention.apply(), [])
+        # Samples delivered late, on the grid of the month and off it.
+        Sample.objects.create(node=self.node, timestamp_s=MARCH_1_S + 3000, co2_ppm=400)
+        self.assertEqual(retention.apply(), [])
+        Sample.objects.create(node=self.node, timestamp_s=MARCH_1_S + 3060, co2_ppm=400)
+        reports = retention.apply()
+        self.assertEqual(
+            [(report["month"], report["removed_count"]) for report in reports],
+            [("2021-03", 1)],
+        )
+        self.assertEqual(retention.apply(), [])
+
+    @override_settings(SAMPLE_RETENTION_AFTER_MONTHS=1)
+    def test_dry_run(self):
+        self.create_samples(self.node, MARCH_1_S, 10)
+        stdout = StringIO()
+        call_command("apply_retention", "--dry-run", stdout=stdout)
+        self.assertIn(
+            f"{self.node.pk} 2021-03: downsample 8 of 10 samples", stdout.getvalue()
+        )
+        self.assertIn("Would remove 8 samples.", stdout.getvalue())
+        self.assertEqual(Sample.objects.count(), 10)
+        self.assertFalse(SampleRetention.objects.exists())
+        self.assertFalse(SampleRollup.objects.exists())
+
+    @override_settings(SAMPLE_RETENTION_ACTION="archive")
+    def test_invalid_action(self):
+        with self.assertRaises(ImproperlyConfigured):
+            retention.apply()
@@ -0,0 +1,209 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count, Max, Min, Sum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core import rollups
+from core.models import Sample, SampleRollup
+from .utils import TokenAuthMixin, setup_basic_test_data
+
+# 2021-03-01T00:30:00 in Europe/Berlin, still February 28 in UTC.
+MARCH_1_S = 1614555000
+
+
+class RollupTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = setup_basic_test_data()["node1"]
+
+    def create_samples(self, *values):
+        samples = [
+            Sample(
+                node=self.node,
+                timestamp_s=timestamp_s,
+                co2_ppm=co2_ppm,
+                temperature_celsius=temperature,
+                rel_humidity_percent=humidity,
+            )
+            for timestamp_s, co2_ppm, temperature, humidity in values
+        ]
+        Sample.objects.bulk_create(samples)
+        return samples
+
+    def rollup_values(self):
+        return sorted(
+            SampleRollup.objects.values_list(
+                "bucket",
+                "start_s",
+                "sample_count",
+                "first_timestamp_s",
+                "last_timestamp_s",
+                "co2_ppm_min",
+                "co2_ppm_max",
+                "co2_ppm_sum",
+                "temperature_count",
+                "temperature_celsius_min",
+                "temperature_celsius_max",
+                "temperature_celsius_sum",
+                "rel_humidity_count",
+                "rel_humidity_percent_min",
+                "rel_humidity_percent_max",
+                "rel_humidity_percent_sum",
+            )
+        )
+
+    def test_bucket_start(self):
+        self.assertEqual(
+            rollups.bucket_start(SampleRollup.HOUR, MARCH_1_S), MARCH_1_S - 1800
+        )
+        self.assertEqual(
+            rollups.bucket_start(SampleRollup.DAY, MARCH_1_S + 3600), MARCH_1_S - 1800
+        )
+        self.assertEqual(rollups.day_end(MARCH_1_S), MARCH_1_S - 1800 + 24 * 3600)
+
+    def test_add_samples(self):
+        rollups.add_samples(
+            self.create_samples(
+                (MARCH_1_S, 500, Decimal("20.5"), None),
+                (MARCH_1_S + 600, 700, None, 40),
+            )
+        )
+        rollups.add_samples(
+            self.create_samples((MARCH_1_S - 900, 400, Decimal("19.5"), 50))
+        )
+        hour = SampleRollup.objects.get(
+            bucket=SampleRollup.HOUR, start_s=MARCH_1_S - 1800
+        )
+        self.assertEqual(hour.sample_count, 3)
+        self.assertEqual(
+            (hour.first_timestamp_s, hour.last_timestamp_s),
+            (MARCH_1_S - 900, MARCH_1_S + 600),
+        )
+        self.assertEqual((hour.co2_ppm_min, hour.co2_ppm_max), (400, 700))
+        self.assertEqual(hour.co2_ppm_mean, 1600 / 3)
+        self.assertEqual(
+            (hour.temperature_celsius_min, hour.temperature_celsius_max),
+            (Decimal("19.5"), Decimal("20.5")),
+        )
+        self.assertEqual(hour.temperature_celsius_mean, Decimal("20.0"))
+        self.assertEqual(
+            (hour.rel_humidity_percent_min, hour.rel_humidity_percent_max), (40, 50)
+        )
+        self.assertEqual(hour.rel_humidity_percent_mean, 45)
+        day = SampleRollup.objects.get(bucket=SampleRollup.DAY)
+        self.assertEqual(day.start_s, MARCH_1_S - 1800)
+        self.assertEqual(day.sample_count, 3)
+
+    def test_missing_values(self):
+        rollups.add_samples(self.create_samples((MARCH_1_S, 500, None, None)))
+        hour = SampleRollup.objects.get(bucket=SampleRollup.HOUR)
+        self.assertIsNone(hour.temperature_celsius_min)
+        self.assertIsNone(hour.temperature_celsius_mean)
+        self.assertIsNone(hour.rel_humidity_percent_mean)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        values = [
+            (MARCH_1_S + i * 700, 400 + i * 7 % 300, Decimal(i % 50) / 2, i % 100)
+            for i in range(300)
+        ]
+        for offset in range(0, len(values), 40):
+            rollups.add_samples(self.create_samples(*values[offset : offset + 40]))
+        incremental = self.rollup_values()
+        self.assertEqual(rollups.rebuild(), len(incremental))
+        self.assertEqual(self.rollup_values(), incremental)
+
+    def test_rebuild_days(self):
+        self.create_samples(
+            (MARCH_1_S, 500, None, None), (MARCH_1_S + 24 * 3600, 600, None, None)
+        )
+        rollups.rebuild([self.node.pk], from_s=MARCH_1_S + 24 * 3600)
+        self.assertEqual(
+            SampleRollup.objects.filter(bucket=SampleRollup.DAY).count(), 1
+        )
+        rollups.rebuild([self.node.pk], to_s=MARCH_1_S)
+        self.assertEqual(
+            SampleRollup.objects.filter(bucket=SampleRollup.DAY).count(), 2
+        )
+
+    def test_rebuild_command(self):
+        self.create_samples((MARCH_1_S, 500, None, None))
+        stdout = StringIO()
+        call_command("rebuild_rollups", "--node", str(self.node.pk), stdout=stdout)
+        self.assertIn("Rebuilt 2 rollups.", stdout.getvalue())
+
+
+class AggregateTestCase(TokenAuthMixin, APITestCase):
+    fixtures = ["user-fixtures.json", "inventory-fixtures.json", "data-fixtures.json"]
+    node_id = "3b95a1b2-74e7-9e98-52c4-4acae441f0ae"
+
+    def setUp(self):
+        self.authenticate(username="veraVersuch", password="versuch")
+        rollups.rebuild([self.node_id])
+
+    def tearDown(self):
+        self.logout()
+
+    def test_get_node_aggregates(self):
+        """GET /nodes/<node_id>/aggregates/?bucket=day"""
+        url = reverse("node-aggregates", kwargs={"node_pk": self.node_id})
+        response = self.client.get(url, {"bucket": "day"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["bucket"], "day")
+        self.assertEqual(response.data["sample_count"], 589)
+        samples = Sample.objects.filter(node_id=self.node_id)
+        days = response.data["rollups"]
+        self.assertEqual(
+            min(day["co2_ppm_min"] for day in days),
+            samples.aggregate(Min("co2_ppm"))["co2_ppm__min"],
+        )
+        self.assertEqual(
+            max(day["last_timestamp_s"] for day in days),
+            samples.aggregate(Max("timestamp_s"))["timestamp_s__max"],
+        )
+
+    def test_get_node_aggregates_slice(self):
+        """GET /nodes/<node_id>/aggregates/?bucket=hour&filter[from]=..&filter[to]=.."""
+        hour = SampleRollup.objects.filter(
+            node_id=self.node_id, bucket=SampleRollup.HOUR
+        ).first()
+        url = reverse("node-aggregates", kwargs={"node_pk": self.node_id})
+        response = self.client.get(
+            url,
+            {
+                "bucket": "hour",
+                "filter[from]": hour.start_s + 1,
+                "filter[to]": hour.start_s + 3599,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["rollups"]), 1)
+        rollup = response.data["rollups"][0]
+        expected = Sample.objects.filter(
+            node_id=self.node_id,
+            timestamp_s__gte=hour.start_s,
+            timestamp_s__lt=hour.start_s + 3600,
+        ).aggregate(Count("pk"), Sum("co2_ppm"))
+        self.assertEqual(rollup["sample_count"], expected["pk__count"])
+        self.assertEqual(rollup["co2_ppm_sum"], expected["co2_ppm__sum"])
+
+    def test_get_node_aggregates_invalid_bucket(self):
+        url = reverse("node-aggregates", kwargs={"node_pk": self.node_id})
+        response = self.client.get(url, {"bucket": "week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_installation_aggregates(self):
+        """GET /installations/<installation_id>/aggregates/?bucket=day"""
+        url = reverse("installation-aggregates", kwargs={"installation_pk": 2})
+        response = self.client.get(url, {"bucket": "day"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["from_timestamp_s"], 1601510400)
+        self.assertTrue(
+            all(
+                day["start_s"] <= response.data["to_timestamp_s"]
+                for day in response.data["rollups"]
+            )
+        )
@@ -0,0 +1,164 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core import statistics
+from core.models import (
+    InstallationStatistics,
+    NodeStatistics,
+    RoomNodeInstallation,
+    Sample,
+)
+from .utils import TokenAuthMixin, setup_basic_test_data
+
+
+@override_settings(SAMPLE_STATISTICS=True)
+class StatisticsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_data = setup_basic_test_data()
+        cls.node = test_data["node1"]
+        cls.room = test_data["room1"]
+
+    def create_samples(self, *timestamps, **values):
+        samples = [
+            Sample(node=self.node, timestamp_s=timestamp_s, co2_ppm=400 + i, **values)
+            for i, timestamp_s in enumerate(timestamps)
+        ]
+        Sample.objects.bulk_create(samples)
+        return samples
+
+    def install(self, from_s, to_s):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RoomNodeInstallation.objects.create(
+                node=self.node,
+                room=self.room,
+                from_timestamp_s=from_s,
+                to_timestamp_s=to_s,
+            )
+
+    def test_add_samples(self):
+        installation = self.install(1000, 2000)
+        statistics.add_samples(
+            self.create_samples(1500, 2500, temperature_celsius=Decimal("20.5"))
+        )
+        # Samples delivered late do not replace the latest sample.
+        statistics.add_samples(self.create_samples(500))
+        node_statistics = NodeStatistics.objects.get(node=self.node)
+        self.assertEqual(node_statistics.sample_count, 3)
+        self.assertEqual(
+            (node_statistics.first_timestamp_s, node_statistics.last_timestamp_s),
+            (500, 2500),
+        )
+        latest_sample = node_statistics.latest_sample
+        self.assertEqual(latest_sample.timestamp_s, 2500)
+        self.assertEqual(latest_sample.co2_ppm, 401)
+        self.assertEqual(latest_sample.temperature_celsius, Decimal("20.5"))
+        installation_statistics = InstallationStatistics.objects.get(
+            installation=installation
+        )
+        self.assertEqual(installation_statistics.sample_count, 1)
+        self.assertEqual(installation_statistics.latest_sample.timestamp_s, 1500)
+
+    def test_reconcile_saved_installation(self):
+        self.create_samples(1500, 2500)
+        installation = self.install(1000, 2000)
+        self.assertEqual(installation.statistics.sample_count, 1)
+        installation.to_timestamp_s = 3000
+        with self.captureOnCommitCallbacks(execute=True):
+            installation.save()
+        installation.statistics.refresh_from_db()
+        self.assertEqual(installation.statistics.sample_count, 2)
+
+    def test_reconcile(self):
+        self.install(1000, 2000)
+        statistics.add_samples(self.create_samples(1500, 2500))
+        self.assertEqual(statistics.reconcile(), 0)
+        Sample.objects.filter(timestamp_s=2500).delete()
+        self.assertEqual(statistics.reconcile([self.node.pk]), 1)
+        node_statistics = NodeStatistics.objects.get(node=self.node)
+        self.assertEqual(node_statistics.sample_count, 1)
+        self.assertEqual(node_statistics.last_timestamp_s, 1500)
+
+    def test_reconcile_without_samples(self):
+        statistics.reconcile()
+        node_statistics = NodeStatistics.objects.get(node=self.node)
+        self.assertEqual(node_statistics.sample_count, 0)
+        self.assertIsNone(node_statistics.latest_sample)
+
+
+@override_settings(SAMPLE_STATISTICS=True)
+class StatisticsApiTestCase(TokenAuthMixin, APITestCase):
+    fixtures = ["user-fixtures.json", "inventory-fixtures.json", "data-fixtures.json"]
+    node_id = "3b95a1b2-74e7-9e98-52c4-4acae441f0ae"
+
+    def setUp(self):
+        self.authenticate(username="veraVersuch", password="versuch")
+        statistics.reconcile()
+
+    def tearDown(self):
+        self.logout()
+
+    def assertNoSampleQueries(self, queries):
+        self.assertFalse(
+            [query for query in queries if '"core_sample"' in query["sql"]]
+        )
+
+    def test_list_nodes(self):
+        """GET /nodes/"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("node-list"))
+        self.assertNoSampleQueries(queries)
+        node = next(
+            node for node in response.data["results"] if node["id"] == self.node_id
+        )
+        samples = Sample.objects.filter(node=self.node_id)
+        self.assertEqual(node["sample_count"], samples.count())
+        self.assertEqual(
+            node["latest_sample"]["timestamp_s"], samples.last().timestamp_s
+        )
+
+    def test_list_node_timeseries(self):
+        """GET /node-timeseries/"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("node-timeseries-list"))
+        self.assertNoSampleQueries(queries)
+        self.assertIn(589, [item["sample_count"] for item in response.data])
+
+    def test_list_installations(self):
+        """GET /installations/"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("installation-list"))
+        self.assertNoSampleQueries(queries)
+        self.assertEqual(
+            sorted(item["sample_count"] for item in response.data["results"]),
+            sorted(self.installation_sample_counts(response.data["results"])),
+        )
+
+    def test_list_installation_timeseries(self):
+        """GET /installation-timeseries/"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("installation-timeseries-list"))
+        self.assertNoSampleQueries(queries)
+        self.assertEqual(
+            sorted(item["sample_count"] for item in response.data),
+            sorted(self.installation_sample_counts(response.data)),
+        )
+
+    def installation_sample_counts(self, items):
+        """Count the samples of the installations of the listed items."""
+        counts = []
+        for item in items:
+            pk = item["url"].rstrip("/").rsplit("/", 1)[1]
+            installation = RoomNodeInstallation.objects.get(pk=pk)
+            counts.append(
+                installation.node.samples.filter(
+                    timestamp_s__gte=installation.from_timestamp_s,
+                    timestamp_s__lte=installation.to_timestamp_s,
+                ).count()
+            )
+        return counts
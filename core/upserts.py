@@ -0,0 +1,80 @@
+"""Multi-row upserts that merge aggregates into the stored rows.
+
+Derived data like rollups and statistics are updated on ingest by adding the aggregates
+of the inserted samples to the stored ones, with a single INSERT ... ON CONFLICT DO
+UPDATE statement. Since the merge happens in the DB, under the lock of the conflicting
+row, concurrent inserts do not lose updates. Both PostgreSQL and SQLite evaluate all
+assignments of the update against the stored row, before any of them applies.
+
+A merge is a template of the SQL expression of the merged value of a field, with the
+placeholders {stored} and {excluded} for the stored and the inserted value of the
+field, {table} for the table, and {columns[<field>]} for the column of another field.
+"""
+
+from django.db import connection
+
+ADD = "{stored} + {excluded}"
+# A comparison with NULL is NULL, which takes the ELSE branch. Missing values of either
+# side thereby leave the other one.
+LEAST = (
+    "CASE WHEN {stored} <= {excluded} THEN {stored} "
+    "ELSE COALESCE({excluded}, {stored}) END"
+)
+GREATEST = (
+    "CASE WHEN {stored} >= {excluded} THEN {stored} "
+    "ELSE COALESCE({excluded}, {stored}) END"
+)
+
+
+def latest(timestamp_field):
+    """Return the merge of a field that takes the value of the row of the latest value
+    of the given timestamp field. Of equal timestamps, the inserted row wins."""
+    return (
+        f"CASE WHEN {{table}}.{{columns[{timestamp_field}]}} "
+        f"> EXCLUDED.{{columns[{timestamp_field}]}} "
+        "THEN {stored} ELSE {excluded} END"
+    )
+
+
+def merge(model, objects, unique_fields, merges):
+    """Insert the unsaved model objects, or merge each of them into the stored row with
+    the same values of the unique fields, as given by the merges by field name. Fields
+    without a merge keep their stored value."""
+    if not objects:
+        return
+    fields = [field for field in model._meta.concrete_fields if not field.db_returning]
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    columns = {field.name: quote_name(field.column) for field in fields}
+    updates = ", ".join(
+        f"{columns[name]} = "
+        + template.format(
+            stored=f"{table}.{columns[name]}",
+            excluded=f"EXCLUDED.{columns[name]}",
+            table=table,
+            columns=columns,
+        )
+        for name, template in merges.items()
+    )
+    conflict = ", ".join(columns[name] for name in unique_fields)
+    row = f"({', '.join(['%s'] * len(fields))})"
+    # Lock the conflicting rows in the same order in all transactions, such that
+    # concurrent upserts of overlapping rows do not deadlock.
+    attnames = [model._meta.get_field(name).attname for name in unique_fields]
+    objects = sorted(
+        objects, key=lambda obj: tuple(str(getattr(obj, name)) for name in attnames)
+    )
+    batch_size = connection.ops.bulk_batch_size(fields, objects)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(objects), batch_size):
+            batch = objects[offset : offset + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns.values())}) "
+                f"VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}",
+                [
+                    field.get_db_prep_save(getattr(obj, field.attname), connection)
+                    for obj in batch
+                    for field in fields
+                ],
+            )
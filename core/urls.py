@@ -129,6 +129,11 @@ urlpatterns = [
         data.InstallationTimeSeriesViewSet.as_view({"get": "retrieve"}),
         name="installation-timeseries",
     ),
+    path(
+        "installations/<installation_pk>/aggregates/",
+        data.InstallationAggregateViewSet.as_view({"get": "retrieve"}),
+        name="installation-aggregates",
+    ),
     path(
         "installations/<installation_pk>/node/",
         devices.NodeViewSet.as_view({"get": "retrieve"}),
@@ -144,6 +149,11 @@ urlpatterns = [
         data.NodeTimeSeriesViewSet.as_view({"get": "retrieve"}),
         name="node-timeseries",
     ),
+    path(
+        "nodes/<node_pk>/aggregates/",
+        data.NodeAggregateViewSet.as_view({"get": "retrieve"}),
+        name="node-aggregates",
+    ),
     path(
         "nodes/<pk>/<related_field>/",
         view=devices.NodeViewSet.as_view({"get": "retrieve_related"}),
@@ -6,7 +6,7 @@ from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.response import Response
 from rest_framework_json_api.views import ReadOnlyModelViewSet
 import pandas as pd
@@ -15,16 +15,24 @@ from core.data_analysis.airquality import TIMEZONE
 from core.data_viewmodels import (
     NodeTimeseriesListViewModel,
     NodeTimeseriesViewModel,
+    NodeAggregateViewModel,
     InstallationTimeseriesListViewModel,
     InstallationTimeseriesViewModel,
+    InstallationAggregateViewModel,
     RoomAirQualityViewModel,
 )
+from core.coldstorage import read_rows, read_samples
+from core.installation_index import installation_index
 from core.models import Node, RoomNodeInstallation
+from core.rollups import BUCKET_NAMES, bucket_start
+from core.statistics import attach_installation_statistics, attach_node_statistics
 from core.serializers import (
     NodeTimeseriesListSerializer,
     NodeTimeseriesSerializer,
+    NodeAggregateSerializer,
     InstallationTimeseriesListSerializer,
     InstallationTimeSeriesSerializer,
+    InstallationAggregateSerializer,
     RoomAirQualitySerializer,
 )
 from core.data_analysis import (
@@ -84,12 +92,13 @@ class NodeTimeSeriesViewSet(ReadOnlyModelViewSet):
         return self.serializer_classes.get(self.action, self.serializer_class)
 
     def list(self, request):
-        queryset = self.get_queryset()
+        nodes = list(self.get_queryset())
+        attach_node_statistics(nodes)
         ts_info = [
             NodeTimeseriesListViewModel(
-                pk=node.pk, node_alias=node.alias, sample_count=node.samples.count()
+                pk=node.pk, node_alias=node.alias, sample_count=node.sample_count
             )
-            for node in queryset
+            for node in nodes
         ]
         serializer_class = self.get_serializer_class()
         serializer = serializer_class(ts_info, many=True, context={"request": request})
@@ -97,7 +106,6 @@ class NodeTimeSeriesViewSet(ReadOnlyModelViewSet):
 
     def get_object(self):
         node = self.get_queryset()
-        queryset = node.samples
         from_limit = int(self.request.query_params.get("filter[from]", 0))
         to_limit = int(
             self.request.query_params.get(
@@ -109,9 +117,7 @@ class NodeTimeSeriesViewSet(ReadOnlyModelViewSet):
             from_limit,
             to_limit,
         )
-        samples = queryset.filter(
-            timestamp_s__gte=from_limit, timestamp_s__lte=to_limit
-        )
+        samples = read_samples(node.pk, from_limit, to_limit)
         return NodeTimeseriesViewModel(
             pk=node.pk,
             node_alias=node.alias,
@@ -183,7 +189,8 @@ class InstallationTimeSeriesViewSet(ReadOnlyModelViewSet):
         return self.serializer_classes.get(self.action, self.serializer_class)
 
     def list(self, request):
-        queryset = self.get_queryset()
+        installations = list(self.get_queryset().select_related("node"))
+        attach_installation_statistics(installations)
         ts_info = [
             InstallationTimeseriesListViewModel(
                 pk=installation.pk,
@@ -191,12 +198,9 @@ class InstallationTimeSeriesViewSet(ReadOnlyModelViewSet):
                 node_alias=installation.node.alias,
                 from_timestamp_s=installation.from_timestamp_s,
                 to_timestamp_s=installation.to_timestamp_s,
-                sample_count=installation.node.samples.filter(
-                    timestamp_s__gte=installation.from_timestamp_s,
-                    timestamp_s__lte=installation.to_timestamp_s,
-                ).count(),
+                sample_count=installation.sample_count,
             )
-            for installation in queryset
+            for installation in installations
         ]
         serializer_class = self.get_serializer_class()
         serializer = serializer_class(ts_info, many=True, context={"request": request})
@@ -204,7 +208,6 @@ class InstallationTimeSeriesViewSet(ReadOnlyModelViewSet):
 
     def get_object(self):
         installation = self.get_queryset()
-        queryset = installation.node.samples.all()
         # Limit time-slice to node installation and query.
         install_from_s = installation.from_timestamp_s
         install_to_s = installation.to_timestamp_s
@@ -221,9 +224,7 @@ class InstallationTimeSeriesViewSet(ReadOnlyModelViewSet):
             from_max_s,
             to_min_s,
         )
-        samples = queryset.filter(
-            timestamp_s__gte=from_max_s, timestamp_s__lte=to_min_s
-        ).distinct()
+        samples = read_samples(installation.node_id, from_max_s, to_min_s)
 
         return InstallationTimeseriesViewModel(
             pk=installation.pk,
@@ -235,6 +236,83 @@ class InstallationTimeSeriesViewSet(ReadOnlyModelViewSet):
         )
 
 
+def query_rollups(node, bucket_name, from_s, to_s):
+    """Return the rollups of the node of the given bucket, "hour" or "day", that
+    overlap the time slice from from_s to to_s."""
+    bucket = BUCKET_NAMES.get(bucket_name)
+    if bucket is None:
+        raise ValidationError(
+            {"bucket": [f'"{bucket_name}" is not one of {", ".join(BUCKET_NAMES)}.']}
+        )
+    return list(
+        node.rollups.filter(
+            bucket=bucket,
+            start_s__gte=bucket_start(bucket, from_s),
+            start_s__lte=to_s,
+        )
+    )
+
+
+class NodeAggregateViewSet(NodeTimeSeriesViewSet):
+    """A view for the hourly or daily rollups of the samples of a node. Maintained with
+    SAMPLE_ROLLUPS enabled, see core.rollups."""
+
+    serializer_classes = {
+        "list": NodeTimeseriesListSerializer,
+        "retrieve": NodeAggregateSerializer,
+    }
+
+    def get_object(self):
+        node = self.get_queryset()
+        from_limit = int(self.request.query_params.get("filter[from]", 0))
+        to_limit = int(
+            self.request.query_params.get(
+                "filter[to]", round(datetime.now().timestamp())
+            )
+        )
+        bucket = self.request.query_params.get("bucket", "hour")
+        return NodeAggregateViewModel(
+            pk=node.pk,
+            node_alias=node.alias,
+            from_timestamp_s=from_limit,
+            to_timestamp_s=to_limit,
+            bucket=bucket,
+            rollups=query_rollups(node, bucket, from_limit, to_limit),
+        )
+
+
+class InstallationAggregateViewSet(InstallationTimeSeriesViewSet):
+    """A view for the hourly or daily rollups of the samples of an installation. The
+    rollups at the start and the end of the time slice of the installation may include
+    samples from before or after the installation."""
+
+    serializer_classes = {
+        "list": InstallationTimeseriesListSerializer,
+        "retrieve": InstallationAggregateSerializer,
+    }
+
+    def get_object(self):
+        installation = self.get_queryset()
+        filter_from_s = int(self.request.query_params.get("filter[from]", 0))
+        filter_to_s = int(
+            self.request.query_params.get(
+                "filter[to]", round(datetime.now().timestamp())
+            )
+        )
+        from_max_s = max(installation.from_timestamp_s, filter_from_s)
+        to_min_s = min(installation.to_timestamp_s, filter_to_s)
+        bucket = self.request.query_params.get("bucket", "hour")
+        return InstallationAggregateViewModel(
+            pk=installation.pk,
+            node_id=installation.node.id,
+            node_alias=installation.node.alias,
+            from_timestamp_s=from_max_s,
+            to_timestamp_s=to_min_s,
+            bucket=bucket,
+            rollups=query_rollups(installation.node, bucket, from_max_s, to_min_s),
+        )
+
+
 class RoomAirQualityViewSet(ReadOnlyModelViewSet):
     """A read-only view for air quality information of a given room, computed on the fly. Currently, only a single sensor per room is supported."""
 
@@ -286,16 +364,21 @@ class RoomAirQualityViewSet(ReadOnlyModelViewSet):
         return (from_s, to_s)
 
     def __prepare_sample_query(self, installations_queryset, from_s, to_s):
-        """Find all non-overlapping installations in the given room. Construct a query that concatenates the samples of these installations. Fail the request if none or more than one installations are active at the same time."""
-        installations_in_slice = installations_queryset.filter(
-            to_timestamp_s__gte=from_s, from_timestamp_s__lte=to_s
-        )
-        if installations_in_slice.count() == 0:
+        """Find all non-overlapping installations in the given room. Read the samples of these installations from both storage tiers, and concatenate them. Fail the request if none or more than one installations are active at the same time."""
+        authorized_pks = set(installations_queryset.values_list("pk", flat=True))
+        installations_in_slice = [
+            installation
+            for installation in installation_index.in_room(
+                self.kwargs["pk"], from_s, to_s
+            )
+            if installation.pk in authorized_pks
+        ]
+        if len(installations_in_slice) == 0:
             raise Http404(
                 "In the requested time slice, the selected room has no accessible installations to draw measurement samples from."
             )
-        if installations_in_slice.count() > 1:
-            for index in range(1, installations_in_slice.count() - 1):
+        if len(installations_in_slice) > 1:
+            for index in range(1, len(installations_in_slice) - 1):
                 # Ensure that there is a single active installation in the room at any
                 # point in time.
                 prev_installation_to = installations_in_slice[index - 1].to_timestamp_s
@@ -304,27 +387,19 @@ class RoomAirQualityViewSet(ReadOnlyModelViewSet):
                     raise Http404(
                         "The room has multiple installations active at the same time, which we cannot analyze yet."
                     )
-            sample_querysets = [
-                installation.node.samples.filter(
-                    timestamp_s__gte=from_s, timestamp_s__lte=to_s
-                )
-                for installation in installations_in_slice
-            ]
-            sample_set = (
-                sample_querysets[0].union(*sample_querysets[1:]).order_by("timestamp_s")
+        node_ids = {installation.node_id for installation in installations_in_slice}
+        sample_set = set()
+        for node_id in node_ids:
+            sample_set.update(
+                (row[0], row[1]) for row in read_rows(node_id, from_s, to_s)
             )
-        else:
-            sample_set = (
-                installations_in_slice[0]
-                .node.samples.filter(timestamp_s__gte=from_s, timestamp_s__lte=to_s)
-                .order_by("timestamp_s")
-            )
-        return sample_set
+        return sorted(sample_set)
 
     def __load_samples(self, sample_set):
-        """Trigger the DB query and convert the retrieved samples in a data frame with date/time index."""
-        values = sample_set.values("timestamp_s", "co2_ppm")
-        samples = pd.DataFrame.from_records(values)
+        """Convert the retrieved samples in a data frame with date/time index."""
+        samples = pd.DataFrame.from_records(
+            sample_set, columns=["timestamp_s", "co2_ppm"]
+        )
         samples["timestamp_s"] = pd.to_datetime(samples["timestamp_s"], unit="s")
         samples.set_index("timestamp_s", inplace=True)
         return samples
@@ -25,7 +25,9 @@ from core.serializers import (
     NodeSerializer,
     NodeFidelitySerializer,
 )
+from core.coldstorage import read_samples, summarize
 from core.queryfilters import IncludeTimeseriesQPValidator
+from core.statistics import attach_node_statistics
 
 logger = logging.getLogger(__name__)
 
@@ -95,26 +97,19 @@ class NodeViewSet(ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        nodes = []
-        for node in queryset:
-            node.sample_count = node.samples.count()
-            latest_sample = node.samples.last()
-            if latest_sample:
-                node.latest_sample = latest_sample
-            nodes.append(node)
-        page = self.paginate_queryset(nodes)
-        # TODO: Simplify to use the parent list method and simply inject the modified
-        # queryset.
-        if page:
+        # Look up the sample statistics of the nodes of the present page only.
+        page = self.paginate_queryset(queryset)
+        nodes = list(queryset) if page is None else page
+        attach_node_statistics(nodes)
+        if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(nodes, many=True)
         return Response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        sample_queryset = instance.samples.all()
         from_limit = int(self.request.query_params.get("filter[from]", 0))
         to_limit = int(
             self.request.query_params.get(
@@ -126,22 +121,20 @@ class NodeViewSet(ModelViewSet):
             from_limit,
             to_limit,
         )
-        sample_queryset = sample_queryset.filter(
-            timestamp_s__gte=from_limit, timestamp_s__lte=to_limit
+        summary = summarize(instance.pk, from_limit, to_limit)
+        from_timestamp_s = summary["first_timestamp_s"]
+        to_timestamp_s = summary["last_timestamp_s"]
+        instance.sample_count = summary["sample_count"]
+        instance.from_timestamp_s = (
+            from_limit if from_timestamp_s is None else from_timestamp_s
         )
-        first_sample = sample_queryset.first()
-        from_timestamp_s = first_sample.timestamp_s if first_sample else from_limit
-        last_sample = sample_queryset.last()
-        to_timestamp_s = last_sample.timestamp_s if last_sample else to_limit
-        instance.sample_count = sample_queryset.count()
-        instance.from_timestamp_s = from_timestamp_s
-        instance.to_timestamp_s = to_timestamp_s
+        instance.to_timestamp_s = to_limit if to_timestamp_s is None else to_timestamp_s
         instance.query_timestamp_s = round(datetime.now().timestamp())
-        if last_sample:
-            instance.latest_sample = last_sample
+        if summary["latest_sample"]:
+            instance.latest_sample = summary["latest_sample"]
         include_queryparam = self.request.query_params.get("include_timeseries", False)
         if include_queryparam:
-            instance.timeseries = sample_queryset
+            instance.timeseries = read_samples(instance.pk, from_limit, to_limit)
             serializer = self.get_serializer(instance, include_timeseries=True)
         else:
             serializer = self.get_serializer(instance)
@@ -39,7 +39,9 @@ from core.serializers import (
     UserSerializer,
 )
 
+from core.coldstorage import read_samples, summarize
 from core.queryfilters import IncludeTimeseriesQPValidator
+from core.statistics import attach_installation_statistics
 
 logger = logging.getLogger(__name__)
 
@@ -280,26 +282,18 @@ class RoomNodeInstallationViewSet(ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        installations = []
-        for installation in queryset:
-            installation_samples = installation.node.samples.filter(
-                timestamp_s__gte=installation.from_timestamp_s,
-                timestamp_s__lte=installation.to_timestamp_s,
-            )
-            installation.sample_count = installation_samples.count()
-            latest_sample = installation_samples.last()
-            if latest_sample:
-                installation.latest_sample = latest_sample
-            installation.query_timestamp_s = round(datetime.now().timestamp())
-            installations.append(installation)
-        page = self.paginate_queryset(installations)
-        # TODO: Simplify to use the parent list method and simply inject the modified
-        # queryset.
-        if page:
+        # Look up the sample statistics of the installations of the present page only.
+        page = self.paginate_queryset(queryset)
+        installations = list(queryset) if page is None else page
+        attach_installation_statistics(installations)
+        query_timestamp_s = round(datetime.now().timestamp())
+        for installation in installations:
+            installation.query_timestamp_s = query_timestamp_s
+        if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(installations, many=True)
         return Response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
@@ -320,18 +314,17 @@ class RoomNodeInstallationViewSet(ModelViewSet):
             from_max_s,
             to_min_s,
         )
-        sample_queryset = installation.node.samples.filter(
-            timestamp_s__gte=from_max_s,
-            timestamp_s__lte=to_min_s,
-        ).distinct()
-        installation.sample_count = sample_queryset.count()
+        summary = summarize(installation.node_id, from_max_s, to_min_s)
+        installation.sample_count = summary["sample_count"]
         installation.query_timestamp_s = round(datetime.now().timestamp())
-        latest_sample = sample_queryset.last()
+        latest_sample = summary["latest_sample"]
         if latest_sample:
             installation.latest_sample = latest_sample
         include_queryparam = self.request.query_params.get("include_timeseries", False)
         if include_queryparam:
-            installation.timeseries = sample_queryset
+            installation.timeseries = read_samples(
+                installation.node_id, from_max_s, to_min_s
+            )
             serializer = self.get_serializer(installation, include_timeseries=True)
         else:
             serializer = self.get_serializer(installation)
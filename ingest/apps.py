@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IngestConfig(AppConfig):
     name = "ingest"
+
+    def ready(self):
+        from . import conf
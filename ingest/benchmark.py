@@ -0,0 +1,254 @@
+"""Throughput benchmark of the ingest endpoints.
+
+The benchmark sets up a synthetic fleet of nodes, generates a workload of samples at
+the regular sampling cadence of the fleet, optionally with retransmitted duplicates,
+and drives the ingest endpoints in-process via the Django test client from a number
+of concurrent threads. It reports the sustained throughput, the latency percentiles
+of the requests, and the number of SQL queries per sample. See the management command
+benchmark_ingest.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.installation_index import installation_index
+from core.models import (
+    Address,
+    Node,
+    NodeModel,
+    NodeProtocol,
+    Organization,
+    Room,
+    RoomNodeInstallation,
+    Site,
+)
+from . import binary
+from .dedup import recent_samples
+from .signals import publish_sample
+
+# Ingest endpoints under benchmark, and whether they take batches of samples.
+ENDPOINTS = {
+    "ingest": False,
+    "lean": False,
+    "async": False,
+    "batch": True,
+    "binary": True,
+}
+
+# Sampling cadence of the synthetic fleet.
+CADENCE_S = 600
+START_S = 1600000000
+
+
+def create_fleet(node_count, public_share=0.0):
+    """Create node_count nodes, each installed in a room of its own. The given share
+    of installations is public, such that their samples are published. Return the
+    node IDs."""
+    organization = Organization.objects.create(name="Benchmark")
+    protocol, _ = NodeProtocol.objects.get_or_create(identifier="BENCHMARK")
+    model, _ = NodeModel.objects.get_or_create(
+        name="Benchmark", trade_name="Benchmark", manufacturer="Benchmark"
+    )
+    address = Address.objects.create(street1="Benchmark", zip="00000", city="Bench")
+    site = Site.objects.create(name="Benchmark", address=address, operator=organization)
+    nodes = Node.objects.bulk_create(
+        Node(
+            id=uuid.uuid4(),
+            eui64=f"bench{index:011x}",
+            alias=f"Benchmark {index}",
+            protocol=protocol,
+            model=model,
+            owner=organization,
+        )
+        for index in range(node_count)
+    )
+    rooms = Room.objects.bulk_create(
+        Room(name=f"Benchmark {index}", site=site) for index in range(node_count)
+    )
+    public_count = round(node_count * public_share)
+    RoomNodeInstallation.objects.bulk_create(
+        RoomNodeInstallation(
+            node=node, room=room, from_timestamp_s=0, is_public=index < public_count
+        )
+        for index, (node, room) in enumerate(zip(nodes, rooms))
+    )
+    installation_index.invalidate()
+    return [node.id for node in nodes]
+
+
+def generate_samples(node_ids, sample_count, duplicate_share=0.0, seed=0):
+    """Generate sample_count samples of the given nodes at the sampling cadence. The
+    given share of samples are retransmissions of recent samples."""
+    rng = random.Random(seed)
+    samples = []
+    for index in range(sample_count):
+        if samples and rng.random() < duplicate_share:
+            samples.append(
+                samples[rng.randrange(max(0, len(samples) - 100), len(samples))]
+            )
+            continue
+        node_id = node_ids[index % len(node_ids)]
+        timestamp_s = START_S + (index // len(node_ids)) * CADENCE_S
+        samples.append(
+            (
+                node_id,
+                timestamp_s,
+                rng.randint(400, 2000),
+                Decimal(rng.randint(150, 280)) / 10,
+                rng.randint(20, 80),
+            )
+        )
+    return samples
+
+
+def encode_requests(endpoint, samples, batch_size=500):
+    """Encode the samples as requests to the given ingest endpoint. Return a list of
+    (url, body, content type, sample count) tuples."""
+    url = reverse(f"ingest-{endpoint}" if endpoint != "ingest" else "ingest")
+    if not ENDPOINTS[endpoint]:
+        batches = [[sample] for sample in samples]
+    else:
+        batches = [
+            samples[start : start + batch_size]
+            for start in range(0, len(samples), batch_size)
+        ]
+    return [(url, *_encode(endpoint, batch), len(batch)) for batch in batches]
+
+
+def _resource(node_id, timestamp_s, co2_ppm, temperature_celsius, rel_humidity_percent):
+    return {
+        "type": "Sample",
+        "attributes": {
+            "timestamp_s": timestamp_s,
+            "co2_ppm": co2_ppm,
+            "temperature_celsius": str(temperature_celsius),
+            "rel_humidity_percent": rel_humidity_percent,
+        },
+        "relationships": {"node": {"data": {"type": "Node", "id": str(node_id)}}},
+    }
+
+
+def _encode(endpoint, batch):
+    if endpoint == "ingest":
+        return (json.dumps({"data": _resource(*batch[0])}), "application/vnd.api+json")
+    if endpoint == "batch":
+        data = [_resource(*sample) for sample in batch]
+        return (json.dumps({"data": data}), "application/vnd.api+json")
+    if endpoint in ("lean", "async"):
+        node_id, timestamp_s, co2_ppm, temperature, humidity = batch[0]
+        body = {
+            "node": str(node_id),
+            "timestamp_s": timestamp_s,
+            "co2_ppm": co2_ppm,
+            "temperature_celsius": str(temperature),
+            "rel_humidity_percent": humidity,
+        }
+        return (json.dumps(body), "application/json")
+    return (
+        b"".join(binary.encode_sample(*sample) for sample in batch),
+        binary.MEDIA_TYPE,
+    )
+
+
+@contextmanager
+def publication_enabled():
+    """Publish the samples of public installations, but without forwarding them to
+    any external platform."""
+    muted = []
+    if apps.is_installed("stadtpuls_integration"):
+        from stadtpuls_integration.publisher import publish_to_stadtpuls
+
+        muted.append(publish_to_stadtpuls)
+    for receiver in muted:
+        publish_sample.disconnect(receiver)
+    try:
+        with override_settings(IOTDP_INTEGRATION=1, IOTDP_DEFERRED=0):
+            yield
+    finally:
+        for receiver in muted:
+            publish_sample.connect(receiver)
+
+
+def run(requests, concurrency=1):
+    """Send the requests from the given number of threads and return the results."""
+    pending = list(reversed(requests))
+    lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+    query_count = [0]
+    completed_count = [0]
+
+    def count_queries(execute, sql, params, many, context):
+        with lock:
+            query_count[0] += 1
+        return execute(sql, params, many, context)
+
+    def worker():
+        # Count failed requests instead of raising their exceptions.
+        client = Client(raise_request_exception=False)
+        try:
+            with connection.execute_wrapper(count_queries):
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        url, body, content_type, sample_count = pending.pop()
+                    start = time.perf_counter()
+                    response = client.post(url, data=body, content_type=content_type)
+                    latency_s = time.perf_counter() - start
+                    with lock:
+                        latencies.append(latency_s)
+                        statuses[response.status_code] += 1
+                        if response.status_code < 500:
+                            completed_count[0] += sample_count
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+    recent_samples.clear()
+    start = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    duration_s = time.perf_counter() - start
+
+    sample_count = sum(request[3] for request in requests)
+    latencies.sort()
+    return {
+        "requests": len(requests),
+        "samples": sample_count,
+        "concurrency": concurrency,
+        "duration_s": round(duration_s, 3),
+        # Samples of failed requests do not count towards the throughput.
+        "samples_per_s": round(completed_count[0] / duration_s, 1),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "p99_ms": _percentile_ms(latencies, 99),
+        "queries_per_sample": round(query_count[0] / sample_count, 2),
+        "statuses": dict(statuses),
+    }
+
+
+def _percentile_ms(sorted_latencies, percent):
+    """Return the given percentile of the latencies in ms, by the nearest rank."""
+    if not sorted_latencies:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_latencies)))
+    return round(sorted_latencies[rank - 1] * 1000, 2)
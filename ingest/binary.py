@@ -0,0 +1,66 @@
+"""Compact binary encoding of samples for high-volume protocol handlers.
+
+A request body is a sequence of fixed-size records in network byte order:
+
+    bytes 0-15   node UUID
+    bytes 16-19  timestamp_s, unsigned 32-bit integer
+    bytes 20-21  co2_ppm, unsigned 16-bit integer
+    bytes 22-23  temperature_celsius in tenths of a degree, signed 16-bit integer
+    byte  24     rel_humidity_percent, unsigned 8-bit integer
+
+A temperature of -32768 and a humidity of 255 encode missing values.
+"""
+
+import struct
+import uuid
+from decimal import Decimal
+
+MEDIA_TYPE = "application/vnd.clair.samples"
+
+RECORD = struct.Struct("!16sIHhB")
+NO_TEMPERATURE = -32768
+NO_HUMIDITY = 255
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def encode_sample(
+    node_id, timestamp_s, co2_ppm, temperature_celsius=None, rel_humidity_percent=None
+):
+    """Encode the sample as a single binary record."""
+    return RECORD.pack(
+        uuid.UUID(str(node_id)).bytes,
+        timestamp_s,
+        co2_ppm,
+        (
+            NO_TEMPERATURE
+            if temperature_celsius is None
+            else round(Decimal(str(temperature_celsius)) * 10)
+        ),
+        NO_HUMIDITY if rel_humidity_percent is None else rel_humidity_percent,
+    )
+
+
+def decode_samples(payload):
+    """Decode the binary records of the payload into dicts of sample fields."""
+    if len(payload) % RECORD.size:
+        raise DecodeError(
+            f"Payload of {len(payload)} bytes is no multiple of the "
+            f"{RECORD.size}-byte record size."
+        )
+    return [
+        {
+            "node": uuid.UUID(bytes=node),
+            "timestamp_s": timestamp_s,
+            "co2_ppm": co2_ppm,
+            "temperature_celsius": (
+                None if temperature == NO_TEMPERATURE else Decimal(temperature) / 10
+            ),
+            "rel_humidity_percent": (None if humidity == NO_HUMIDITY else humidity),
+        }
+        for node, timestamp_s, co2_ppm, temperature, humidity in RECORD.iter_unpack(
+            payload
+        )
+    ]
@@ -0,0 +1,286 @@
+"""Bulk loading of historical samples from files.
+
+Samples are read from CSV, NDJSON, or the compact binary encoding of ingest.binary,
+checked by the validator of the lean ingest path, and loaded in chunks. On PostgreSQL,
+each chunk is copied into a temporary staging table with COPY and then merged into the
+sample table, skipping samples that violate unique_sampling_times_per_node. On other
+DBMS, each chunk is inserted with a conflict-ignoring executemany. See the management
+command load_samples.
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+
+from core import rollups, statistics
+from core.models import Node, Sample
+from . import binary, dirty
+from .fastpath import FIELDS, sample_validator
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson", "binary")
+UNIQUE_CONSTRAINT = "unique_sampling_times_per_node"
+_EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".bin": "binary"}
+
+# Lookback interval of the node fidelity rebuilt after loading, as in the scheduled
+# fidelity check.
+FIDELITY_LOOKBACK = timedelta(hours=2)
+
+
+def guess_format(path):
+    """Return the format of the file by its extension, or None if unknown."""
+    for extension, file_format in _EXTENSIONS.items():
+        if path.lower().endswith(extension):
+            return file_format
+    return None
+
+
+def read_rows(file, file_format):
+    """Yield the line or record number, the fields, and the decoding errors of each
+    sample in the file opened in binary mode. Either the fields or the errors are
+    None."""
+    if file_format == "binary":
+        yield from _read_binary(file)
+        return
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield (reader.line_num, *_from_csv(row))
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as error:
+            errors = {"non_field_errors": [f"JSON parse error - {error}"]}
+            yield (line_number, None, errors)
+            continue
+        if not isinstance(fields, dict):
+            yield (line_number, None, {"non_field_errors": ["Expected a JSON object."]})
+        else:
+            yield (line_number, fields, None)
+
+
+def _from_csv(row):
+    """Convert the CSV fields to the types of the JSON fields. Empty fields are
+    missing values."""
+    fields = {key: value for key, value in row.items() if value not in ("", None)}
+    for name in ("timestamp_s", "co2_ppm", "rel_humidity_percent"):
+        if name in fields:
+            try:
+                fields[name] = int(fields[name])
+            except ValueError:
+                return (None, {name: ["A valid integer is required."]})
+    return (fields, None)
+
+
+def _read_binary(file):
+    record_count = 0
+    while True:
+        payload = file.read(binary.RECORD.size * 1000)
+        if not payload:
+            return
+        try:
+            rows = binary.decode_samples(payload)
+        except binary.DecodeError as error:
+            yield (record_count + 1, None, {"non_field_errors": [str(error)]})
+            return
+        for row in rows:
+            record_count += 1
+            yield (record_count, row, None)
+
+
+class SampleResolver:
+    """Resolve the node of each row, given by its UUID or by its EUI-64, and validate
+    the row. Nodes are looked up all at once beforehand."""
+
+    def __init__(self):
+        nodes = Node.objects.values_list("id", "eui64")
+        self.node_ids = {node_id for node_id, _ in nodes}
+        self.node_ids_by_eui64 = {eui64: node_id for node_id, eui64 in nodes}
+        self._status_choices = {choice for choice, _ in Sample.MEASUREMENT_STATUS}
+
+    def resolve(self, row):
+        """Return the values of the sample in the order of FIELDS, and the errors."""
+        if "node" not in row and "eui64" in row:
+            node_id = self.node_ids_by_eui64.get(row["eui64"])
+            if node_id is None:
+                error = f'Invalid EUI-64 "{row["eui64"]}" - node does not exist.'
+                return (None, {"eui64": [error]})
+            row = {**row, "node": node_id}
+        values, errors = sample_validator.validate(row)
+        if errors:
+            return (None, errors)
+        if values[0] not in self.node_ids:
+            return (
+                None,
+                {"node": [f'Invalid pk "{values[0]}" - object does not exist.']},
+            )
+        status = row.get("measurement_status", Sample.MEASUREMENT)
+        if status not in self._status_choices:
+            return (
+                None,
+                {"measurement_status": [f'"{status}" is not a valid choice.']},
+            )
+        values[-1] = status
+        return (values, None)
+
+
+class ExecutemanyLoader:
+    """Insert each chunk with a conflict-ignoring executemany."""
+
+    def __init__(self):
+        self.fields = [Sample._meta.get_field(name) for name in FIELDS]
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(quote_name(field.column) for field in self.fields)
+        self.sql = " ".join(
+            [
+                connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+                f"{quote_name(Sample._meta.db_table)} ({columns})",
+                f"VALUES ({', '.join(['%s'] * len(self.fields))})",
+                connection.ops.on_conflict_suffix_sql(
+                    self.fields, OnConflict.IGNORE, None, None
+                ),
+            ]
+        ).strip()
+
+    def load(self, chunk):
+        """Insert the samples of the chunk. Return the number of samples inserted."""
+        params = [
+            [
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(self.fields, values)
+            ]
+            for values in chunk
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(self.sql, params)
+            inserted = cursor.rowcount
+            mark_dirty(chunk)
+        return inserted
+
+
+class CopyLoader:
+    """Copy each chunk into a temporary staging table, and merge the staging table into
+    the sample table. PostgreSQL only."""
+
+    STAGING_TABLE = "ingest_sample_staging"
+
+    def __init__(self):
+        self.fields = [Sample._meta.get_field(name) for name in FIELDS]
+        quote_name = connection.ops.quote_name
+        self.columns = ", ".join(quote_name(field.column) for field in self.fields)
+        staging = quote_name(self.STAGING_TABLE)
+        definitions = ", ".join(
+            f"{quote_name(field.column)} {field.db_type(connection)}"
+            for field in self.fields
+        )
+        node_column = quote_name(Sample._meta.get_field("node").column)
+        timestamp_column = quote_name(Sample._meta.get_field("timestamp_s").column)
+        self.create_sql = (
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} ({definitions}) "
+            "ON COMMIT DELETE ROWS"
+        )
+        self.copy_sql = f"COPY {staging} ({self.columns}) FROM STDIN WITH (FORMAT csv)"
+        # Of several samples of a node at the same time in the chunk, keep one.
+        self.merge_sql = (
+            f"INSERT INTO {quote_name(Sample._meta.db_table)} ({self.columns}) "
+            f"SELECT DISTINCT ON ({node_column}, {timestamp_column}) {self.columns} "
+            f"FROM {staging} "
+            f"ON CONFLICT ON CONSTRAINT {quote_name(UNIQUE_CONSTRAINT)} DO NOTHING"
+        )
+
+    def load(self, chunk):
+        """Copy and merge the samples of the chunk. Return the number of samples
+        inserted."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for values in chunk:
+            writer.writerow(["" if value is None else value for value in values])
+        buffer.seek(0)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(self.create_sql)
+            cursor.copy_expert(self.copy_sql, buffer)
+            cursor.execute(self.merge_sql)
+            inserted = cursor.rowcount
+            mark_dirty(chunk)
+        return inserted
+
+
+def mark_dirty(chunk):
+    """Mark the days of the samples of the chunk as dirty, including those of
+    duplicates, which the loaders do not tell apart."""
+    if settings.INGEST_DIRTY_RANGES:
+        dirty.get_tracker().mark((values[0], values[1]) for values in chunk)
+
+
+def create_loader():
+    if connection.vendor == "postgresql":
+        return CopyLoader()
+    return ExecutemanyLoader()
+
+
+def load_samples(rows, chunk_size=10000, loader=None, progress=None):
+    """Load the samples of the rows, as read by read_rows, in chunks. Call
+    progress with the running totals after each chunk. Return the totals, the errors
+    of the invalid rows by line number, and the time slices of the valid rows as a
+    dict of the first and last timestamp by node ID."""
+    loader = loader or create_loader()
+    resolver = SampleResolver()
+    totals = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+    failures = []
+    spans = {}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        chunk = []
+        for line_number, row, errors in batch:
+            if not errors:
+                values, errors = resolver.resolve(row)
+            if errors:
+                failures.append({"line": line_number, "errors": errors})
+            else:
+                chunk.append(values)
+                span = spans.get(values[0])
+                timestamp_s = values[1]
+                if span is None:
+                    spans[values[0]] = (timestamp_s, timestamp_s)
+                elif not span[0] <= timestamp_s <= span[1]:
+                    spans[values[0]] = (
+                        min(span[0], timestamp_s),
+                        max(span[1], timestamp_s),
+                    )
+        inserted = loader.load(chunk) if chunk else 0
+        totals["read"] += len(batch)
+        totals["inserted"] += inserted
+        totals["duplicates"] += len(chunk) - inserted
+        totals["invalid"] += len(batch) - len(chunk)
+        if progress:
+            progress(totals)
+    return (totals, failures, spans)
+
+
+def rebuild_statistics(spans):
+    """Rebuild the per-node statistics derived from the samples of the given nodes,
+    their rollups within the given time slices, as returned by load_samples, and their
+    sample statistics."""
+    lookback_interval_s = FIDELITY_LOOKBACK.total_seconds()
+    for node in Node.objects.filter(pk__in=spans.keys()):
+        node.check_fidelity(lookback_interval_s)
+    if settings.SAMPLE_ROLLUPS:
+        for node_id, (from_s, to_s) in spans.items():
+            rollups.rebuild([node_id], from_s, to_s)
+    if settings.SAMPLE_STATISTICS:
+        statistics.reconcile(spans.keys())
@@ -0,0 +1,56 @@
+import os
+
+from appconf import AppConf
+from django.conf import settings
+
+
+class IngestAppConf(AppConf):
+    # Maximum number of samples accepted in a single batch-ingest request.
+    MAX_BATCH_SIZE = 5000
+    # Number of samples committed at once when streaming a backfill.
+    STREAM_CHUNK_SIZE = 500
+    # Number of recently ingested samples remembered per process to suppress
+    # retransmitted duplicates without a DB query. Set to 0 to disable.
+    DEDUP_CAPACITY = 50000
+    # Optional write-behind buffering of single ingested samples with group commit.
+    # See ingest.writebehind for the available backends and durability contracts.
+    WRITE_BEHIND = False
+    WRITE_BEHIND_BACKEND = "memory"
+    WRITE_BEHIND_DURABILITY = "enqueue"
+    WRITE_BEHIND_CAPACITY = 10000
+    WRITE_BEHIND_MAX_BATCH_SIZE = 500
+    WRITE_BEHIND_MAX_DELAY_MS = 200
+    WRITE_BEHIND_COMMIT_TIMEOUT_S = 5
+    WRITE_BEHIND_REDIS = {"host": "redis", "port": 6379, "db": 0}
+    WRITE_BEHIND_REDIS_KEY = "ingest:write-behind"
+    # Number of shards that samples are routed onto by their node, each committed by
+    # a writer of its own, and whether the writers are threads of the ingest processes
+    # or dedicated processes.
+    WRITE_BEHIND_SHARDS = 1
+    WRITE_BEHIND_WRITERS = "embedded"
+    # Optional per-node rate limiting of single ingested samples. See ingest.ratelimit.
+    RATE_LIMIT = False
+    RATE_LIMIT_BACKEND = "memory"
+    # Expected sampling cadence of nodes, by the identifier of their protocol.
+    RATE_LIMIT_CADENCE_S = 60
+    RATE_LIMIT_PROTOCOL_CADENCE_S = {}
+    RATE_LIMIT_BURST = 10
+    RATE_LIMIT_REDIS = {"host": "redis", "port": 6379, "db": 0}
+    RATE_LIMIT_REDIS_KEY = "ingest:rate-limit"
+    # Optional local spool of samples accepted while the DB is unreachable. See
+    # ingest.spool.
+    SPOOL = False
+    SPOOL_DIR = os.path.join(settings.BASE_DIR, "spool")
+    SPOOL_RETRY_S = 10
+    SPOOL_REPLAY_BATCH_SIZE = 500
+    # Optional tracking of the days of nodes with ingested samples, for the refresh of
+    # derived data. See ingest.dirty. Days are those of the air quality analysis.
+    DIRTY_RANGES = False
+    DIRTY_RANGES_TIME_ZONE = "Europe/Berlin"
+    DIRTY_RANGES_MARK_INTERVAL_S = 10
+    DIRTY_RANGES_CONSUME_LAG_S = 60
+    DIRTY_RANGES_RETENTION_DAYS = 35
+    DIRTY_RANGES_MEMO_CAPACITY = 10000
+
+    class Meta:
+        prefix = "ingest"
@@ -0,0 +1,62 @@
+"""Suppression of retransmitted samples.
+
+LoRaWAN uplinks are often delivered more than once, via several gateways or after
+retries. Each process remembers the node and timestamp of the samples it recently
+stored or found to be stored already, and skips samples with the same node and
+timestamp without querying the DB. Duplicates not remembered are skipped by the
+conflict-ignoring inserts of the ingest views.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class RecentSamples:
+    """Bounded LRU set of the (node, timestamp) keys of recently ingested samples."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._stats = {"suppressed": 0, "duplicates": 0}
+
+    def contains(self, node_id, timestamp_s):
+        """Return True if a sample of the node at the given time was recently
+        ingested, and count the suppressed duplicate."""
+        key = (node_id, timestamp_s)
+        with self._lock:
+            if key not in self._keys:
+                return False
+            self._keys.move_to_end(key)
+            self._stats["suppressed"] += 1
+            return True
+
+    def add(self, keys):
+        """Remember the given (node, timestamp) keys as ingested."""
+        if not self.capacity:
+            return
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+
+    def count_duplicates(self, count):
+        """Count duplicates that were not suppressed, but skipped by the DB."""
+        with self._lock:
+            self._stats["duplicates"] += count
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._stats = {"suppressed": 0, "duplicates": 0}
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._keys), "capacity": self.capacity}
+
+
+recent_samples = RecentSamples(settings.INGEST_DEDUP_CAPACITY)
@@ -0,0 +1,180 @@
+"""Tracking of the days of nodes whose samples changed.
+
+Derived data like daily metrics are computed per day in INGEST_DIRTY_RANGES_TIME_ZONE.
+Every insert of samples marks the (node, day) buckets of the inserted samples as dirty,
+in the transaction of the insert, such that a sample delivered late invalidates the
+derived data of its own day only. Recomputation jobs and cache layers consume the dirty
+days and refresh the affected days and rooms instead of whole months.
+
+Each consumer keeps a cursor of the marking time up to which it consumed the dirty
+days. Days are consumed only once marked at least INGEST_DIRTY_RANGES_CONSUME_LAG_S
+ago, such that inserts still in progress when the days are consumed are not missed. A
+process marks a day at most once per INGEST_DIRTY_RANGES_MARK_INTERVAL_S, which saves
+an upsert for almost every sample in regular operation. This is safe as long as the
+consume lag exceeds the mark interval: the samples of a day are committed by the time
+its last mark is consumed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from core.installation_index import installation_index
+from .models import DirtyDay, DirtyRangeCursor
+
+
+class DirtyRangeTracker:
+    def __init__(
+        self, time_zone, mark_interval_s, consume_lag_s, retention_days, memo_capacity
+    ):
+        if consume_lag_s <= mark_interval_s:
+            raise ImproperlyConfigured(
+                "The consume lag of dirty ranges must exceed their mark interval."
+            )
+        self.time_zone = ZoneInfo(time_zone)
+        self.mark_interval_s = mark_interval_s
+        self.consume_lag_s = consume_lag_s
+        self.retention_days = retention_days
+        self.memo_capacity = memo_capacity
+        self._lock = threading.Lock()
+        self._marked = OrderedDict()  # Time of the last mark, by (node ID, day).
+        self._stats = {"marked": 0, "suppressed": 0}
+
+    def day_of(self, timestamp_s):
+        return datetime.fromtimestamp(timestamp_s, self.time_zone).date()
+
+    def day_slice(self, day):
+        """Return the start and end timestamps of the day, end exclusive."""
+        start = datetime(day.year, day.month, day.day, tzinfo=self.time_zone)
+        next_day = day + timedelta(days=1)
+        end = datetime(
+            next_day.year, next_day.month, next_day.day, tzinfo=self.time_zone
+        )
+        return (int(start.timestamp()), int(end.timestamp()))
+
+    def mark(self, keys):
+        """Mark the days of the given (node ID, timestamp) keys of inserted samples as
+        dirty. Call within the transaction of the insert."""
+        now = time.monotonic()
+        buckets = {(node_id, self.day_of(timestamp_s)) for node_id, timestamp_s in keys}
+        with self._lock:
+            due = [
+                bucket
+                for bucket in buckets
+                if now - self._marked.get(bucket, -self.mark_interval_s)
+                >= self.mark_interval_s
+            ]
+            self._stats["suppressed"] += len(buckets) - len(due)
+        if not due:
+            return
+        marked_s = int(time.time())
+        DirtyDay.objects.bulk_create(
+            [
+                DirtyDay(node_id=node_id, day=day, marked_s=marked_s)
+                for node_id, day in due
+            ],
+            update_conflicts=True,
+            unique_fields=["node_id", "day"],
+            update_fields=["marked_s"],
+        )
+        # Remember the marks only once committed. A rolled back mark must be repeated.
+        transaction.on_commit(lambda: self._remember(due, now))
+
+    @contextmanager
+    def consume(self, consumer):
+        """Yield the days marked dirty since the last consumption by the given
+        consumer, as a dict of sets of days by node ID. Advance the cursor of the
+        consumer once the block exits without an exception. The block runs in the
+        transaction that holds the cursor, such that derived data refreshed in the
+        block are committed along with the cursor."""
+        DirtyRangeCursor.objects.get_or_create(consumer=consumer)
+        with transaction.atomic():
+            cursor = DirtyRangeCursor.objects.select_for_update().get(consumer=consumer)
+            until_s = int(time.time()) - self.consume_lag_s
+            days = {}
+            for node_id, day in DirtyDay.objects.filter(
+                marked_s__gte=cursor.position_s, marked_s__lt=until_s
+            ).values_list("node_id", "day"):
+                days.setdefault(node_id, set()).add(day)
+            yield days
+            if until_s > cursor.position_s:
+                cursor.position_s = until_s
+                cursor.save(update_fields=["position_s"])
+        self.prune()
+
+    def rooms(self, days):
+        """Return the days of the rooms in which the nodes were installed on the given
+        days, as a dict of sets of days by room ID."""
+        room_days = {}
+        for node_id, node_days in days.items():
+            for day in node_days:
+                from_s, to_s = self.day_slice(day)
+                for installation in installation_index.for_node(
+                    node_id, from_s, to_s - 1
+                ):
+                    room_days.setdefault(installation.room_id, set()).add(day)
+        return room_days
+
+    def prune(self):
+        """Delete the dirty days not marked within the retention period. Consumers
+        that did not consume them by then refresh their derived data entirely."""
+        before_s = int(time.time()) - self.retention_days * 24 * 3600
+        DirtyDay.objects.filter(marked_s__lt=before_s).delete()
+
+    def clear(self):
+        with self._lock:
+            self._marked.clear()
+            self._stats = {"marked": 0, "suppressed": 0}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(
+            {
+                "days": DirtyDay.objects.count(),
+                "consumers": dict(
+                    DirtyRangeCursor.objects.values_list("consumer", "position_s")
+                ),
+            }
+        )
+        return stats
+
+    def _remember(self, buckets, marked_at):
+        with self._lock:
+            for bucket in buckets:
+                self._marked[bucket] = marked_at
+                self._marked.move_to_end(bucket)
+            while len(self._marked) > self.memo_capacity:
+                self._marked.popitem(last=False)
+            self._stats["marked"] += len(buckets)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def create_tracker():
+    """Create a dirty-range tracker as configured in the settings."""
+    return DirtyRangeTracker(
+        settings.INGEST_DIRTY_RANGES_TIME_ZONE,
+        mark_interval_s=settings.INGEST_DIRTY_RANGES_MARK_INTERVAL_S,
+        consume_lag_s=settings.INGEST_DIRTY_RANGES_CONSUME_LAG_S,
+        retention_days=settings.INGEST_DIRTY_RANGES_RETENTION_DAYS,
+        memo_capacity=settings.INGEST_DIRTY_RANGES_MEMO_CAPACITY,
+    )
+
+
+def get_tracker():
+    """Return the dirty-range tracker of the present process, created on first use."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = create_tracker()
+        return _tracker
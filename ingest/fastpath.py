@@ -0,0 +1,170 @@
+"""Lean ingest path for single samples.
+
+Samples are plain JSON objects rather than JSON:API documents. They are checked by a
+validator compiled once from the Sample model, and stored with a single SQL statement
+that inserts the sample only if its node exists and it is not a duplicate.
+"""
+
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, models
+from django.db.models.constants import OnConflict
+
+from core.models import Node, Sample
+
+# Columns of the prepared insert. All but the measurement status are posted to the
+# lean ingest endpoint.
+FIELDS = [
+    "node",
+    "timestamp_s",
+    "co2_ppm",
+    "temperature_celsius",
+    "rel_humidity_percent",
+    "measurement_status",
+]
+
+_LOOKUP_BOUNDS = {"gte": 0, "lte": 1}
+
+
+def compile_bounds(model):
+    """Return the lower and upper bound of each field limited by a CheckConstraint of
+    the model. Only constraints that bound a single field are supported."""
+    bounds = {}
+    for constraint in model._meta.constraints:
+        if not isinstance(constraint, models.CheckConstraint):
+            continue
+        for child in constraint.check.children:
+            field_name, _, lookup = child[0].rpartition("__")
+            if constraint.check.negated or lookup not in _LOOKUP_BOUNDS:
+                raise ImproperlyConfigured(
+                    f"Cannot compile the check constraint {constraint.name}."
+                )
+            field_bounds = bounds.setdefault(field_name, [None, None])
+            field_bounds[_LOOKUP_BOUNDS[lookup]] = child[1]
+    return bounds
+
+
+class SampleValidator:
+    """Validator for plain sample objects, compiled from the fields and the check
+    constraints of the Sample model."""
+
+    def __init__(self):
+        bounds = compile_bounds(Sample)
+        self.checks = []
+        for name in FIELDS[1:-1]:
+            field = Sample._meta.get_field(name)
+            low, high = connection.ops.integer_field_ranges.get(
+                field.get_internal_type(), (None, None)
+            )
+            constraint_low, constraint_high = bounds.get(name, (None, None))
+            if constraint_low is not None:
+                low = constraint_low if low is None else max(low, constraint_low)
+            if constraint_high is not None:
+                high = constraint_high if high is None else min(high, constraint_high)
+            self.checks.append((field, low, high))
+
+    def validate(self, data):
+        """Return the values of the fields of the sample, in the order of FIELDS, and a
+        dict of errors per field."""
+        errors = {}
+        values = []
+        try:
+            node = data["node"]
+            values.append(node if isinstance(node, uuid.UUID) else uuid.UUID(node))
+        except (KeyError, TypeError, AttributeError, ValueError):
+            errors["node"] = ["A valid node UUID is required."]
+        for field, low, high in self.checks:
+            value = data.get(field.name)
+            if value is None:
+                if not field.null:
+                    errors[field.name] = ["This field is required."]
+                values.append(value)
+                continue
+            value, error = self._convert(field, value)
+            if error is None and low is not None and value < low:
+                error = f"Ensure this value is greater than or equal to {low}."
+            if error is None and high is not None and value > high:
+                error = f"Ensure this value is less than or equal to {high}."
+            if error:
+                errors[field.name] = [error]
+            values.append(value)
+        values.append(Sample.MEASUREMENT)
+        return (values, errors)
+
+    @staticmethod
+    def _convert(field, value):
+        if isinstance(field, models.DecimalField):
+            if isinstance(value, bool) or not isinstance(
+                value, (int, float, str, Decimal)
+            ):
+                return (None, "A valid number is required.")
+            try:
+                value = Decimal(str(value))
+            except InvalidOperation:
+                return (None, "A valid number is required.")
+            if (
+                not value.is_finite()
+                or -value.as_tuple().exponent > field.decimal_places
+            ):
+                return (
+                    None,
+                    f"Ensure that there are no more than {field.decimal_places} "
+                    "decimal places.",
+                )
+            return (value, None)
+        if isinstance(value, bool) or not isinstance(value, int):
+            return (None, "A valid integer is required.")
+        return (value, None)
+
+
+class SampleInsert:
+    """Insert statement for a single sample, prepared once per DB backend. It inserts
+    the sample only if its node exists, and ignores a conflicting sample of the same
+    node at the same timestamp."""
+
+    def __init__(self):
+        self._sql = {}
+        self.fields = [Sample._meta.get_field(name) for name in FIELDS]
+
+    def sql(self):
+        if connection.vendor not in self._sql:
+            quote_name = connection.ops.quote_name
+            columns = ", ".join(quote_name(field.column) for field in self.fields)
+            placeholders = ", ".join(["%s"] * len(self.fields))
+            node_pk = Node._meta.pk
+            self._sql[connection.vendor] = " ".join(
+                [
+                    connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+                    f"{quote_name(Sample._meta.db_table)} ({columns})",
+                    f"SELECT {placeholders}",
+                    "WHERE EXISTS (SELECT 1",
+                    f"FROM {quote_name(Node._meta.db_table)}",
+                    f"WHERE {quote_name(node_pk.column)} = %s)",
+                    connection.ops.on_conflict_suffix_sql(
+                        self.fields, OnConflict.IGNORE, None, None
+                    ),
+                ]
+            ).strip()
+        return self._sql[connection.vendor]
+
+    def to_sample(self, values):
+        return Sample(
+            **{field.attname: value for field, value in zip(self.fields, values)}
+        )
+
+    def execute(self, values):
+        """Insert the sample with the given field values. Return True if the sample was
+        stored."""
+        params = [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(self.fields, values)
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(self.sql(), params + params[:1])
+            return cursor.rowcount == 1
+
+
+sample_validator = SampleValidator()
+sample_insert = SampleInsert()
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ingest import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the throughput of the ingest endpoints on a synthetic fleet, in a "
+        "throw-away test database of the configured DBMS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--endpoint",
+            choices=benchmark.ENDPOINTS,
+            default="ingest",
+            help="Ingest endpoint to drive.",
+        )
+        parser.add_argument("--nodes", type=int, default=100, help="Fleet size.")
+        parser.add_argument(
+            "--samples", type=int, default=5000, help="Number of samples to ingest."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1, help="Number of concurrent clients."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Samples per request to the batch and binary endpoints.",
+        )
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.0,
+            help="Share of retransmitted duplicate samples, from 0 to 1.",
+        )
+        parser.add_argument(
+            "--public",
+            type=float,
+            default=0.0,
+            help="Share of public installations whose samples are published, from 0 to 1.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--json", action="store_true", help="Print the results as JSON."
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and options["concurrency"] > 1:
+            # SQLite allows a single writer at a time. Concurrent clients would fail
+            # with locked-database errors rather than measure the endpoint.
+            raise CommandError(
+                "SQLite does not support concurrent writers. Benchmark against "
+                "PostgreSQL for a --concurrency greater than 1."
+            )
+        old_name = connection.settings_dict["NAME"]
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if connection.vendor == "sqlite":
+                # An in-memory DB is not shared between concurrent clients.
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                    temp_dir, "benchmark.sqlite3"
+                )
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            try:
+                results = self.run_benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results))
+            return
+        for key, value in results.items():
+            self.stdout.write(f"{key:>20}: {value}")
+
+    def run_benchmark(self, options):
+        node_ids = benchmark.create_fleet(options["nodes"], options["public"])
+        samples = benchmark.generate_samples(
+            node_ids, options["samples"], options["duplicates"], options["seed"]
+        )
+        requests = benchmark.encode_requests(
+            options["endpoint"], samples, options["batch_size"]
+        )
+        if options["public"]:
+            with benchmark.publication_enabled():
+                results = benchmark.run(requests, options["concurrency"])
+        else:
+            results = benchmark.run(requests, options["concurrency"])
+        return {
+            "vendor": connection.vendor,
+            "endpoint": options["endpoint"],
+            "nodes": options["nodes"],
+            "duplicates": options["duplicates"],
+            "public": options["public"],
+            **results,
+        }
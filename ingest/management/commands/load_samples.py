@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ingest import bulkload
+
+
+class Command(BaseCommand):
+    help = (
+        "Load historical samples from a CSV, NDJSON, or binary file. Samples that "
+        "duplicate a stored sample of the same node and timestamp are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to load samples from.")
+        parser.add_argument(
+            "--format",
+            choices=bulkload.FORMATS,
+            help="Format of the file. Determined by the file extension by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of samples loaded in a single transaction.",
+        )
+        parser.add_argument(
+            "--no-statistics",
+            action="store_true",
+            help="Do not rebuild the statistics and rollups of the nodes loaded.",
+        )
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or bulkload.guess_format(options["path"])
+        if file_format is None:
+            raise CommandError("Cannot determine the file format, use --format.")
+        try:
+            file = open(options["path"], "rb")
+        except OSError as error:
+            raise CommandError(f"Cannot open {options['path']}: {error}")
+        with file:
+            totals, failures, spans = bulkload.load_samples(
+                bulkload.read_rows(file, file_format),
+                chunk_size=options["chunk_size"],
+                progress=self.report_progress,
+            )
+        for failure in failures:
+            self.stderr.write(
+                f"Line {failure['line']}: {json.dumps(failure['errors'], default=str)}"
+            )
+        if spans and not options["no_statistics"]:
+            self.stdout.write(f"Rebuilding the statistics of {len(spans)} nodes.")
+            bulkload.rebuild_statistics(spans)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {totals['inserted']} of {totals['read']} samples, skipped "
+                f"{totals['duplicates']} duplicates and {totals['invalid']} invalid "
+                "samples."
+            )
+        )
+
+    def report_progress(self, totals):
+        self.stdout.write(
+            f"Read {totals['read']} samples: {totals['inserted']} inserted, "
+            f"{totals['duplicates']} duplicates, {totals['invalid']} invalid."
+        )
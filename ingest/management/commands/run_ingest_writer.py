@@ -0,0 +1,37 @@
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ingest import writebehind
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Commit the samples queued in a shard of the Redis write-behind buffer, as a "
+        "dedicated writer process. Run one writer per shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shard", type=int, default=0, help="Shard to commit, from 0."
+        )
+
+    def handle(self, *args, **options):
+        if settings.INGEST_WRITE_BEHIND_BACKEND != writebehind.REDIS:
+            raise CommandError("Dedicated writers require the Redis backend.")
+        shard_count = settings.INGEST_WRITE_BEHIND_SHARDS
+        shard = options["shard"]
+        if not 0 <= shard < shard_count:
+            raise CommandError(f"The shard must be from 0 to {shard_count - 1}.")
+        buffer = writebehind.create_buffer(shard if shard_count > 1 else None)
+        # Finish the group commit in progress when the container is stopped.
+        signal.signal(signal.SIGTERM, lambda signum, frame: buffer.stop())
+        logger.info("Writer of shard %d of %d started.", shard, shard_count)
+        try:
+            buffer.run(publish_stats=True)
+        except KeyboardInterrupt:
+            buffer.stop()
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.3 on 2026-10-17 04:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("core", "0006_address_latitude_address_longitude"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirtyRangeCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("consumer", models.CharField(max_length=64, unique=True)),
+                ("position_s", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DirtyDay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("marked_s", models.PositiveIntegerField()),
+                (
+                    "node",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="core.node",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="dirtyday",
+            index=models.Index(
+                fields=["marked_s"], name="ingest_dirt_marked__b85189_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dirtyday",
+            constraint=models.UniqueConstraint(
+                fields=("node", "day"), name="unique_dirty_days_per_node"
+            ),
+        ),
+    ]
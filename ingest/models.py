@@ -1,3 +1,27 @@
 from django.db import models
 
-# Create your models here.
+from core.models import Node
+
+
+class DirtyDay(models.Model):
+    """A day of a node with samples ingested since the derived data of the day were
+    last refreshed. The day is marked anew on each ingestion. See ingest.dirty."""
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name="+")
+    day = models.DateField(null=False, blank=False)
+    marked_s = models.PositiveIntegerField(null=False, blank=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["node", "day"], name="unique_dirty_days_per_node"
+            ),
+        ]
+        indexes = [models.Index(fields=["marked_s"])]
+
+
+class DirtyRangeCursor(models.Model):
+    """Marking time up to which a consumer of dirty days has consumed them."""
+
+    consumer = models.CharField(max_length=64, unique=True)
+    position_s = models.PositiveIntegerField(default=0)
@@ -0,0 +1,51 @@
+import json
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework_json_api.parsers import JSONParser
+
+
+class BulkJSONParser(JSONParser):
+    """JSON:API parser for documents whose primary data is an array of resource
+    objects, as used for batch ingestion. Each resource object is parsed as if it was
+    sent individually. A resource object that could not be parsed is returned as a
+    `ParseError` in its place."""
+
+    def parse_data(self, result, parser_context):
+        if not isinstance(result, dict) or not isinstance(result.get("data"), list):
+            raise ParseError(
+                "Received document does not contain an array of primary data"
+            )
+        return [
+            self._parse_resource(resource, parser_context)
+            for resource in result["data"]
+        ]
+
+    def _parse_resource(self, resource, parser_context):
+        if not isinstance(resource, dict):
+            return ParseError("Malformed resource object: not a JSON object")
+        try:
+            return super().parse_data({"data": resource}, parser_context)
+        except APIException as error:
+            return ParseError(f"Malformed resource object: {error}")
+
+
+class NDJSONParser(JSONParser):
+    """Parser for newline-delimited JSON, where each line holds a single JSON:API
+    resource object. The request body is read incrementally: the parser returns an
+    iterator of `(line_number, resource)` tuples, where `resource` is a `ParseError`
+    if the line could not be parsed."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        return self._parse_lines(stream, parser_context)
+
+    def _parse_lines(self, stream, parser_context):
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                resource = json.loads(line)
+                yield line_number, self.parse_data({"data": resource}, parser_context)
+            except (ValueError, APIException) as error:
+                yield line_number, ParseError(f"Malformed resource object: {error}")
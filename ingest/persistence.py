@@ -0,0 +1,153 @@
+import logging
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.constants import OnConflict
+
+from core import coldstorage, rollups, statistics
+from core.models import Sample
+from core.node_registry import node_registry, violates_node_reference
+from . import dirty, tracing
+from .dedup import recent_samples
+
+logger = logging.getLogger(__name__)
+
+
+def _stored_keys(node_ids, timestamps):
+    return set(
+        Sample.objects.filter(
+            node__in=node_ids, timestamp_s__in=timestamps
+        ).values_list("node_id", "timestamp_s")
+    )
+
+
+def insert_samples(samples):
+    """Insert the given samples, skipping those that conflict with a stored sample of
+    the same node at the same timestamp. Return the samples actually inserted.
+
+    Where the DBMS supports it, each batch is inserted with a single
+    INSERT ... ON CONFLICT DO NOTHING RETURNING statement. Otherwise, the samples are
+    inserted one by one and the row count of each insert tells if it was stored.
+    """
+    if not samples:
+        return []
+    fields = [field for field in Sample._meta.concrete_fields if not field.db_returning]
+    quote_name = connection.ops.quote_name
+    node_id = Sample._meta.get_field("node").target_field.to_python
+    columns = ", ".join(quote_name(field.column) for field in fields)
+    row = f"({', '.join(['%s'] * len(fields))})"
+    prefix = (
+        f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} "
+        f"{quote_name(Sample._meta.db_table)} ({columns}) VALUES "
+    )
+    suffix = connection.ops.on_conflict_suffix_sql(
+        fields, OnConflict.IGNORE, None, None
+    )
+    returned_columns = ", ".join(
+        quote_name(Sample._meta.get_field(name).column)
+        for name in ("node", "timestamp_s")
+    )
+    returning = connection.features.can_return_rows_from_bulk_insert
+    batch_size = connection.ops.bulk_batch_size(fields, samples) if returning else 1
+    inserted_keys = set()
+    with connection.cursor() as cursor:
+        for offset in range(0, len(samples), batch_size):
+            batch = samples[offset : offset + batch_size]
+            params = [
+                field.get_db_prep_save(getattr(sample, field.attname), connection)
+                for sample in batch
+                for field in fields
+            ]
+            sql = f"{prefix}{', '.join([row] * len(batch))} {suffix}".strip()
+            if returning:
+                cursor.execute(f"{sql} RETURNING {returned_columns}", params)
+                inserted_keys.update(
+                    (node_id(node), timestamp_s)
+                    for node, timestamp_s in cursor.fetchall()
+                )
+            else:
+                cursor.execute(sql, params)
+                if cursor.rowcount == 1:
+                    inserted_keys.add((node_id(batch[0].node_id), batch[0].timestamp_s))
+    return [
+        sample
+        for sample in samples
+        if (node_id(sample.node_id), sample.timestamp_s) in inserted_keys
+    ]
+
+
+def store_samples(samples):
+    """Persist the given samples with a single multi-row insert.
+
+    A sample is skipped if its node already has a sample at the same timestamp, either
+    recently ingested, in the DB or its cold storage, or earlier in the given batch.
+    Return a list of flags that tells for each given sample whether it was stored. Only
+    the samples actually inserted are reported as stored and added to derived data, even
+    if a concurrent ingest inserted some of them between the check for duplicates and
+    the insert.
+    """
+    keys = [(sample.node_id, sample.timestamp_s) for sample in samples]
+    candidates = [
+        sample
+        for sample, key in zip(samples, keys)
+        if not recent_samples.contains(*key)
+    ]
+    if not candidates:
+        return [False] * len(samples)
+    node_ids = {sample.node_id for sample in candidates}
+    timestamps = {sample.timestamp_s for sample in candidates}
+    with transaction.atomic():
+        seen = _stored_keys(node_ids, timestamps)
+        seen.update(
+            coldstorage.packed_keys(
+                (sample.node_id, sample.timestamp_s) for sample in candidates
+            )
+        )
+        new_samples = []
+        for sample in candidates:
+            key = (sample.node_id, sample.timestamp_s)
+            if key not in seen:
+                seen.add(key)
+                new_samples.append(sample)
+        # Concurrent ingestion might have inserted some of the samples meanwhile.
+        # Skip these conflicts instead of failing the entire batch.
+        new_samples = insert_samples(new_samples)
+        if settings.INGEST_DIRTY_RANGES and new_samples:
+            dirty.get_tracker().mark(
+                (sample.node_id, sample.timestamp_s) for sample in new_samples
+            )
+        if settings.SAMPLE_ROLLUPS:
+            rollups.add_samples(new_samples)
+        if settings.SAMPLE_STATISTICS:
+            statistics.add_samples(new_samples)
+        transaction.on_commit(lambda: recent_samples.add(keys))
+        transaction.on_commit(lambda: tracing.record_commit(new_samples))
+    recent_samples.count_duplicates(len(candidates) - len(new_samples))
+    new_ids = {id(sample) for sample in new_samples}
+    stored = [id(sample) in new_ids for sample in samples]
+    logger.debug(
+        "Stored %d of %d samples in a single batch.", len(new_samples), len(samples)
+    )
+    return stored
+
+
+def store_registered_samples(samples):
+    """Persist the given samples like store_samples. If a node of the samples was
+    deleted meanwhile, evict the nodes of the samples from the node registry, and store
+    the samples of the nodes that still exist. Return a list of flags that tells for
+    each given sample whether it was stored, or None if its node does not exist."""
+    try:
+        return store_samples(samples)
+    except IntegrityError as error:
+        if not violates_node_reference(error):
+            raise
+    node_ids = {sample.node_id for sample in samples}
+    for node_id in node_ids:
+        node_registry.invalidate(node_id)
+    nodes = node_registry.get_many(node_ids)
+    logger.warning(
+        "Rejected the samples of %d deleted nodes.", len(node_ids) - len(nodes)
+    )
+    stored = iter(
+        store_samples([sample for sample in samples if sample.node_id in nodes])
+    )
+    return [next(stored) if sample.node_id in nodes else None for sample in samples]
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.installation_index import installation_index
+from . import tracing
+from .signals import publish_sample
+
+logger = logging.getLogger(__name__)
+
+
+def publish_if_public(sender, sample):
+    """Publish a signal for an incoming sample whose installation is public."""
+    installation = public_installation(sample)
+    if installation is None:
+        return
+    with tracing.stage("publish_dispatch"):
+        if settings.IOTDP_DEFERRED:
+            # Django-Q is installed only if publication is deferred.
+            from django_q.tasks import async_task
+
+            async_task(
+                "ingest.publication.send_publication", sender, sample, installation
+            )
+        else:
+            send_publication(sender, sample, installation)
+
+
+async def apublish_if_public(sender, sample):
+    """Publish a signal for an incoming sample whose installation is public, from an
+    async view. The receivers of the signal are called concurrently, each in a thread
+    of its own, such that the event loop is not blocked by their outbound requests."""
+    # The installation index is built from the DB on first use.
+    installation = await sync_to_async(public_installation)(sample)
+    if installation is None:
+        return
+    with tracing.stage("publish_dispatch"):
+        if settings.IOTDP_DEFERRED:
+            from django_q.tasks import async_task
+
+            await sync_to_async(async_task)(
+                "ingest.publication.send_publication", sender, sample, installation
+            )
+        else:
+            # Django 4.1 signals cannot be sent asynchronously. Call the receivers
+            # like Signal.send does, but concurrently.
+            await asyncio.gather(
+                *(
+                    sync_to_async(_call_receiver, thread_sensitive=False)(
+                        receiver, sender, sample, installation
+                    )
+                    for receiver in publish_sample._live_receivers(sender)
+                )
+            )
+
+
+def public_installation(sample):
+    """Return the installation of the sample if it is public, or else None."""
+    logger.debug(
+        "Examining publication of incoming sample from node %s", sample.node_id
+    )
+    with tracing.stage("installation_lookup"):
+        current_installation = installation_index.active(
+            sample.node_id, sample.timestamp_s
+        )
+    if len(current_installation) != 1 or not current_installation[0].is_public:
+        return None
+    logger.info(
+        "Publishing sample at timestamp %d fron node %s",
+        sample.timestamp_s,
+        sample.node_id,
+    )
+    return current_installation[0]
+
+
+def send_publication(sender, sample, installation):
+    """Signal the publication of the sample to the integrations. Executed by the
+    Django-Q cluster if publication is deferred."""
+    publish_sample.send(sender=sender, sample=sample, installation=installation)
+
+
+def _call_receiver(receiver, sender, sample, installation):
+    # Release the DB connection of the worker thread, like at the end of a request.
+    close_old_connections()
+    try:
+        return receiver(
+            signal=publish_sample,
+            sender=sender,
+            sample=sample,
+            installation=installation,
+        )
+    finally:
+        close_old_connections()
@@ -0,0 +1,174 @@
+"""Per-node rate limiting of sample ingestion.
+
+A malfunctioning or misconfigured node may send samples much more often than its
+regular sampling cadence and starve the ingest workers for the rest of the fleet. Each
+node therefore gets a token bucket that holds up to INGEST_RATE_LIMIT_BURST samples and
+refills at one sample per expected cadence of the node. The cadence is configured per
+node protocol, with a default for all other protocols. A sample that finds the bucket
+of its node empty is rejected before any DB work, together with the time after which
+the node may send again.
+
+The buckets are kept in the memory of each process, or in Redis to share them among
+all ingest processes.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# Bucket backends
+MEMORY = "memory"
+REDIS = "redis"
+
+
+class MemoryBuckets:
+    """Token buckets in the memory of the present process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst):
+        """Take a token from the bucket of the given key. Return 0 if there was one,
+        or else the time in seconds until the bucket holds a token again."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait_s = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait_s = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+        return wait_s
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBuckets:
+    """Token buckets shared by all ingest processes, in Redis hashes that expire once
+    they would be full again."""
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+        local tokens = tonumber(bucket[1]) or burst
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+        local wait_s = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait_s = (1 - tokens) / rate
+        end
+        redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+        redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait_s)
+    """
+
+    def __init__(self, key_prefix, connection):
+        self.key_prefix = key_prefix
+        self._take = connection.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        """Take a token from the bucket of the given key. Return 0 if there was one,
+        or else the time in seconds until the bucket holds a token again."""
+        return float(
+            self._take(
+                keys=[f"{self.key_prefix}:{key}"], args=[rate, burst, time.time()]
+            )
+        )
+
+    def clear(self):
+        pass
+
+
+class RateLimiter:
+    def __init__(self, buckets, cadence_s, protocol_cadences_s, burst):
+        self.buckets = buckets
+        self.cadence_s = cadence_s
+        self.protocol_cadences_s = protocol_cadences_s
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._throttled = Counter()
+
+    def check(self, node):
+        """Admit a sample of the given node. Return 0 if the sample is admitted, or
+        else the number of seconds after which the node may send again."""
+        cadence_s = self.protocol_cadences_s.get(
+            node.protocol.identifier, self.cadence_s
+        )
+        wait_s = self.buckets.take(node.id, 1 / cadence_s, self.burst)
+        if not wait_s:
+            return 0
+        with self._lock:
+            self._throttled[node.id] += 1
+            is_first = self._throttled[node.id] == 1
+        if is_first:
+            logger.warning(
+                "Throttling samples of node %s, which sends more often than every %s s.",
+                node.id,
+                cadence_s,
+            )
+        return math.ceil(wait_s)
+
+    def clear(self):
+        self.buckets.clear()
+        with self._lock:
+            self._throttled.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "throttled": sum(self._throttled.values()),
+                "nodes": {
+                    str(node_id): count
+                    for node_id, count in self._throttled.most_common()
+                },
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def create_limiter():
+    """Create a rate limiter as configured in the settings."""
+    backend = settings.INGEST_RATE_LIMIT_BACKEND
+    if backend == MEMORY:
+        buckets = MemoryBuckets()
+    elif backend == REDIS:
+        buckets = RedisBuckets(
+            settings.INGEST_RATE_LIMIT_REDIS_KEY,
+            redis.Redis(**settings.INGEST_RATE_LIMIT_REDIS),
+        )
+    else:
+        raise ImproperlyConfigured(f"Unknown rate limit backend {backend}.")
+    return RateLimiter(
+        buckets,
+        cadence_s=settings.INGEST_RATE_LIMIT_CADENCE_S,
+        protocol_cadences_s=settings.INGEST_RATE_LIMIT_PROTOCOL_CADENCE_S,
+        burst=settings.INGEST_RATE_LIMIT_BURST,
+    )
+
+
+def get_limiter():
+    """Return the rate limiter of the present process, created on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = create_limiter()
+        return _limiter
@@ -1,9 +1,31 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import relations
 from rest_framework_json_api import serializers
 
-from core.models import Sample
+from core.models import Node, Sample
+from core.node_registry import node_registry
+
+
+class _RegisteredPrimaryKeyField(relations.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        try:
+            node = node_registry.get(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if node is None:
+            self.fail("does_not_exist", pk_value=data)
+        return node
+
+
+class RegisteredNodeField(serializers.ResourceRelatedField, _RegisteredPrimaryKeyField):
+    """Node relationship resolved via the node registry instead of a DB query. The
+    resource identifier is checked by the ResourceRelatedField, the node ID is
+    resolved by the _RegisteredPrimaryKeyField that follows it in the MRO."""
 
 
 class SampleIngestSerializer(serializers.ModelSerializer):
+    node = RegisteredNodeField(queryset=Node.objects.all())
+
     class Meta:
         model = Sample
         fields = (
@@ -13,3 +35,10 @@ class SampleIngestSerializer(serializers.ModelSerializer):
             "temperature_celsius",
             "rel_humidity_percent",
         )
+        # Mirror the check constraints of the Sample model, such that a violation is
+        # reported as invalid input instead of failing the DB transaction.
+        extra_kwargs = {
+            "co2_ppm": {"max_value": 10000},
+            "temperature_celsius": {"min_value": -20, "max_value": 40},
+            "rel_humidity_percent": {"max_value": 100},
+        }
@@ -0,0 +1,271 @@
+"""Durable local spool of samples accepted while the DB is unreachable.
+
+If storing an ingested sample fails because the DB cannot be reached, the ingest view
+appends the sample to a spool file on local disk instead and acknowledges it. Appends
+are written right away, but synced to disk in groups: a request waits until an fsync
+covers its sample, and all requests that arrive during an fsync share the next one.
+For INGEST_SPOOL_RETRY_S after a failure, samples are spooled without trying the DB
+first, such that a DB outage does not slow down ingestion.
+
+A background thread of each process replays the spool in bulk once the DB is back.
+Each process appends to a segment file of its own, locked for as long as the process
+appends to it. Replay seals the segment of the present process, and takes over the
+sealed segments of all processes, including those left behind by crashed processes.
+Samples are replayed with the conflict-ignoring inserts of store_samples, such that a
+segment replayed twice after a crash does not duplicate samples. Samples of nodes
+deleted meanwhile are dropped. A segment whose replay still violates an integrity
+constraint is quarantined, renamed with QUARANTINE_SUFFIX, so it does not block the
+replay of the other segments.
+"""
+
+import atexit
+import fcntl
+import itertools
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections
+
+from core.models import Node
+from .persistence import store_samples
+from .publication import publish_if_public
+from .writebehind import decode_sample, encode_sample
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".spool"
+QUARANTINE_SUFFIX = ".quarantined"
+
+
+class Spool:
+    def __init__(self, directory, retry_s, replay_batch_size):
+        self.directory = directory
+        self.retry_s = retry_s
+        self.replay_batch_size = replay_batch_size
+        self._segment_ids = itertools.count()
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._segment = None
+        self._written = 0  # Number of samples written to the current segment.
+        self._synced = 0  # Number of samples of the current segment synced to disk.
+        self._bypass_until = 0
+        self._pending = threading.Event()
+        self._replay_lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "spooled": 0,
+            "replayed": 0,
+            "duplicates": 0,
+            "replays": 0,
+            "failed_replays": 0,
+            "dropped": 0,
+            "quarantined": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """Start the replay thread. Replay segments left behind right away."""
+        self._thread = threading.Thread(
+            target=self._run, name="ingest-spool-replay", daemon=True
+        )
+        self._pending.set()
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        with self._append_lock:
+            self._close_segment()
+
+    def is_bypassing(self):
+        """Return True if samples shall be spooled without trying the DB first."""
+        return time.monotonic() < self._bypass_until
+
+    def db_failed(self):
+        """Spool samples without trying the DB until INGEST_SPOOL_RETRY_S passed."""
+        self._bypass_until = time.monotonic() + self.retry_s
+
+    def append(self, samples):
+        """Append the samples to the spool, and return once they are synced to disk."""
+        with self._append_lock:
+            if self._segment is None:
+                self._open_segment()
+            segment = self._segment
+            segment.write("".join(encode_sample(sample) + "\n" for sample in samples))
+            segment.flush()
+            self._written += len(samples)
+            written = self._written
+        with self._sync_lock:
+            # Samples appended by other requests during the previous fsync are synced
+            # along with the present ones.
+            if segment is self._segment and self._synced < written:
+                # Samples are counted only once written, so this count is synced.
+                written = self._written
+                os.fsync(segment.fileno())
+                self._synced = written
+        self._count("spooled", len(samples))
+        self._pending.set()
+
+    def replay(self):
+        """Store the samples of all sealed segments. Return the number of samples
+        replayed. Raise a DatabaseError if the DB is still unreachable."""
+        with self._replay_lock:
+            with self._append_lock:
+                self._close_segment()
+            count = 0
+            for path in self.sealed_segments():
+                count += self._replay_segment(path)
+            if count:
+                logger.info("Replayed %d spooled samples.", count)
+            return count
+
+    def sealed_segments(self):
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(
+            {
+                "segments": len(self.sealed_segments()),
+                "bypassing": self.is_bypassing(),
+            }
+        )
+        return stats
+
+    def _open_segment(self):
+        name = f"{os.getpid()}-{time.time_ns()}-{next(self._segment_ids)}"
+        path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self._segment = open(path, "a", encoding="utf-8")
+        # Keep other processes from replaying the segment while appending to it.
+        fcntl.flock(self._segment, fcntl.LOCK_EX)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self._written = 0
+        self._synced = 0
+
+    def _close_segment(self):
+        if self._segment is not None:
+            with self._sync_lock:
+                os.fsync(self._segment.fileno())
+                self._segment.close()
+                self._segment = None
+
+    def _replay_segment(self, path):
+        try:
+            segment = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return 0  # Replayed by another process meanwhile.
+        with segment:
+            try:
+                fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # Another process appends to it or replays it.
+            count = 0
+            while True:
+                lines = list(itertools.islice(segment, self.replay_batch_size))
+                if not lines:
+                    break
+                samples = []
+                for line in lines:
+                    try:
+                        samples.append(decode_sample(line))
+                    except (ValueError, KeyError, TypeError):
+                        # The process crashed while writing the last sample.
+                        logger.warning("Skipping corrupt spooled sample %r.", line)
+                try:
+                    self._store(samples)
+                except IntegrityError as error:
+                    self._quarantine(path, error)
+                    return count
+                count += len(samples)
+            os.unlink(path)
+        return count
+
+    def _quarantine(self, path, error):
+        logger.error(
+            "Quarantined spool segment %s, which violates an integrity constraint: %s",
+            path,
+            error,
+        )
+        os.rename(path, path[: -len(SEGMENT_SUFFIX)] + QUARANTINE_SUFFIX)
+        self._count("quarantined")
+
+    def _store(self, samples):
+        close_old_connections()
+        node_ids = set(
+            Node.objects.filter(
+                pk__in={sample.node_id for sample in samples}
+            ).values_list("pk", flat=True)
+        )
+        known_samples = [sample for sample in samples if sample.node_id in node_ids]
+        if len(known_samples) < len(samples):
+            logger.warning(
+                "Dropping %d spooled samples of deleted nodes.",
+                len(samples) - len(known_samples),
+            )
+            self._count("dropped", len(samples) - len(known_samples))
+            samples = known_samples
+        stored = store_samples(samples)
+        self._count("replayed", stored.count(True))
+        self._count("duplicates", stored.count(False))
+        if settings.IOTDP_INTEGRATION:
+            for sample, is_stored in zip(samples, stored):
+                if is_stored:
+                    publish_if_public(self.__class__, sample)
+
+    def _count(self, key, count=1):
+        with self._stats_lock:
+            self._stats[key] += count
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # Give the DB some time to recover before the first attempt.
+            time.sleep(self.retry_s)
+            self._pending.clear()
+            try:
+                self._count("replays")
+                self.replay()
+            except DatabaseError as error:
+                logger.warning("Could not replay the spool yet: %s", error)
+                self._count("failed_replays")
+                self._pending.set()
+            except Exception:
+                logger.exception("Replay of the spool failed.")
+                self._count("failed_replays")
+                self._pending.set()
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def create_spool():
+    """Create a spool as configured in the settings."""
+    return Spool(
+        settings.INGEST_SPOOL_DIR,
+        retry_s=settings.INGEST_SPOOL_RETRY_S,
+        replay_batch_size=settings.INGEST_SPOOL_REPLAY_BATCH_SIZE,
+    )
+
+
+def get_spool():
+    """Return the spool of the present process, with its replay thread started on first
+    use."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = create_spool()
+            _spool.start()
+        return _spool
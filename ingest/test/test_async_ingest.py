@@ -0,0 +1,98 @@
+import json
+import threading
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.installation_index import installation_index
+from core.models import RoomNodeInstallation, Sample
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import recent_samples
+from ingest.signals import publish_sample
+from ingest.views import InternalAsyncSampleView
+from stadtpuls_integration.publisher import publish_to_stadtpuls
+from .test_lean_ingest import lean_sample
+
+
+class AsyncIngestTestCase(TestCase):
+    url = reverse("ingest-async")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+        cls.installation = RoomNodeInstallation.objects.create(
+            node=cls.node,
+            room=cls.test_data["room1"],
+            from_timestamp_s=0,
+            is_public=True,
+        )
+
+    def setUp(self):
+        recent_samples.clear()
+        node_registry.invalidate()
+        installation_index.invalidate()
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def test_view_is_async(self):
+        self.assertTrue(InternalAsyncSampleView.view_is_async)
+
+    async def test_ingest_sample(self):
+        """POST /ingest/v1/ingest/async/"""
+        data = json.dumps(lean_sample(self.node.id, 1000))
+        response = await self.async_client.post(
+            self.url, data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"status": "accepted"})
+        response = await self.async_client.post(
+            self.url, data, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "duplicate"})
+        self.assertEqual(await Sample.objects.filter(node=self.node).acount(), 1)
+
+    async def test_reject_invalid_samples(self):
+        for data, field in [
+            (lean_sample(self.node.id, 1000, co2_ppm=10001), "co2_ppm"),
+            (lean_sample("00000000-0000-0000-0000-000000000000", 1000), "node"),
+            ({"eui64": "0000000000000000", "timestamp_s": 1000}, "eui64"),
+        ]:
+            response = await self.async_client.post(
+                self.url, json.dumps(data), content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()["errors"]), [field])
+        self.assertEqual(await Sample.objects.acount(), 0)
+
+    @override_settings(IOTDP_INTEGRATION=1, IOTDP_DEFERRED=0)
+    def test_publish_concurrently(self):
+        """The receivers of the publication signal are called concurrently."""
+        barrier = threading.Barrier(2, timeout=5)
+        published = []
+
+        def receiver(sender, sample, installation, **kwargs):
+            barrier.wait()
+            published.append((sample.timestamp_s, installation.pk))
+
+        def other_receiver(sender, sample, installation, **kwargs):
+            barrier.wait()
+
+        publish_sample.disconnect(publish_to_stadtpuls)
+        publish_sample.connect(receiver)
+        publish_sample.connect(other_receiver)
+        try:
+            response = self.client.post(
+                self.url,
+                json.dumps(lean_sample(self.node.id, 1000)),
+                content_type="application/json",
+            )
+        finally:
+            publish_sample.disconnect(receiver)
+            publish_sample.disconnect(other_receiver)
+            publish_sample.connect(publish_to_stadtpuls)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(published, [(1000, self.installation.pk)])
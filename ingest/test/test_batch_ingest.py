@@ -0,0 +1,141 @@
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.installation_index import installation_index
+from core.models import Sample, SampleRollup, RoomNodeInstallation
+from core.test.utils import setup_basic_test_data
+from ingest.signals import publish_sample
+from stadtpuls_integration.publisher import publish_to_stadtpuls
+from .utils import sample_resource, create_sample
+
+
+class BatchIngestTestCase(APITestCase):
+    url = reverse("ingest-batch")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node_id = cls.test_data["node1"].id
+
+    def test_ingest_batch(self):
+        """POST /ingest/v1/ingest/batch/"""
+        batch = [sample_resource(self.node_id, ts) for ts in range(1000, 7000, 600)]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 10)
+        self.assertEqual(response.data["rejected"], 0)
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 10)
+
+    def test_skip_duplicates(self):
+        """Duplicates in the DB and within the batch are skipped individually."""
+        create_sample(self.test_data["node1"], 1000)
+        batch = [
+            sample_resource(self.node_id, 1000),
+            sample_resource(self.node_id, 1600),
+            sample_resource(self.node_id, 1600),
+        ]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 1)
+        self.assertEqual(response.data["rejected"], 2)
+        statuses = [item["status"] for item in response.data["items"]]
+        self.assertEqual(statuses, ["duplicate", "accepted", "duplicate"])
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 2)
+
+    @override_settings(SAMPLE_ROLLUPS=True)
+    def test_update_rollups(self):
+        """Stored samples are added to the rollups, duplicates are not."""
+        create_sample(self.test_data["node1"], 3600)
+        batch = [sample_resource(self.node_id, ts) for ts in range(3600, 9000, 600)]
+        self.client.post(self.url, data={"data": batch})
+        rollups = SampleRollup.objects.filter(
+            node=self.node_id, bucket=SampleRollup.HOUR
+        )
+        self.assertEqual(
+            list(rollups.values_list("start_s", "sample_count")),
+            [(3600, 5), (7200, 3)],
+        )
+
+    def test_reject_invalid_samples(self):
+        """Samples that violate the Sample constraints are rejected individually."""
+        batch = [
+            sample_resource(self.node_id, 1000, co2_ppm=10001),
+            sample_resource(self.node_id, 1600, temperature_celsius=41),
+            sample_resource(self.node_id, 2200, rel_humidity_percent=101),
+            sample_resource("00000000-0000-0000-0000-000000000000", 2800),
+            sample_resource(self.node_id, 3400),
+        ]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 1)
+        self.assertEqual(response.data["rejected"], 4)
+        statuses = [item["status"] for item in response.data["items"]]
+        self.assertEqual(statuses, ["invalid"] * 4 + ["accepted"])
+        self.assertIn("co2_ppm", response.data["items"][0]["errors"])
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 1)
+
+    def test_reject_malformed_resources(self):
+        """Resource objects that cannot be parsed are rejected individually."""
+        malformed = sample_resource(self.node_id, 1600)
+        malformed["type"] = "Node"
+        batch = [sample_resource(self.node_id, 1000), malformed, 42]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 1)
+        self.assertEqual(response.data["rejected"], 2)
+        statuses = [item["status"] for item in response.data["items"]]
+        self.assertEqual(statuses, ["accepted", "invalid", "invalid"])
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 1)
+
+    @override_settings(INGEST_MAX_BATCH_SIZE=2)
+    def test_reject_oversized_batch(self):
+        batch = [sample_resource(self.node_id, ts) for ts in range(1000, 2800, 600)]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Sample.objects.count(), 0)
+
+    def test_reject_single_resource(self):
+        response = self.client.post(
+            self.url, data={"data": sample_resource(self.node_id, 1000)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(IOTDP_INTEGRATION=1)
+class BatchIngestPublicationTestCase(APITestCase):
+    url = reverse("ingest-batch")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node_id = cls.test_data["node1"].id
+        cls.installation = RoomNodeInstallation.objects.create(
+            node=cls.test_data["node1"],
+            room=cls.test_data["room1"],
+            from_timestamp_s=1000,
+            to_timestamp_s=2000,
+            is_public=True,
+        )
+
+    def setUp(self):
+        installation_index.invalidate()
+        self.published = []
+        publish_sample.disconnect(publish_to_stadtpuls)
+        publish_sample.connect(self.record_publication)
+
+    def tearDown(self):
+        publish_sample.disconnect(self.record_publication)
+        publish_sample.connect(publish_to_stadtpuls)
+
+    def record_publication(self, sender, sample, installation, **kwargs):
+        self.published.append((sample.timestamp_s, installation.pk))
+
+    def test_publish_stored_samples_of_public_installations(self):
+        create_sample(self.test_data["node1"], 1000)
+        batch = [sample_resource(self.node_id, ts) for ts in (1000, 1600, 2200)]
+        response = self.client.post(self.url, data={"data": batch})
+        self.assertEqual(response.data["accepted"], 2)
+        # The duplicate is not published again, and the sample at 2200 lies outside
+        # of the installation.
+        self.assertEqual(self.published, [(1600, self.installation.pk)])
@@ -0,0 +1,37 @@
+import unittest
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from core.models import RoomNodeInstallation, Sample
+from ingest import benchmark
+
+
+class BenchmarkTestCase(TestCase):
+    def test_generate_workload(self):
+        node_ids = benchmark.create_fleet(4, public_share=0.5)
+        self.assertEqual(RoomNodeInstallation.objects.filter(is_public=True).count(), 2)
+        samples = benchmark.generate_samples(node_ids, 100, duplicate_share=0.2)
+        self.assertEqual(len(samples), 100)
+        self.assertLess(len(set(samples)), 100)
+        requests = benchmark.encode_requests("batch", samples, batch_size=30)
+        self.assertEqual([request[3] for request in requests], [30, 30, 30, 10])
+
+    def test_run(self):
+        node_ids = benchmark.create_fleet(4)
+        samples = benchmark.generate_samples(node_ids, 20)
+        for endpoint in benchmark.ENDPOINTS:
+            Sample.objects.all().delete()
+            requests = benchmark.encode_requests(endpoint, samples, batch_size=10)
+            with benchmark.publication_enabled():
+                results = benchmark.run(requests)
+            self.assertEqual(results["samples"], 20)
+            self.assertEqual(results["statuses"].get(500), None, endpoint)
+            self.assertEqual(Sample.objects.count(), 20, endpoint)
+            self.assertGreater(results["queries_per_sample"], 0)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_refuse_concurrent_clients_on_sqlite(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_ingest", "--concurrency", "2")
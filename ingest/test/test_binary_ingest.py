@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Sample
+from core.test.utils import setup_basic_test_data
+from ingest.binary import MEDIA_TYPE, RECORD, decode_samples, encode_sample
+from .utils import create_sample
+
+
+class BinaryEncodingTestCase(TestCase):
+    def test_round_trip(self):
+        node_id = "0094826d-4b12-2b94-d16c-af86a16f9cc3"
+        payload = encode_sample(node_id, 1000, 500, -0.5, 40) + encode_sample(
+            node_id, 1600, 600
+        )
+        self.assertEqual(len(payload), 2 * RECORD.size)
+        first, second = decode_samples(payload)
+        self.assertEqual(str(first["node"]), node_id)
+        self.assertEqual(first["temperature_celsius"], Decimal("-0.5"))
+        self.assertEqual(first["rel_humidity_percent"], 40)
+        self.assertIsNone(second["temperature_celsius"])
+        self.assertIsNone(second["rel_humidity_percent"])
+
+
+class BinaryIngestTestCase(TestCase):
+    url = reverse("ingest-binary")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def post(self, payload, content_type=MEDIA_TYPE):
+        return self.client.post(self.url, data=payload, content_type=content_type)
+
+    def test_ingest_binary(self):
+        """POST /ingest/v1/ingest/binary/"""
+        payload = b"".join(
+            encode_sample(self.node.id, ts, 500, 20.5, 40)
+            for ts in range(1000, 7000, 600)
+        )
+        response = self.post(payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["accepted"], 10)
+        sample = Sample.objects.filter(node=self.node).first()
+        self.assertEqual(sample.temperature_celsius, Decimal("20.5"))
+        self.assertEqual(sample.rel_humidity_percent, 40)
+
+    def test_reject_samples_individually(self):
+        create_sample(self.node, 1000)
+        payload = b"".join(
+            [
+                encode_sample(self.node.id, 1000, 500),
+                encode_sample(self.node.id, 1600, 10001),
+                encode_sample(self.node.id, 2200, 500, 45),
+                encode_sample("00000000-0000-0000-0000-000000000000", 2800, 500),
+                encode_sample(self.node.id, 3400, 500),
+            ]
+        )
+        response = self.post(payload)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["accepted"], 1)
+        self.assertEqual(result["duplicates"], 1)
+        self.assertEqual(result["invalid"], 3)
+        self.assertEqual([f["index"] for f in result["failures"]], [1, 2, 3])
+        self.assertEqual(list(result["failures"][2]["errors"]), ["node"])
+
+    def test_reject_truncated_payload(self):
+        response = self.post(encode_sample(self.node.id, 1000, 500)[:-1])
+        self.assertEqual(response.status_code, 400)
+
+    def test_reject_other_content_type(self):
+        payload = encode_sample(self.node.id, 1000, 500)
+        response = self.post(payload, content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 415)
+
+    @override_settings(INGEST_MAX_BATCH_SIZE=1)
+    def test_reject_oversized_batch(self):
+        payload = encode_sample(self.node.id, 1000, 500) * 2
+        self.assertEqual(self.post(payload).status_code, 400)
+        self.assertEqual(Sample.objects.count(), 0)
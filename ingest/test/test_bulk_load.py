@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core.models import NodeFidelity, Sample, SampleRollup
+from core.test.utils import setup_basic_test_data
+from ingest import binary, bulkload
+from .utils import create_sample
+
+
+class BulkLoadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+        cls.node2 = cls.test_data["node2"]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb" if isinstance(content, bytes) else "w") as file:
+            file.write(content)
+        return path
+
+    def load(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command("load_samples", path, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_load_csv(self):
+        path = self.write(
+            "samples.csv",
+            "node,eui64,timestamp_s,co2_ppm,temperature_celsius,rel_humidity_percent\n"
+            f"{self.node.id},,1000,500,20.5,40\n"
+            f",{self.node2.eui64},1000,600,,\n"
+            f"{self.node.id},,1600,10001,20.5,40\n"
+            f",0000000000000000,1600,500,20.5,40\n",
+        )
+        stdout, stderr = self.load(path, "--chunk-size", "2")
+        self.assertIn("Loaded 2 of 4 samples", stdout)
+        self.assertIn("Line 4: ", stderr)
+        self.assertIn("Line 5: ", stderr)
+        sample = Sample.objects.get(node=self.node)
+        self.assertEqual(sample.temperature_celsius, Decimal("20.5"))
+        sample = Sample.objects.get(node=self.node2)
+        self.assertEqual(sample.co2_ppm, 600)
+        self.assertIsNone(sample.temperature_celsius)
+
+    def test_load_ndjson(self):
+        create_sample(self.node, 1000)
+        lines = [
+            {"node": str(self.node.id), "timestamp_s": 1000, "co2_ppm": 700},
+            {"node": str(self.node.id), "timestamp_s": 1600, "co2_ppm": 700},
+            {"eui64": self.node.eui64, "timestamp_s": 1600, "co2_ppm": 800},
+            {
+                "eui64": self.node.eui64,
+                "timestamp_s": 2200,
+                "co2_ppm": 800,
+                "measurement_status": "R",
+            },
+        ]
+        path = self.write(
+            "samples.ndjson", "\n".join(map(json.dumps, lines)) + "\n[]\n"
+        )
+        stdout, stderr = self.load(path)
+        self.assertIn(
+            "Loaded 2 of 5 samples, skipped 2 duplicates and 1 invalid samples.", stdout
+        )
+        self.assertEqual(
+            list(Sample.objects.values_list("timestamp_s", "co2_ppm")),
+            [(1000, 500), (1600, 700), (2200, 800)],
+        )
+        self.assertEqual(
+            Sample.objects.get(timestamp_s=2200).measurement_status, Sample.REPLACEMENT
+        )
+
+    def test_load_binary(self):
+        path = self.write(
+            "samples.bin",
+            b"".join(
+                binary.encode_sample(self.node.id, 1000 + 600 * index, 500, 20.5, 40)
+                for index in range(25)
+            ),
+        )
+        stdout, _ = self.load(path, "--chunk-size", "10")
+        self.assertEqual(stdout.count("Read "), 3)
+        self.assertEqual(Sample.objects.count(), 25)
+
+    def test_rebuild_statistics(self):
+        path = self.write(
+            "samples.csv",
+            f"node,timestamp_s,co2_ppm\n{self.node.id},1000,500\n",
+        )
+        self.load(path)
+        fidelity = NodeFidelity.objects.get(node=self.node)
+        self.assertEqual(fidelity.last_contact_s, 1000)
+        self.assertEqual(fidelity.fidelity, NodeFidelity.DEAD)
+        self.assertFalse(NodeFidelity.objects.filter(node=self.node2).exists())
+
+    @override_settings(SAMPLE_ROLLUPS=True)
+    def test_rebuild_rollups(self):
+        create_sample(self.node, 3600)
+        path = self.write(
+            "samples.csv",
+            f"node,timestamp_s,co2_ppm\n{self.node.id},3600,900\n"
+            f"{self.node.id},4000,500\n",
+        )
+        self.load(path)
+        hour = SampleRollup.objects.get(node=self.node, bucket=SampleRollup.HOUR)
+        self.assertEqual(hour.sample_count, 2)
+        self.assertEqual(hour.last_timestamp_s, 4000)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL only")
+    def test_copy_loader(self):
+        create_sample(self.node, 1000)
+        rows = [
+            (1, {"node": self.node.id, "timestamp_s": ts, "co2_ppm": 600}, None)
+            for ts in (1000, 1600, 1600, 2200)
+        ]
+        totals, _, _ = bulkload.load_samples(rows, loader=bulkload.CopyLoader())
+        self.assertEqual((totals["inserted"], totals["duplicates"]), (2, 2))
+        self.assertEqual(Sample.objects.count(), 3)
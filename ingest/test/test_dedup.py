@@ -0,0 +1,112 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import RecentSamples, recent_samples
+from ingest.persistence import store_samples
+from .utils import create_sample, sample_resource
+
+
+class RecentSamplesTestCase(TestCase):
+    def test_evict_least_recently_used(self):
+        recent = RecentSamples(capacity=2)
+        recent.add([("a", 1), ("b", 1)])
+        self.assertTrue(recent.contains("a", 1))
+        recent.add([("c", 1)])
+        self.assertFalse(recent.contains("b", 1))
+        self.assertTrue(recent.contains("a", 1))
+        self.assertTrue(recent.contains("c", 1))
+        self.assertEqual(recent.stats()["suppressed"], 3)
+        self.assertEqual(recent.stats()["size"], 2)
+
+    def test_disabled(self):
+        recent = RecentSamples(capacity=0)
+        recent.add([("a", 1)])
+        self.assertFalse(recent.contains("a", 1))
+
+
+class DuplicateIngestTestCase(APITestCase):
+    url = reverse("ingest")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def setUp(self):
+        recent_samples.clear()
+        node_registry.invalidate()
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def test_duplicate_single_sample(self):
+        """A duplicate is acknowledged instead of failing with an IntegrityError."""
+        create_sample(self.node, 1000)
+        response = self.client.post(
+            self.url, data={"data": sample_resource(self.node.id, 1000)}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Sample.objects.count(), 1)
+        self.assertEqual(recent_samples.stats()["duplicates"], 1)
+
+    def test_suppress_retransmission(self):
+        data = {"data": sample_resource(self.node.id, 1000)}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data=data)
+        self.assertEqual(response.status_code, 201)
+        # The serializer resolves the node via the node registry.
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(recent_samples.stats()["suppressed"], 1)
+
+    def test_suppress_in_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            store_samples([Sample(node=self.node, timestamp_s=1000, co2_ppm=500)])
+        with self.assertNumQueries(0):
+            stored = store_samples(
+                [Sample(node=self.node, timestamp_s=1000, co2_ppm=500)]
+            )
+        self.assertEqual(stored, [False])
+
+    def test_report_concurrently_inserted_sample_as_duplicate(self):
+        """A sample inserted by a concurrent ingest after the check for duplicates is not
+        reported as stored."""
+        create_sample(self.node, 1000)
+        with mock.patch("ingest.persistence._stored_keys", return_value=set()):
+            stored = store_samples(
+                [
+                    Sample(node=self.node, timestamp_s=1000, co2_ppm=500),
+                    Sample(node=self.node, timestamp_s=2000, co2_ppm=500),
+                ]
+            )
+        self.assertEqual(stored, [False, True])
+        self.assertEqual(Sample.objects.count(), 2)
+        self.assertEqual(recent_samples.stats()["duplicates"], 1)
+
+    def test_suppress_lean_retransmission(self):
+        data = json.dumps(
+            {"node": str(self.node.id), "timestamp_s": 1000, "co2_ppm": 500}
+        )
+        url = reverse("ingest-lean")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(0):
+            response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "duplicate"})
+
+    def test_report_duplicates(self):
+        recent_samples.add([(self.node.id, 1000)])
+        recent_samples.contains(self.node.id, 1000)
+        response = self.client.get(reverse("ingest-duplicates"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["suppressed"], 1)
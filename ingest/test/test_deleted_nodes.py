@@ -0,0 +1,82 @@
+import json
+from unittest import mock
+
+from django.db import IntegrityError
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest import persistence
+from ingest.dedup import recent_samples
+from ingest.fastpath import sample_insert
+from .test_lean_ingest import lean_sample
+from .utils import sample_resource
+
+FOREIGN_KEY_VIOLATION = IntegrityError("FOREIGN KEY constraint failed")
+
+
+class DeletedNodeTestCase(APITestCase):
+    """Samples of a node deleted by another process while still in the node registry
+    of the present one."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+
+    def setUp(self):
+        node_registry.invalidate()
+        recent_samples.clear()
+        node = self.test_data["node2"]
+        self.deleted_id = node.id
+        node_registry.get(node.id)
+        with mock.patch.object(node_registry, "invalidate"):
+            node.delete()
+        self.addCleanup(node_registry.invalidate)
+
+    def store_samples(self, samples):
+        """Fail like the deferred foreign key constraint of the DB."""
+        if any(sample.node_id == self.deleted_id for sample in samples):
+            raise FOREIGN_KEY_VIOLATION
+        return self.store(samples)
+
+    def patch_store_samples(self):
+        self.store = persistence.store_samples
+        return mock.patch.object(persistence, "store_samples", self.store_samples)
+
+    def test_reject_sample(self):
+        with self.patch_store_samples():
+            response = self.client.post(
+                reverse("ingest"),
+                data={"data": sample_resource(self.deleted_id, 1000)},
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("object does not exist", response.content.decode())
+        with self.assertNumQueries(1):
+            self.assertIsNone(node_registry.get(self.deleted_id))
+
+    def test_reject_samples_of_batch(self):
+        node_id = self.test_data["node1"].id
+        batch = [sample_resource(self.deleted_id, 1000), sample_resource(node_id, 1000)]
+        with self.patch_store_samples():
+            response = self.client.post(reverse("ingest-batch"), data={"data": batch})
+        self.assertEqual(response.status_code, 200)
+        statuses = [item["status"] for item in response.data["items"]]
+        self.assertEqual(statuses, ["invalid", "accepted"])
+        self.assertIn("node", response.data["items"][0]["errors"])
+        self.assertEqual(Sample.objects.get().node_id, node_id)
+
+    def test_reject_lean_sample(self):
+        with mock.patch.object(
+            sample_insert, "execute", side_effect=FOREIGN_KEY_VIOLATION
+        ):
+            response = self.client.post(
+                reverse("ingest-lean"),
+                data=json.dumps(lean_sample(self.deleted_id, 1000)),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("node", response.json()["errors"])
+        with self.assertNumQueries(1):
+            self.assertIsNone(node_registry.get(self.deleted_id))
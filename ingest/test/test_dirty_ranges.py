@@ -0,0 +1,146 @@
+import json
+from datetime import date
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import RoomNodeInstallation, Sample
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import recent_samples
+from ingest.dirty import DirtyRangeTracker, create_tracker
+from ingest.models import DirtyDay
+from .test_lean_ingest import lean_sample
+from .utils import sample_resource
+
+# 2021-03-01T00:30:00 in Europe/Berlin, still February 28 in UTC.
+MARCH_1_S = 1614555000
+DAY_S = 24 * 3600
+
+
+@override_settings(INGEST_DIRTY_RANGES=True, INGEST_DIRTY_RANGES_CONSUME_LAG_S=60)
+class DirtyRangeTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node_id = cls.test_data["node1"].id
+
+    def setUp(self):
+        recent_samples.clear()
+        node_registry.invalidate()
+        self.tracker = create_tracker()
+        patcher = mock.patch("ingest.dirty.get_tracker", return_value=self.tracker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def post_batch(self, samples):
+        return self.client.post(reverse("ingest-batch"), data={"data": samples})
+
+    def consume(self, consumer="test", after_s=61):
+        """Consume the dirty days as if after_s seconds passed."""
+        now_s = self.tracker_time() + after_s
+        with mock.patch("ingest.dirty.time.time", return_value=now_s):
+            with self.tracker.consume(consumer) as days:
+                return days
+
+    def tracker_time(self):
+        return max(DirtyDay.objects.values_list("marked_s", flat=True), default=0)
+
+    def test_day_buckets(self):
+        self.assertEqual(self.tracker.day_of(MARCH_1_S), date(2021, 3, 1))
+        self.assertEqual(self.tracker.day_of(MARCH_1_S - 3600), date(2021, 2, 28))
+        from_s, to_s = self.tracker.day_slice(date(2021, 3, 1))
+        self.assertEqual(from_s, MARCH_1_S - 1800)
+        self.assertEqual(to_s, from_s + DAY_S)
+
+    def test_mark_ingested_days(self):
+        response = self.post_batch(
+            [
+                sample_resource(self.node_id, MARCH_1_S),
+                sample_resource(self.node_id, MARCH_1_S + 600),
+                sample_resource(self.node_id, MARCH_1_S - 3600),
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.client.post(
+            reverse("ingest-lean"),
+            data=json.dumps(lean_sample(self.node_id, MARCH_1_S + 5 * DAY_S)),
+            content_type="application/json",
+        )
+        self.assertEqual(
+            self.consume(),
+            {
+                self.node_id: {
+                    date(2021, 2, 28),
+                    date(2021, 3, 1),
+                    date(2021, 3, 6),
+                }
+            },
+        )
+
+    def test_mark_in_transaction_of_lean_insert(self):
+        with mock.patch.object(self.tracker, "mark", side_effect=DatabaseError("down")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(
+                    reverse("ingest-lean"),
+                    data=json.dumps(lean_sample(self.node_id, MARCH_1_S)),
+                    content_type="application/json",
+                )
+        # The sample is not stored without its dirty day.
+        self.assertFalse(Sample.objects.exists())
+
+    def test_consume_once_per_consumer(self):
+        self.tracker.mark([(self.node_id, MARCH_1_S)])
+        # Days marked within the consume lag are left for later.
+        self.assertEqual(self.consume(after_s=10), {})
+        self.assertEqual(self.consume(), {self.node_id: {date(2021, 3, 1)}})
+        self.assertEqual(self.consume(), {})
+        self.assertEqual(
+            self.consume(consumer="other"), {self.node_id: {date(2021, 3, 1)}}
+        )
+
+    def test_keep_cursor_on_failure(self):
+        self.tracker.mark([(self.node_id, MARCH_1_S)])
+        with self.assertRaises(RuntimeError):
+            with mock.patch("ingest.dirty.time.time", return_value=10**10):
+                with self.tracker.consume("test"):
+                    raise RuntimeError()
+        self.assertEqual(self.consume(), {self.node_id: {date(2021, 3, 1)}})
+
+    def test_suppress_repeated_marks(self):
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.tracker.mark([(self.node_id, MARCH_1_S)])
+        with self.assertNumQueries(0):
+            self.tracker.mark([(self.node_id, MARCH_1_S + 600)])
+        with self.assertNumQueries(1):
+            self.tracker.mark([(self.node_id, MARCH_1_S + DAY_S)])
+        self.assertEqual(DirtyDay.objects.count(), 2)
+        self.assertEqual(self.tracker.stats()["suppressed"], 1)
+
+    def test_affected_rooms(self):
+        room = self.test_data["room1"]
+        RoomNodeInstallation.objects.create(
+            node_id=self.node_id, room=room, from_timestamp_s=MARCH_1_S
+        )
+        rooms = self.tracker.rooms(
+            {self.node_id: {date(2021, 2, 27), date(2021, 3, 1), date(2021, 3, 2)}}
+        )
+        self.assertEqual(rooms, {room.id: {date(2021, 3, 1), date(2021, 3, 2)}})
+
+    def test_lag_must_exceed_mark_interval(self):
+        with self.assertRaises(ImproperlyConfigured):
+            DirtyRangeTracker("UTC", 60, 60, 35, 100)
+
+    def test_status(self):
+        self.tracker.mark([(self.node_id, MARCH_1_S)])
+        response = self.client.get(reverse("ingest-dirty-ranges"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["enabled"])
+        self.assertEqual(response.data["days"], 1)
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Set up Django with the ingest-only profile, resolve an ingest URL, and report which
+# of the heavyweight modules were imported.
+PROBE = """
+import json, sys
+import django
+django.setup()
+from django.urls import resolve
+resolve("/ingest/v1/ingest/lean/")
+modules = ("pandas", "numpy", "allauth", "dj_rest_auth", "drf_spectacular", "core.views")
+print(json.dumps([module for module in modules if module in sys.modules]))
+"""
+
+
+class IngestProfileTestCase(SimpleTestCase):
+    def test_minimal_imports(self):
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": "managair_server.settings_ingest",
+            "DJANGO_ALLOWED_HOSTS": "localhost",
+            "SECRET_KEY": "ingest-profile-test",
+        }
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
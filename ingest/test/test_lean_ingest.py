@@ -0,0 +1,184 @@
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import NodeStatistics, Sample, SampleRollup
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest.fastpath import sample_validator
+from .utils import create_sample
+
+
+def lean_sample(
+    node_id, timestamp_s, co2_ppm=500, temperature_celsius=20.5, rel_humidity_percent=40
+):
+    return {
+        "node": str(node_id),
+        "timestamp_s": timestamp_s,
+        "co2_ppm": co2_ppm,
+        "temperature_celsius": temperature_celsius,
+        "rel_humidity_percent": rel_humidity_percent,
+    }
+
+
+class LeanIngestTestCase(TestCase):
+    url = reverse("ingest-lean")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node_id = cls.test_data["node1"].id
+
+    def post(self, data):
+        return self.client.post(self.url, data=data, content_type="application/json")
+
+    def test_ingest_sample(self):
+        """POST /ingest/v1/ingest/lean/"""
+        timestamp_s = int(time.time())
+        # Samples of the present month cannot be in cold storage, which is not queried.
+        with self.assertNumQueries(1):
+            response = self.post(lean_sample(self.node_id, timestamp_s))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"status": "accepted"})
+        sample = Sample.objects.get(node=self.node_id)
+        self.assertEqual(sample.timestamp_s, timestamp_s)
+        self.assertEqual(sample.temperature_celsius, Decimal("20.5"))
+        self.assertEqual(sample.measurement_status, Sample.MEASUREMENT)
+
+    def test_optional_fields(self):
+        data = lean_sample(self.node_id, 1000)
+        del data["temperature_celsius"]
+        data["rel_humidity_percent"] = None
+        response = self.post(data)
+        self.assertEqual(response.status_code, 201)
+        sample = Sample.objects.get(node=self.node_id)
+        self.assertIsNone(sample.temperature_celsius)
+        self.assertIsNone(sample.rel_humidity_percent)
+
+    def test_duplicate(self):
+        create_sample(self.test_data["node1"], 1000)
+        response = self.post(lean_sample(self.node_id, 1000, co2_ppm=600))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "duplicate"})
+        self.assertEqual(Sample.objects.get(node=self.node_id).co2_ppm, 500)
+
+    @override_settings(SAMPLE_ROLLUPS=True)
+    def test_update_rollups(self):
+        self.post(lean_sample(self.node_id, 3600, co2_ppm=500))
+        self.post(lean_sample(self.node_id, 3660, co2_ppm=700))
+        self.post(lean_sample(self.node_id, 3660, co2_ppm=900))
+        hour = SampleRollup.objects.get(node=self.node_id, bucket=SampleRollup.HOUR)
+        self.assertEqual(hour.start_s, 3600)
+        self.assertEqual(hour.sample_count, 2)
+        self.assertEqual(hour.co2_ppm_max, 700)
+        self.assertEqual(hour.temperature_celsius_mean, Decimal("20.5"))
+
+    @override_settings(SAMPLE_ROLLUPS=True)
+    def test_update_rollups_in_transaction_of_insert(self):
+        with mock.patch(
+            "ingest.views.rollups.add_rows", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.post(lean_sample(self.node_id, 3600))
+        self.assertFalse(Sample.objects.exists())
+
+    @override_settings(SAMPLE_STATISTICS=True)
+    def test_update_statistics(self):
+        self.post(lean_sample(self.node_id, 2000, co2_ppm=700))
+        self.post(lean_sample(self.node_id, 1000, co2_ppm=500))
+        self.post(lean_sample(self.node_id, 1000, co2_ppm=900))
+        statistics = NodeStatistics.objects.get(node=self.node_id)
+        self.assertEqual(statistics.sample_count, 2)
+        self.assertEqual(statistics.first_timestamp_s, 1000)
+        self.assertEqual(statistics.latest_sample.co2_ppm, 700)
+        self.assertEqual(statistics.latest_sample.temperature_celsius, Decimal("20.5"))
+
+    @override_settings(SAMPLE_STATISTICS=True)
+    def test_update_statistics_in_transaction_of_insert(self):
+        with mock.patch(
+            "ingest.views.statistics.add_rows", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                self.post(lean_sample(self.node_id, 1000))
+        self.assertFalse(Sample.objects.exists())
+
+    def test_unknown_node(self):
+        response = self.post(lean_sample("00000000-0000-0000-0000-000000000000", 1000))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("node", response.json()["errors"])
+        self.assertEqual(Sample.objects.count(), 0)
+
+    def test_ingest_by_eui64(self):
+        node_registry.invalidate()
+        timestamp_s = int(time.time())
+        data = lean_sample(self.node_id, timestamp_s)
+        del data["node"]
+        data["eui64"] = self.test_data["node1"].eui64
+        response = self.post(data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Sample.objects.get(node=self.node_id).timestamp_s, timestamp_s
+        )
+        # The node of the EUI-64 is registered.
+        data["timestamp_s"] = timestamp_s + 1
+        with self.assertNumQueries(1):
+            response = self.post(data)
+        self.assertEqual(response.status_code, 201)
+        data["eui64"] = "0000000000000000"
+        response = self.post(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("eui64", response.json()["errors"])
+
+    def test_reject_invalid_samples(self):
+        for data, field in [
+            (lean_sample(self.node_id, 1000, co2_ppm=10001), "co2_ppm"),
+            (lean_sample(self.node_id, 1000, co2_ppm="500"), "co2_ppm"),
+            (
+                lean_sample(self.node_id, 1000, temperature_celsius=40.1),
+                "temperature_celsius",
+            ),
+            (
+                lean_sample(self.node_id, 1000, temperature_celsius=20.55),
+                "temperature_celsius",
+            ),
+            (
+                lean_sample(self.node_id, 1000, rel_humidity_percent=101),
+                "rel_humidity_percent",
+            ),
+            (lean_sample(self.node_id, -1), "timestamp_s"),
+            (lean_sample("node-1", 1000), "node"),
+        ]:
+            response = self.post(data)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()["errors"]), [field])
+        response = self.post([lean_sample(self.node_id, 1000)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Sample.objects.count(), 0)
+
+    def test_validator_matches_constraints(self):
+        """The validator accepts a value exactly if the DB accepts it."""
+        timestamp_s = 1000
+        for field, values in [
+            ("co2_ppm", [10000, 10001]),
+            ("temperature_celsius", [-20.1, -20, 40, 40.1]),
+            ("rel_humidity_percent", [100, 101]),
+        ]:
+            for value in values:
+                timestamp_s += 600
+                data = lean_sample(self.node_id, timestamp_s, **{field: value})
+                _, errors = sample_validator.validate(data)
+                try:
+                    with transaction.atomic():
+                        Sample.objects.create(
+                            node=self.test_data["node1"],
+                            timestamp_s=timestamp_s,
+                            **{"co2_ppm": 500, field: value},
+                        )
+                    is_stored = True
+                except IntegrityError:
+                    is_stored = False
+                self.assertEqual(not errors, is_stored, (field, value))
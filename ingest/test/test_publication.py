@@ -0,0 +1,51 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from core.installation_index import installation_index
+from core.models import RoomNodeInstallation, Sample
+from core.test.utils import setup_basic_test_data
+from ingest.publication import publish_if_public, send_publication
+from ingest.signals import publish_sample
+from stadtpuls_integration.publisher import publish_to_stadtpuls
+
+
+@override_settings(IOTDP_INTEGRATION=1, IOTDP_DEFERRED=1)
+class DeferredPublicationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.installation = RoomNodeInstallation.objects.create(
+            node=cls.test_data["node1"],
+            room=cls.test_data["room1"],
+            from_timestamp_s=1000,
+            is_public=True,
+        )
+
+    def setUp(self):
+        installation_index.invalidate()
+        self.published = []
+        publish_sample.disconnect(publish_to_stadtpuls)
+        publish_sample.connect(self.record_publication)
+
+    def tearDown(self):
+        publish_sample.disconnect(self.record_publication)
+        publish_sample.connect(publish_to_stadtpuls)
+
+    def record_publication(self, sender, sample, installation, **kwargs):
+        self.published.append((sample.timestamp_s, installation.pk))
+
+    def test_hand_over_to_task_queue(self):
+        sample = Sample(node=self.test_data["node1"], timestamp_s=1600, co2_ppm=500)
+        with mock.patch("django_q.tasks.async_task") as async_task:
+            publish_if_public(self.__class__, sample)
+        self.assertEqual(self.published, [])
+        async_task.assert_called_once_with(
+            "ingest.publication.send_publication",
+            self.__class__,
+            sample,
+            self.installation,
+        )
+        # Execute the task as the Django-Q cluster would.
+        send_publication(*async_task.call_args.args[1:])
+        self.assertEqual(self.published, [(1600, self.installation.pk)])
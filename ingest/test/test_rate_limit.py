@@ -0,0 +1,118 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.node_registry import node_registry
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import recent_samples
+from ingest.ratelimit import MemoryBuckets, create_limiter
+from .test_lean_ingest import lean_sample
+from .utils import sample_resource
+
+
+class MemoryBucketsTestCase(SimpleTestCase):
+    @mock.patch("ingest.ratelimit.time.monotonic")
+    def test_refill(self, monotonic):
+        buckets = MemoryBuckets()
+        monotonic.return_value = 1000.0
+        self.assertEqual(buckets.take("a", rate=0.1, burst=2), 0)
+        self.assertEqual(buckets.take("a", rate=0.1, burst=2), 0)
+        self.assertAlmostEqual(buckets.take("a", rate=0.1, burst=2), 10)
+        self.assertEqual(buckets.take("b", rate=0.1, burst=2), 0)
+        monotonic.return_value = 1004.0
+        self.assertAlmostEqual(buckets.take("a", rate=0.1, burst=2), 6)
+        monotonic.return_value = 1010.0
+        self.assertEqual(buckets.take("a", rate=0.1, burst=2), 0)
+        # The bucket holds no more than the burst.
+        monotonic.return_value = 2000.0
+        self.assertEqual(buckets.take("a", rate=0.1, burst=2), 0)
+        self.assertEqual(buckets.take("a", rate=0.1, burst=2), 0)
+        self.assertGreater(buckets.take("a", rate=0.1, burst=2), 0)
+
+
+@override_settings(
+    INGEST_RATE_LIMIT=True,
+    INGEST_RATE_LIMIT_CADENCE_S=600,
+    INGEST_RATE_LIMIT_PROTOCOL_CADENCE_S={"FAST": 1},
+    INGEST_RATE_LIMIT_BURST=2,
+)
+class RateLimitIngestTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def setUp(self):
+        recent_samples.clear()
+        node_registry.invalidate()
+        self.limiter = create_limiter()
+        patcher = mock.patch("ingest.ratelimit.get_limiter", return_value=self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def test_throttle_node(self):
+        url = reverse("ingest")
+        for timestamp_s in (1000, 1010):
+            response = self.client.post(
+                url, data={"data": sample_resource(self.node.id, timestamp_s)}
+            )
+            self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                url, data={"data": sample_resource(self.node.id, 1020)}
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response["Retry-After"]) <= 600)
+        self.assertEqual(Sample.objects.count(), 2)
+        # Other nodes are not affected.
+        node2 = self.test_data["node2"]
+        response = self.client.post(url, data={"data": sample_resource(node2.id, 1020)})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(reverse("ingest-throttled"))
+        self.assertEqual(
+            response.data,
+            {"enabled": True, "throttled": 1, "nodes": {str(self.node.id): 1}},
+        )
+
+    def test_throttle_lean(self):
+        url = reverse("ingest-lean")
+        for timestamp_s, status in [(1000, 201), (1010, 201), (1020, 429)]:
+            response = self.client.post(
+                url,
+                json.dumps(lean_sample(self.node.id, timestamp_s)),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, status)
+        self.assertEqual(response.json(), {"status": "throttled"})
+        self.assertIn("Retry-After", response)
+
+    def test_retransmission_not_throttled(self):
+        """Duplicates suppressed from memory do not count towards the limit."""
+        data = {"data": sample_resource(self.node.id, 1000)}
+        for status in (201, 200, 200, 200):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("ingest"), data=data)
+            self.assertEqual(response.status_code, status)
+        self.assertEqual(self.limiter.stats()["throttled"], 0)
+
+    def test_protocol_cadence(self):
+        protocol = self.node.protocol
+        protocol.identifier = "FAST"
+        protocol.save()
+        node_registry.invalidate()
+        with mock.patch("ingest.ratelimit.time.monotonic") as monotonic:
+            for step in range(5):
+                monotonic.return_value = 1000.0 + step
+                response = self.client.post(
+                    reverse("ingest"),
+                    data={"data": sample_resource(self.node.id, 1000 + step)},
+                )
+                self.assertEqual(response.status_code, 201)
@@ -0,0 +1,164 @@
+import fcntl
+import os
+import tempfile
+import uuid
+from unittest import mock
+
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import recent_samples
+from ingest.spool import QUARANTINE_SUFFIX, Spool
+from .utils import sample_resource
+
+
+class SpoolTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def setUp(self):
+        recent_samples.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory.name, retry_s=10, replay_batch_size=2)
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def sample(self, timestamp_s):
+        return Sample(node_id=self.node.id, timestamp_s=timestamp_s, co2_ppm=500)
+
+    def test_replay(self):
+        self.spool.append([self.sample(1000), self.sample(1600)])
+        self.spool.append([self.sample(2200)])
+        self.assertEqual(self.spool.stats()["spooled"], 3)
+        self.assertEqual(self.spool.replay(), 3)
+        self.assertEqual(
+            list(Sample.objects.values_list("timestamp_s", flat=True)),
+            [1000, 1600, 2200],
+        )
+        self.assertEqual(self.spool.sealed_segments(), [])
+        # Appending after a replay starts a new segment.
+        self.spool.append([self.sample(2800)])
+        self.assertEqual(len(self.spool.sealed_segments()), 1)
+
+    def test_replay_idempotent(self):
+        """Samples replayed before, like after a crash during replay, are skipped."""
+        Sample.objects.create(node=self.node, timestamp_s=1000, co2_ppm=500)
+        self.spool.append([self.sample(1000), self.sample(1600)])
+        self.spool.replay()
+        self.assertEqual(Sample.objects.count(), 2)
+        stats = self.spool.stats()
+        self.assertEqual((stats["replayed"], stats["duplicates"]), (1, 1))
+
+    def test_skip_corrupt_sample(self):
+        self.spool.append([self.sample(1000)])
+        self.spool.close()
+        with open(self.spool.sealed_segments()[0], "a") as segment:
+            segment.write('{"node_id": "')
+        self.assertEqual(self.spool.replay(), 1)
+        self.assertEqual(Sample.objects.count(), 1)
+
+    def test_skip_segment_in_use(self):
+        """Segments locked by processes appending to them are not replayed."""
+        path = os.path.join(self.spool.directory, "0-0-0.spool")
+        with open(path, "a") as segment:
+            fcntl.flock(segment, fcntl.LOCK_EX)
+            self.assertEqual(self.spool.replay(), 0)
+        self.assertTrue(os.path.exists(path))
+
+    def test_keep_segment_if_db_unreachable(self):
+        self.spool.append([self.sample(1000)])
+        with mock.patch(
+            "ingest.spool.store_samples", side_effect=OperationalError("down")
+        ):
+            with self.assertRaises(OperationalError):
+                self.spool.replay()
+        self.assertEqual(len(self.spool.sealed_segments()), 1)
+        self.spool.replay()
+        self.assertEqual(Sample.objects.count(), 1)
+
+    def test_drop_samples_of_deleted_nodes(self):
+        deleted = Sample(node_id=uuid.uuid4(), timestamp_s=1000, co2_ppm=500)
+        self.spool.append([deleted, self.sample(1000)])
+        self.spool.replay()
+        self.assertEqual(Sample.objects.get().node_id, self.node.id)
+        self.assertEqual(self.spool.stats()["dropped"], 1)
+        self.assertEqual(self.spool.sealed_segments(), [])
+
+    def test_quarantine_segment_violating_constraints(self):
+        self.spool.append([self.sample(1000)])
+        self.spool.close()
+        self.spool.append([self.sample(1600)])
+        with mock.patch(
+            "ingest.spool.store_samples",
+            side_effect=[IntegrityError("violation"), [True]],
+        ):
+            self.spool.replay()
+        self.assertEqual(self.spool.sealed_segments(), [])
+        quarantined = [
+            name
+            for name in os.listdir(self.spool.directory)
+            if name.endswith(QUARANTINE_SUFFIX)
+        ]
+        self.assertEqual(len(quarantined), 1)
+        self.assertEqual(self.spool.stats()["quarantined"], 1)
+
+
+@override_settings(INGEST_SPOOL=True)
+class SpoolIngestTestCase(APITestCase):
+    url = reverse("ingest")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def setUp(self):
+        recent_samples.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory.name, retry_s=10, replay_batch_size=500)
+        patcher = mock.patch("ingest.spool.get_spool", return_value=self.spool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        recent_samples.clear()
+
+    def test_spool_while_db_unreachable(self):
+        with mock.patch(
+            "ingest.views.InternalSampleView.perform_create",
+            side_effect=OperationalError("down"),
+        ) as perform_create:
+            for timestamp_s in (1000, 1600):
+                response = self.client.post(
+                    self.url, data={"data": sample_resource(self.node.id, timestamp_s)}
+                )
+                self.assertEqual(response.status_code, 202)
+            # Once the DB failed, samples are spooled without trying the DB first.
+            self.assertEqual(perform_create.call_count, 1)
+        self.assertEqual(Sample.objects.count(), 0)
+        response = self.client.get(reverse("ingest-spool"))
+        self.assertEqual(response.data["spooled"], 2)
+        self.assertTrue(response.data["bypassing"])
+
+        self.spool.replay()
+        self.assertEqual(Sample.objects.count(), 2)
+
+    @override_settings(INGEST_SPOOL=False)
+    def test_disabled(self):
+        with mock.patch(
+            "ingest.views.InternalSampleView.perform_create",
+            side_effect=OperationalError("down"),
+        ):
+            with self.assertRaises(OperationalError):
+                self.client.post(
+                    self.url, data={"data": sample_resource(self.node.id, 1000)}
+                )
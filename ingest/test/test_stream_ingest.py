@@ -0,0 +1,62 @@
+import json
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.test.utils import setup_basic_test_data
+from .utils import sample_resource, create_sample
+
+
+@override_settings(INGEST_STREAM_CHUNK_SIZE=4)
+class StreamIngestTestCase(APITestCase):
+    url = reverse("ingest-stream")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node_id = cls.test_data["node1"].id
+
+    def post_lines(self, lines):
+        body = "\n".join(lines) + "\n"
+        response = self.client.post(
+            self.url, data=body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_stream_in_chunks(self):
+        """POST /ingest/v1/ingest/stream/"""
+        lines = [
+            json.dumps(sample_resource(self.node_id, ts))
+            for ts in range(1000, 7000, 600)
+        ]
+        progress = self.post_lines(lines)
+        self.assertEqual([chunk["chunk"] for chunk in progress], [1, 2, 3])
+        self.assertEqual([chunk["accepted"] for chunk in progress], [4, 4, 2])
+        self.assertEqual(progress[-1]["to_line"], 10)
+        self.assertEqual(progress[-1]["total_accepted"], 10)
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 10)
+
+    def test_report_failures_per_chunk(self):
+        create_sample(self.test_data["node1"], 1000)
+        lines = [
+            json.dumps(sample_resource(self.node_id, 1000)),
+            "{not json",
+            "",
+            json.dumps(sample_resource(self.node_id, 1600, co2_ppm=20000)),
+            json.dumps(sample_resource(self.node_id, 2200)),
+            json.dumps(sample_resource(self.node_id, 2800)),
+        ]
+        progress = self.post_lines(lines)
+        self.assertEqual(len(progress), 2)
+        first, second = progress
+        self.assertEqual(first["accepted"], 1)
+        self.assertEqual(first["duplicates"], 1)
+        self.assertEqual([failure["line"] for failure in first["failures"]], [2, 4])
+        self.assertEqual(second["accepted"], 1)
+        self.assertEqual(second["total_accepted"], 2)
+        self.assertEqual(second["total_rejected"], 3)
+        self.assertEqual(Sample.objects.filter(node=self.node_id).count(), 3)
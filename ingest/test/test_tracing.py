@@ -0,0 +1,92 @@
+import time
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.installation_index import installation_index
+from core.models import RoomNodeInstallation
+from core.test.utils import setup_basic_test_data
+from ingest.dedup import recent_samples
+from ingest.signals import publish_sample
+from ingest.tracing import Histogram, registry, traced
+from stadtpuls_integration.publisher import publish_to_stadtpuls
+from .utils import sample_resource
+
+
+class HistogramTestCase(TestCase):
+    def test_buckets(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 20):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative_counts()), [2, 3, 4])
+        self.assertEqual(histogram.sum, 26.5)
+        self.assertEqual(histogram.count, 4)
+
+
+@traced("receiver.record")
+def record_publication(sender, **kwargs):
+    pass
+
+
+@override_settings(IOTDP_INTEGRATION=1, IOTDP_DEFERRED=0)
+class IngestTracingTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+        RoomNodeInstallation.objects.create(
+            node=cls.node,
+            room=cls.test_data["room1"],
+            from_timestamp_s=1000,
+            is_public=True,
+        )
+
+    def setUp(self):
+        registry.reset()
+        recent_samples.clear()
+        installation_index.invalidate()
+        publish_sample.disconnect(publish_to_stadtpuls)
+        publish_sample.connect(record_publication)
+
+    def tearDown(self):
+        publish_sample.disconnect(record_publication)
+        publish_sample.connect(publish_to_stadtpuls)
+        recent_samples.clear()
+
+    def test_trace_stages(self):
+        timestamp_s = int(time.time()) - 30
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("ingest"),
+                data={"data": sample_resource(self.node.id, timestamp_s)},
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(registry.stages),
+            {
+                "parse",
+                "validate",
+                "insert",
+                "installation_lookup",
+                "publish_dispatch",
+                "receiver.record",
+            },
+        )
+        self.assertTrue(all(h.count == 1 for h in registry.stages.values()))
+        self.assertEqual(registry.freshness.count, 1)
+        self.assertGreaterEqual(registry.node_freshness[self.node.id], 30)
+
+    def test_render_metrics(self):
+        registry.observe_stage("insert", 0.003)
+        registry.observe_freshness(self.node.id, 42)
+        response = self.client.get(reverse("ingest-metrics"))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn(
+            'ingest_stage_seconds_bucket{stage="insert",le="0.005"} 1', content
+        )
+        self.assertIn('ingest_stage_seconds_count{stage="insert"} 1', content)
+        self.assertIn(
+            f'ingest_node_freshness_lag_seconds{{node="{self.node.id}"}} 42', content
+        )
@@ -0,0 +1,237 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from core.models import Sample
+from core.test.utils import setup_basic_test_data
+from ingest import writebehind
+from ingest.writebehind import (
+    ENQUEUE,
+    MemoryQueue,
+    PendingCommit,
+    RedisQueue,
+    WriteBehindBuffer,
+    create_sharded_buffer,
+    shard_of,
+)
+from .utils import sample_resource
+
+
+def create_buffer(capacity=100, max_batch_size=500):
+    return WriteBehindBuffer(
+        MemoryQueue(capacity),
+        ENQUEUE,
+        max_batch_size=max_batch_size,
+        max_delay_s=0,
+        commit_timeout_s=1,
+    )
+
+
+class WriteBehindBufferTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.node = cls.test_data["node1"]
+
+    def queue_samples(self, buffer, timestamps):
+        for ts in timestamps:
+            buffer.put(Sample(node=self.node, timestamp_s=ts, co2_ppm=500))
+
+    def test_group_commit(self):
+        buffer = create_buffer()
+        self.queue_samples(buffer, [1000, 1600, 2200, 1600])
+        self.assertEqual(Sample.objects.count(), 0)
+        self.assertEqual(buffer.stats()["depth"], 4)
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(Sample.objects.count(), 3)
+        stats = buffer.stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["flushes"], 1)
+        self.assertEqual(stats["stored"], 3)
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(stats["max_depth"], 4)
+
+    def test_flush_by_size(self):
+        buffer = create_buffer(max_batch_size=2)
+        self.queue_samples(buffer, [1000, 1600, 2200])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_store_synchronously_if_full(self):
+        buffer = create_buffer(capacity=1)
+        self.queue_samples(buffer, [1000, 1600])
+        self.assertEqual(Sample.objects.get().timestamp_s, 1600)
+        self.assertEqual(buffer.stats()["fallbacks"], 1)
+
+    def test_requeue_on_failed_flush(self):
+        buffer = create_buffer()
+        self.queue_samples(buffer, [1000, 1600])
+        with mock.patch(
+            "ingest.writebehind.store_samples", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertEqual(buffer.stats()["depth"], 2)
+        self.assertEqual(buffer.stats()["failed_flushes"], 1)
+        buffer.flush()
+        self.assertEqual(Sample.objects.count(), 2)
+
+    def test_resolve_pending_commits(self):
+        buffer = create_buffer()
+        pending_commits = [PendingCommit(), PendingCommit()]
+        for pending_commit in pending_commits:
+            buffer.queue.put(
+                Sample(node=self.node, timestamp_s=1000, co2_ppm=500), pending_commit
+            )
+        buffer.flush()
+        self.assertEqual(
+            [pending_commit.wait(0) for pending_commit in pending_commits],
+            [True, False],
+        )
+
+
+@override_settings(INGEST_WRITE_BEHIND=True)
+class WriteBehindIngestTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+
+    def test_ingest_write_behind(self):
+        buffer = create_buffer()
+        with mock.patch("ingest.writebehind.get_buffer", return_value=buffer):
+            response = self.client.post(
+                reverse("ingest"),
+                data={"data": sample_resource(self.test_data["node1"].id, 1000)},
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(Sample.objects.count(), 0)
+            response = self.client.get(reverse("ingest-write-behind"))
+            self.assertEqual(response.data["depth"], 1)
+        buffer.flush()
+        self.assertEqual(Sample.objects.count(), 1)
+
+    def post_with_buffer(self, **put):
+        buffer = mock.Mock(put=mock.Mock(**put))
+        with mock.patch("ingest.writebehind.get_buffer", return_value=buffer):
+            return self.client.post(
+                reverse("ingest"),
+                data={"data": sample_resource(self.test_data["node1"].id, 1000)},
+            )
+
+    def test_report_commit_outcome(self):
+        self.assertEqual(self.post_with_buffer(return_value=True).status_code, 201)
+        self.assertEqual(self.post_with_buffer(return_value=False).status_code, 200)
+
+    def test_retry_failed_commit(self):
+        for error in (TimeoutError(), DatabaseError("down")):
+            with self.subTest(error=error):
+                response = self.post_with_buffer(side_effect=error)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response["Retry-After"], "1")
+
+    @override_settings(INGEST_SPOOL=True)
+    def test_spool_if_db_unreachable(self):
+        spool = mock.Mock()
+        with mock.patch("ingest.spool.get_spool", return_value=spool):
+            response = self.post_with_buffer(side_effect=OperationalError("down"))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(spool.append.call_args.args[0]), 1)
+
+
+@override_settings(INGEST_WRITE_BEHIND_SHARDS=4)
+class ShardedBufferTestCase(TestCase):
+    """Sharded write-behind, with in-memory queues in place of the Redis queues of
+    dedicated writers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.nodes = [cls.test_data["node1"], cls.test_data["node2"]]
+
+    def test_shard_of(self):
+        node_id = self.nodes[0].id
+        self.assertEqual(shard_of(node_id, 4), shard_of(str(node_id), 4))
+        self.assertEqual(shard_of(node_id, 4), node_id.int % 4)
+
+    def test_route_by_node(self):
+        buffer = create_sharded_buffer()
+        self.assertEqual(len(buffer.buffers), 4)
+        for ts in (1000, 1600, 2200):
+            for node in self.nodes:
+                buffer.put(Sample(node=node, timestamp_s=ts, co2_ppm=500))
+        for node in self.nodes:
+            shard = buffer.buffers[shard_of(node.id, 4)]
+            queued = [
+                sample.timestamp_s
+                for sample, _ in shard.queue.take(10, 0, 0)
+                if sample.node_id == node.id
+            ]
+            # Samples of a node are queued in the same shard, in order.
+            self.assertEqual(queued, [1000, 1600, 2200])
+
+    def test_flush_shards(self):
+        buffer = create_sharded_buffer()
+        for node in self.nodes:
+            buffer.put(Sample(node=node, timestamp_s=1000, co2_ppm=500))
+        stats = buffer.stats()
+        self.assertEqual(stats["depth"], 2)
+        self.assertEqual(len(stats["shards"]), 4)
+        # Each writer commits the samples of its own shard.
+        for shard in buffer.buffers:
+            shard.flush()
+        self.assertEqual(Sample.objects.count(), 2)
+        self.assertEqual(buffer.stats()["stored"], 2)
+
+
+class FakeRedis:
+    """Stand-in for the key-value commands of Redis used to publish writer metrics."""
+
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def llen(self, key):
+        return 0
+
+
+class DedicatedWriterTestCase(TestCase):
+    def create_buffer(self, connection, dedicated_writer):
+        return WriteBehindBuffer(
+            RedisQueue(100, "ingest", connection),
+            ENQUEUE,
+            max_batch_size=500,
+            max_delay_s=0,
+            commit_timeout_s=1,
+            dedicated_writer=dedicated_writer,
+        )
+
+    def test_report_published_writer_stats(self):
+        connection = FakeRedis()
+        ingester = self.create_buffer(connection, dedicated_writer=True)
+        self.assertFalse(ingester.stats()["writer_reporting"])
+        writer = self.create_buffer(connection, dedicated_writer=False)
+        writer._stats.update(flushes=3, stored=40)
+        writer._publish_stats()
+        stats = ingester.stats()
+        self.assertTrue(stats["writer_reporting"])
+        self.assertEqual((stats["flushes"], stats["stored"]), (3, 40))
+
+    @override_settings(
+        INGEST_WRITE_BEHIND_BACKEND="redis",
+        INGEST_WRITE_BEHIND_WRITERS="embedded",
+        INGEST_WRITE_BEHIND_SHARDS=4,
+    )
+    def test_reject_sharded_redis_with_embedded_writers(self):
+        with mock.patch("ingest.writebehind._buffer", None):
+            with self.assertRaises(ImproperlyConfigured):
+                writebehind.get_buffer()
@@ -0,0 +1,21 @@
+from core.models import Sample
+
+
+def sample_resource(
+    node_id, timestamp_s, co2_ppm=500, temperature_celsius=20.5, rel_humidity_percent=40
+):
+    """Encode a sample as JSON:API resource object, as sent by the protocol handlers."""
+    return {
+        "type": "Sample",
+        "attributes": {
+            "timestamp_s": timestamp_s,
+            "co2_ppm": co2_ppm,
+            "temperature_celsius": temperature_celsius,
+            "rel_humidity_percent": rel_humidity_percent,
+        },
+        "relationships": {"node": {"data": {"type": "Node", "id": str(node_id)}}},
+    }
+
+
+def create_sample(node, timestamp_s, co2_ppm=500):
+    return Sample.objects.create(node=node, timestamp_s=timestamp_s, co2_ppm=co2_ppm)
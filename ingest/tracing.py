@@ -0,0 +1,153 @@
+"""Stage latency and freshness metrics of the ingest pipeline.
+
+Each process keeps a registry of latency histograms per stage of the ingest pipeline,
+like parsing, validation, insert, and the receivers of the publish_sample signal. It
+also records the freshness lag from the timestamp of a sample to its commit, in total
+and per node. The registry is rendered in the Prometheus text format for scraping.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets of stage latencies, in seconds.
+STAGE_BUCKETS_S = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# Upper bounds of the histogram buckets of freshness lags, in seconds.
+FRESHNESS_BUCKETS_S = (1, 5, 15, 60, 300, 900, 3600, 21600, 86400)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as exposed to Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.freshness = Histogram(FRESHNESS_BUCKETS_S)
+            self.node_freshness = {}
+
+    def observe_stage(self, name, duration_s):
+        with self._lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram(STAGE_BUCKETS_S)
+            histogram.observe(duration_s)
+
+    def observe_freshness(self, node_id, lag_s):
+        """Record the lag from the timestamp of a sample of the node to its commit."""
+        with self._lock:
+            self.freshness.observe(lag_s)
+            self.node_freshness[node_id] = lag_s
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP ingest_stage_seconds Latency of the stages of sample ingestion.",
+                "# TYPE ingest_stage_seconds histogram",
+            ]
+            for name, histogram in sorted(self.stages.items()):
+                lines.extend(
+                    _render_histogram(
+                        "ingest_stage_seconds", histogram, f'stage="{name}"'
+                    )
+                )
+            lines.extend(
+                [
+                    "# HELP ingest_freshness_lag_seconds Lag from the timestamp of a "
+                    "sample to its commit.",
+                    "# TYPE ingest_freshness_lag_seconds histogram",
+                    *_render_histogram("ingest_freshness_lag_seconds", self.freshness),
+                    "# HELP ingest_node_freshness_lag_seconds Lag of the last sample "
+                    "committed per node.",
+                    "# TYPE ingest_node_freshness_lag_seconds gauge",
+                ]
+            )
+            for node_id, lag_s in sorted(self.node_freshness.items(), key=str):
+                lines.append(
+                    f'ingest_node_freshness_lag_seconds{{node="{node_id}"}} {lag_s}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _render_histogram(name, histogram, labels=""):
+    separator = "," if labels else ""
+    bounds = [*histogram.buckets, "+Inf"]
+    for bound, count in zip(bounds, histogram.cumulative_counts()):
+        yield f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+    suffix = f"{{{labels}}}" if labels else ""
+    yield f"{name}_sum{suffix} {histogram.sum}"
+    yield f"{name}_count{suffix} {histogram.count}"
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def stage(name):
+    """Measure the latency of the enclosed stage of the ingest pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe_stage(name, time.perf_counter() - start)
+
+
+def traced(name):
+    """Decorator to measure the latency of a function as a stage of the ingest
+    pipeline; e.g., of a receiver of the publish_sample signal."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_commit(samples):
+    """Record the freshness lag of the given samples, committed just now."""
+    now = time.time()
+    for sample in samples:
+        registry.observe_freshness(sample.node_id, now - sample.timestamp_s)
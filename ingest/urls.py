@@ -1,7 +1,47 @@
 from django.urls import path
 
-from .views import InternalSampleView
+from .views import (
+    InternalSampleView,
+    InternalLeanSampleView,
+    InternalAsyncSampleView,
+    InternalSampleBatchView,
+    InternalSampleStreamView,
+    InternalWriteBehindStatusView,
+    InternalDuplicateStatusView,
+    InternalThrottleStatusView,
+    InternalSpoolStatusView,
+    InternalDirtyRangeStatusView,
+    InternalMetricsView,
+    InternalBinarySampleView,
+)
 
 urlpatterns = [
     path("ingest/", InternalSampleView.as_view(), name="ingest"),
+    path("ingest/lean/", InternalLeanSampleView.as_view(), name="ingest-lean"),
+    path("ingest/async/", InternalAsyncSampleView.as_view(), name="ingest-async"),
+    path("ingest/batch/", InternalSampleBatchView.as_view(), name="ingest-batch"),
+    path("ingest/binary/", InternalBinarySampleView.as_view(), name="ingest-binary"),
+    path("ingest/stream/", InternalSampleStreamView.as_view(), name="ingest-stream"),
+    path(
+        "ingest/write-behind/",
+        InternalWriteBehindStatusView.as_view(),
+        name="ingest-write-behind",
+    ),
+    path(
+        "ingest/duplicates/",
+        InternalDuplicateStatusView.as_view(),
+        name="ingest-duplicates",
+    ),
+    path(
+        "ingest/throttled/",
+        InternalThrottleStatusView.as_view(),
+        name="ingest-throttled",
+    ),
+    path("ingest/spool/", InternalSpoolStatusView.as_view(), name="ingest-spool"),
+    path(
+        "ingest/dirty-ranges/",
+        InternalDirtyRangeStatusView.as_view(),
+        name="ingest-dirty-ranges",
+    ),
+    path("ingest/metrics/", InternalMetricsView.as_view(), name="ingest-metrics"),
 ]
@@ -1,14 +1,46 @@
+import json
 import logging
-from rest_framework import generics
+from contextlib import nullcontext
+from asgiref.sync import sync_to_async
+from itertools import islice
+from rest_framework import generics, status, views
+from rest_framework.exceptions import ParseError, Throttled, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils import encoders
 from django.conf import settings
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    InterfaceError,
+    OperationalError,
+    transaction,
+)
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
+from core import coldstorage, rollups, statistics
 from core.models import Sample
+from core.node_registry import node_registry, violates_node_reference
+from . import binary, dirty, ratelimit, spool, tracing, writebehind
+from .dedup import recent_samples
+from .fastpath import sample_insert, sample_validator
+from .parsers import BulkJSONParser, NDJSONParser
+from .persistence import store_registered_samples
+from .publication import apublish_if_public, publish_if_public
 from .serializers import SampleIngestSerializer
-from .signals import publish_sample
-
 
 logger = logging.getLogger(__name__)
 
+# Seconds after which a client may retry a sample whose write-behind commit failed.
+WRITE_BEHIND_RETRY_AFTER_S = 1
+
+
+def node_does_not_exist(node_id):
+    """Return the validation error of a sample of a node that does not exist."""
+    return f'Invalid pk "{node_id}" - object does not exist.'
+
 
 class InternalSampleView(generics.ListCreateAPIView):
     """View for data ingestion. Must not be exposed externally"""
@@ -16,29 +48,470 @@ class InternalSampleView(generics.ListCreateAPIView):
     queryset = Sample.objects.all()
     serializer_class = SampleIngestSerializer
 
-    def perform_create(self, serializer):
-        """Hook to trigger forwarding to external IOT data platforms."""
-        sample = serializer.save()
-        if (settings.IOTDP_INTEGRATION):
-            self.__publish_sample(sample)
+    def create(self, request, *args, **kwargs):
+        """Acknowledge a duplicate of a recently ingested sample right away. Reject a
+        sample of a node that exceeds its rate limit. In write-behind mode, queue the
+        validated sample for group commit instead of storing it in a transaction of its
+        own. If the DB is unreachable and spooling is enabled, spool the sample for
+        replay."""
+        with tracing.stage("parse"):
+            data = request.data
+        serializer = self.get_serializer(data=data)
+        with tracing.stage("validate"):
+            serializer.is_valid(raise_exception=True)
+        sample = Sample(**serializer.validated_data)
+        if recent_samples.contains(sample.node_id, sample.timestamp_s):
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        if settings.INGEST_RATE_LIMIT:
+            retry_after_s = ratelimit.get_limiter().check(sample.node)
+            if retry_after_s:
+                raise Throttled(wait=retry_after_s)
+        if settings.INGEST_WRITE_BEHIND:
+            try:
+                is_stored = writebehind.get_buffer().put(sample)
+            except (TimeoutError, DatabaseError) as error:
+                return self.write_behind_failed(sample, serializer, error)
+            if is_stored is None:
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+            if not is_stored:
+                return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if settings.INGEST_SPOOL and spool.get_spool().is_bypassing():
+            spool.get_spool().append([sample])
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        try:
+            is_stored = self.perform_create(sample)
+        except (OperationalError, InterfaceError) as error:
+            if not settings.INGEST_SPOOL:
+                raise
+            logger.warning("DB unreachable, spooling samples: %s", error)
+            spool.get_spool().db_failed()
+            spool.get_spool().append([sample])
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        if not is_stored:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def write_behind_failed(sample, serializer, error):
+        """Spool a sample whose group commit failed because the DB is unreachable, if
+        spooling is enabled. Otherwise, or if the commit timed out, ask the client to
+        retry. A retried sample that was committed meanwhile is a duplicate."""
+        is_unreachable = isinstance(error, (OperationalError, InterfaceError))
+        if settings.INGEST_SPOOL and is_unreachable:
+            logger.warning("DB unreachable, spooling samples: %s", error)
+            spool.get_spool().db_failed()
+            spool.get_spool().append([sample])
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        logger.error("Write-behind commit of a sample failed: %s", error)
+        return Response(
+            {"detail": "The sample could not be committed, retry later."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(WRITE_BEHIND_RETRY_AFTER_S)},
+        )
+
+    def perform_create(self, sample):
+        """Store the sample unless it duplicates an existing sample, and trigger
+        forwarding to external IOT data platforms. Return True if stored. Raise a
+        ValidationError if the node was deleted meanwhile."""
+        with tracing.stage("insert"):
+            is_stored = store_registered_samples([sample])[0]
+        if is_stored is None:
+            raise ValidationError({"node": [node_does_not_exist(sample.node_id)]})
+        if not is_stored:
+            return False
+        if settings.IOTDP_INTEGRATION:
+            publish_if_public(self.__class__, sample)
+        return True
+
+
+class SampleBatchMixin:
+    """Validate a batch of parsed sample resources and store the valid ones at once."""
+
+    ACCEPTED = "accepted"
+    DUPLICATE = "duplicate"
+    INVALID = "invalid"
+    THROTTLED = "throttled"
 
-    def __publish_sample(self, sample):
-        """Publish a signal for an incoming sample whose installation is public."""
-        
-        logger.debug(
-            "Examining publication of incoming sample from node %s", sample.node.id
+    def ingest_batch(self, batch):
+        """Return the outcome for each item of the batch, in order. Items that could
+        not be parsed are passed in as ParseError."""
+        outcomes = [None] * len(batch)
+        valid_samples = []
+        valid_indices = []
+        for index, item in enumerate(batch):
+            if isinstance(item, ParseError):
+                outcomes[index] = {"status": self.INVALID, "errors": [item.detail]}
+                continue
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid_samples.append(Sample(**serializer.validated_data))
+                valid_indices.append(index)
+            else:
+                outcomes[index] = {"status": self.INVALID, "errors": serializer.errors}
+
+        stored = store_registered_samples(valid_samples)
+        for index, sample, is_stored in zip(valid_indices, valid_samples, stored):
+            if is_stored is None:
+                errors = {"node": [node_does_not_exist(sample.node_id)]}
+                outcomes[index] = {"status": self.INVALID, "errors": errors}
+                continue
+            outcomes[index] = {"status": self.ACCEPTED if is_stored else self.DUPLICATE}
+            if is_stored and settings.IOTDP_INTEGRATION:
+                publish_if_public(self.__class__, sample)
+        return outcomes
+
+
+class InternalSampleBatchView(SampleBatchMixin, generics.GenericAPIView):
+    """View for the ingestion of a batch of samples in a single request. Must not be exposed externally"""
+
+    queryset = Sample.objects.all()
+    serializer_class = SampleIngestSerializer
+    parser_classes = [BulkJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        batch = request.data
+        if len(batch) > settings.INGEST_MAX_BATCH_SIZE:
+            raise ValidationError(
+                f"A batch must not contain more than {settings.INGEST_MAX_BATCH_SIZE} samples."
+            )
+        outcomes = self.ingest_batch(batch)
+        accepted_count = sum(
+            1 for outcome in outcomes if outcome["status"] == self.ACCEPTED
+        )
+        logger.info(
+            "Ingested a batch of %d samples, %d accepted.", len(batch), accepted_count
         )
-        installations = sample.node.installations
-        current_installation = installations.filter(
-            from_timestamp_s__lte=sample.timestamp_s,
-            to_timestamp_s__gte=sample.timestamp_s,
+        return Response(
+            {
+                "accepted": accepted_count,
+                "rejected": len(batch) - accepted_count,
+                "items": outcomes,
+            }
         )
-        if current_installation.count() == 1 and current_installation[0].is_public:
+
+
+class InternalSampleStreamView(SampleBatchMixin, generics.GenericAPIView):
+    """View for the backfill of samples streamed as newline-delimited JSON:API resource
+    objects. The samples are committed in chunks while the request body is read, and
+    the response streams a progress report per chunk. Must not be exposed externally"""
+
+    queryset = Sample.objects.all()
+    serializer_class = SampleIngestSerializer
+    parser_classes = [NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        return StreamingHttpResponse(
+            self.__ingest_chunks(iter(request.data)),
+            content_type="application/x-ndjson",
+        )
+
+    def __ingest_chunks(self, lines):
+        chunk_size = settings.INGEST_STREAM_CHUNK_SIZE
+        chunk_number = 0
+        total_accepted = 0
+        total_rejected = 0
+        while chunk := list(islice(lines, chunk_size)):
+            line_numbers = [line_number for line_number, _ in chunk]
+            outcomes = self.ingest_batch([resource for _, resource in chunk])
+            accepted_count = sum(
+                1 for outcome in outcomes if outcome["status"] == self.ACCEPTED
+            )
+            duplicate_count = sum(
+                1 for outcome in outcomes if outcome["status"] == self.DUPLICATE
+            )
+            failures = [
+                {"line": line_number, **outcome}
+                for line_number, outcome in zip(line_numbers, outcomes)
+                if outcome["status"] == self.INVALID
+            ]
+            chunk_number += 1
+            total_accepted += accepted_count
+            total_rejected += len(chunk) - accepted_count
             logger.info(
-                "Publishing sample at timestamp %d fron node %s",
-                sample.timestamp_s,
-                sample.node.id,
+                "Backfill chunk %d, lines %d to %d: %d of %d samples accepted.",
+                chunk_number,
+                line_numbers[0],
+                line_numbers[-1],
+                accepted_count,
+                len(chunk),
             )
-            publish_sample.send(
-                sender=self.__class__, sample=sample, installation=current_installation[0]
+            progress = {
+                "chunk": chunk_number,
+                "from_line": line_numbers[0],
+                "to_line": line_numbers[-1],
+                "accepted": accepted_count,
+                "duplicates": duplicate_count,
+                "invalid": len(failures),
+                "failures": failures,
+                "total_accepted": total_accepted,
+                "total_rejected": total_rejected,
+            }
+            yield json.dumps(progress, cls=encoders.JSONEncoder) + "\n"
+
+
+class InternalWriteBehindStatusView(views.APIView):
+    """Report the metrics of the write-behind buffer of the present process, like its
+    queue depth. Must not be exposed externally"""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.INGEST_WRITE_BEHIND:
+            return Response({"enabled": False})
+        return Response({"enabled": True, **writebehind.get_buffer().stats()})
+
+
+class InternalDuplicateStatusView(views.APIView):
+    """Report the number of duplicate samples skipped by the present process, both
+    those suppressed from memory and those skipped by the DB. Must not be exposed
+    externally"""
+
+    def get(self, request, *args, **kwargs):
+        return Response(recent_samples.stats())
+
+
+class InternalThrottleStatusView(views.APIView):
+    """Report the number of samples rejected by the rate limit of the present process,
+    in total and per node. Must not be exposed externally"""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.INGEST_RATE_LIMIT:
+            return Response({"enabled": False})
+        return Response({"enabled": True, **ratelimit.get_limiter().stats()})
+
+
+class InternalSpoolStatusView(views.APIView):
+    """Report the number of samples spooled and replayed by the present process, and
+    the number of spool segments pending replay. Must not be exposed externally"""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.INGEST_SPOOL:
+            return Response({"enabled": False})
+        return Response({"enabled": True, **spool.get_spool().stats()})
+
+
+class InternalDirtyRangeStatusView(views.APIView):
+    """Report the number of days marked dirty by the present process, the number of
+    dirty days retained, and the cursors of their consumers. Must not be exposed
+    externally"""
+
+    def get(self, request, *args, **kwargs):
+        if not settings.INGEST_DIRTY_RANGES:
+            return Response({"enabled": False})
+        return Response({"enabled": True, **dirty.get_tracker().stats()})
+
+
+class InternalMetricsView(View):
+    """Expose the stage latencies and freshness lags of the present process in the
+    Prometheus text format. Must not be exposed externally"""
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            tracing.registry.render(), content_type="text/plain; version=0.0.4"
+        )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class InternalLeanSampleView(View):
+    """Lean view for the ingestion of single samples as plain JSON objects, without
+    the JSON:API parser, serializer, and renderer. Must not be exposed externally"""
+
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        data, errors = self.decode(request.body)
+        if not errors and "eui64" in data and "node" not in data:
+            errors = self.resolve_eui64(data)
+        if errors:
+            return self.invalid(errors)
+        values, errors = sample_validator.validate(data)
+        if errors:
+            return self.invalid(errors)
+        if recent_samples.contains(values[0], values[1]):
+            return JsonResponse({"status": SampleBatchMixin.DUPLICATE}, status=200)
+        if settings.INGEST_RATE_LIMIT:
+            retry_after_s = self.check_rate_limit(values)
+            if retry_after_s:
+                return self.throttled(retry_after_s)
+        is_stored = self.insert(values)
+        if is_stored is None:
+            return self.unknown_node(values)
+        if is_stored and settings.IOTDP_INTEGRATION:
+            publish_if_public(self.__class__, sample_insert.to_sample(values))
+        return self.outcome(is_stored)
+
+    @staticmethod
+    def decode(body):
+        """Decode the JSON object of the request body. Return the object and errors."""
+        try:
+            data = json.loads(body)
+        except ValueError as error:
+            return (None, {"non_field_errors": [f"JSON parse error - {error}"]})
+        if not isinstance(data, dict):
+            return (None, {"non_field_errors": ["Expected a JSON object."]})
+        return (data, None)
+
+    @staticmethod
+    def resolve_eui64(data):
+        """Resolve the node given by its EUI-64 instead of its UUID. Return errors if
+        there is no such node."""
+        eui64 = data["eui64"]
+        node = node_registry.get_by_eui64(eui64) if isinstance(eui64, str) else None
+        if node is None:
+            return {"eui64": [f'Invalid EUI-64 "{eui64}" - node does not exist.']}
+        data["node"] = node.id
+        return None
+
+    @staticmethod
+    def check_rate_limit(values):
+        """Return the seconds to wait if the node exceeds its rate limit, or else 0.
+        Unknown nodes are reported by the insert."""
+        node = node_registry.get(values[0])
+        return node and ratelimit.get_limiter().check(node)
+
+    @staticmethod
+    def insert(values):
+        """Insert the sample, and mark its day dirty and add it to the rollups and the
+        statistics in the transaction of the insert. Return True if stored, False if a
+        duplicate, or None if the node does not exist."""
+        key = (values[0], values[1])
+        # A lone insert commits atomically by itself, without a transaction.
+        is_atomic = (
+            settings.INGEST_DIRTY_RANGES
+            or settings.SAMPLE_ROLLUPS
+            or settings.SAMPLE_STATISTICS
+        )
+        try:
+            with transaction.atomic() if is_atomic else nullcontext():
+                is_packed = bool(coldstorage.packed_keys([key]))
+                is_stored = not is_packed and sample_insert.execute(values)
+                if not is_stored and node_registry.get(values[0]) is None:
+                    return None
+                transaction.on_commit(lambda: recent_samples.add([key]))
+                if is_stored:
+                    if settings.INGEST_DIRTY_RANGES:
+                        dirty.get_tracker().mark([key])
+                    if settings.SAMPLE_ROLLUPS:
+                        rollups.add_rows([values[: len(rollups.SAMPLE_FIELDS)]])
+                    if settings.SAMPLE_STATISTICS:
+                        statistics.add_rows([values])
+                    sample = sample_insert.to_sample(values)
+                    transaction.on_commit(lambda: tracing.record_commit([sample]))
+                else:
+                    recent_samples.count_duplicates(1)
+        except IntegrityError as error:
+            if not violates_node_reference(error):
+                raise
+            # The node was deleted by another process while still registered here.
+            node_registry.invalidate(values[0])
+            return None
+        return is_stored
+
+    @staticmethod
+    def outcome(is_stored):
+        if is_stored:
+            return JsonResponse({"status": SampleBatchMixin.ACCEPTED}, status=201)
+        return JsonResponse({"status": SampleBatchMixin.DUPLICATE}, status=200)
+
+    @staticmethod
+    def throttled(retry_after_s):
+        response = JsonResponse({"status": SampleBatchMixin.THROTTLED}, status=429)
+        response["Retry-After"] = str(retry_after_s)
+        return response
+
+    @classmethod
+    def unknown_node(cls, values):
+        return cls.invalid({"node": [node_does_not_exist(values[0])]})
+
+    @staticmethod
+    def invalid(errors):
+        return JsonResponse(
+            {"status": SampleBatchMixin.INVALID, "errors": errors}, status=400
+        )
+
+
+class InternalAsyncSampleView(InternalLeanSampleView):
+    """Async variant of the lean ingest view, for serving under ASGI. Samples are
+    parsed and validated in the event loop. DB access runs in the thread that Django
+    reserves for the ORM, and the integrations are called concurrently in threads of
+    their own. A request thus holds no thread while it waits for the DB or for the
+    external IoT data platforms. Must not be exposed externally"""
+
+    async def post(self, request, *args, **kwargs):
+        data, errors = self.decode(request.body)
+        if not errors and "eui64" in data and "node" not in data:
+            errors = await sync_to_async(self.resolve_eui64)(data)
+        if errors:
+            return self.invalid(errors)
+        values, errors = sample_validator.validate(data)
+        if errors:
+            return self.invalid(errors)
+        if recent_samples.contains(values[0], values[1]):
+            return JsonResponse({"status": SampleBatchMixin.DUPLICATE}, status=200)
+        if settings.INGEST_RATE_LIMIT:
+            retry_after_s = await sync_to_async(self.check_rate_limit)(values)
+            if retry_after_s:
+                return self.throttled(retry_after_s)
+        is_stored = await sync_to_async(self.insert)(values)
+        if is_stored is None:
+            return self.unknown_node(values)
+        if is_stored and settings.IOTDP_INTEGRATION:
+            await apublish_if_public(self.__class__, sample_insert.to_sample(values))
+        return self.outcome(is_stored)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class InternalBinarySampleView(View):
+    """View for the ingestion of a batch of samples in the compact binary encoding
+    of ingest.binary. The samples are stored with a single multi-row insert. Must not
+    be exposed externally"""
+
+    http_method_names = ["post"]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type != binary.MEDIA_TYPE:
+            return JsonResponse(
+                {"errors": [f"Content-Type must be {binary.MEDIA_TYPE}."]}, status=415
             )
+        try:
+            rows = binary.decode_samples(request.body)
+        except binary.DecodeError as error:
+            return JsonResponse({"errors": [str(error)]}, status=400)
+        if len(rows) > settings.INGEST_MAX_BATCH_SIZE:
+            error = f"A batch must not contain more than {settings.INGEST_MAX_BATCH_SIZE} samples."
+            return JsonResponse({"errors": [error]}, status=400)
+
+        failures = []
+        candidates = []
+        for index, row in enumerate(rows):
+            values, errors = sample_validator.validate(row)
+            if errors:
+                failures.append({"index": index, "errors": errors})
+            else:
+                candidates.append((index, sample_insert.to_sample(values)))
+        node_ids = {sample.node_id for _, sample in candidates}
+        known_nodes = node_registry.get_many(node_ids)
+        samples = []
+        for index, sample in candidates:
+            if sample.node_id in known_nodes:
+                samples.append((index, sample))
+            else:
+                error = node_does_not_exist(sample.node_id)
+                failures.append({"index": index, "errors": {"node": [error]}})
+
+        stored = store_registered_samples([sample for _, sample in samples])
+        for (index, sample), is_stored in zip(samples, stored):
+            if is_stored is None:
+                error = node_does_not_exist(sample.node_id)
+                failures.append({"index": index, "errors": {"node": [error]}})
+            elif is_stored and settings.IOTDP_INTEGRATION:
+                publish_if_public(self.__class__, sample)
+        return JsonResponse(
+            {
+                "accepted": stored.count(True),
+                "duplicates": stored.count(False),
+                "invalid": len(failures),
+                "failures": sorted(failures, key=lambda failure: failure["index"]),
+            }
+        )
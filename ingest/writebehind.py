@@ -0,0 +1,485 @@
+"""Write-behind buffering of ingested samples.
+
+Instead of committing each sample in a transaction of its own, the ingest view puts
+accepted samples into a bounded queue. A flusher thread group-commits the queued
+samples once enough of them have accumulated or a deadline has passed, whichever
+comes first.
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, close_old_connections
+
+from core.models import Sample
+from .persistence import store_samples
+from .publication import publish_if_public
+
+logger = logging.getLogger(__name__)
+
+# Queue backends
+MEMORY = "memory"
+REDIS = "redis"
+# Durability contracts
+ENQUEUE = "enqueue"  # Acknowledge a sample as soon as it is queued.
+COMMIT = "commit"  # Acknowledge a sample only after its group commit.
+
+# Time to wait after a failed flush before retrying.
+RETRY_DELAY_S = 1.0
+# Time after which the metrics published by a dedicated writer expire.
+WRITER_STATS_TTL_S = 60
+
+
+def encode_sample(sample):
+    return json.dumps(
+        {
+            "node_id": str(sample.node_id),
+            "timestamp_s": sample.timestamp_s,
+            "co2_ppm": sample.co2_ppm,
+            "temperature_celsius": (
+                None
+                if sample.temperature_celsius is None
+                else str(sample.temperature_celsius)
+            ),
+            "rel_humidity_percent": sample.rel_humidity_percent,
+        }
+    )
+
+
+def decode_sample(encoded_sample):
+    fields = json.loads(encoded_sample)
+    fields["node_id"] = uuid.UUID(fields["node_id"])
+    if fields["temperature_celsius"] is not None:
+        fields["temperature_celsius"] = Decimal(fields["temperature_celsius"])
+    return Sample(**fields)
+
+
+class PendingCommit:
+    """Handle on which a request waits for the group commit of its sample."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.is_stored = None
+        self.error = None
+
+    def resolve(self, is_stored=None, error=None):
+        self.is_stored = is_stored
+        self.error = error
+        self._event.set()
+
+    def wait(self, timeout_s):
+        """Return True if the sample was stored, or False if it was a duplicate. Raise
+        TimeoutError if it was not committed in time, or the error of the failed group
+        commit."""
+        if not self._event.wait(timeout_s):
+            raise TimeoutError("Sample was not committed in time.")
+        if self.error:
+            raise self.error
+        return self.is_stored
+
+
+class MemoryQueue:
+    """Bounded in-process queue. Queued samples are lost if the process dies."""
+
+    volatile = True
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = deque()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, sample, pending_commit=None):
+        """Append the sample unless the queue is full. Return True if appended."""
+        with self._condition:
+            if len(self._items) >= self.capacity:
+                return False
+            self._items.append((sample, pending_commit))
+            self._condition.notify()
+            return True
+
+    def requeue(self, items):
+        """Return items taken from the queue to its front, to retry them first."""
+        with self._condition:
+            self._items.extendleft(reversed(items))
+            self._condition.notify()
+
+    def take(self, max_items, max_delay_s, timeout_s):
+        """Wait up to timeout_s for a first item. Then, wait up to max_delay_s for
+        max_items to accumulate. Return the items taken from the queue."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items, timeout_s):
+                return []
+            deadline = time.monotonic() + max_delay_s
+            self._condition.wait_for(
+                lambda: len(self._items) >= max_items,
+                max(0, deadline - time.monotonic()),
+            )
+            count = min(max_items, len(self._items))
+            return [self._items.popleft() for _ in range(count)]
+
+
+class RedisQueue:
+    """Bounded queue in a Redis list that is shared by all ingest processes. Queued
+    samples survive the crash of an ingest process."""
+
+    volatile = False
+
+    def __init__(self, capacity, key, connection):
+        self.capacity = capacity
+        self.key = key
+        self._redis = connection
+
+    def __len__(self):
+        return self._redis.llen(self.key)
+
+    def put(self, sample, pending_commit=None):
+        # The capacity check is not atomic and thus slightly overshoots under load.
+        if self._redis.llen(self.key) >= self.capacity:
+            return False
+        self._redis.rpush(self.key, encode_sample(sample))
+        return True
+
+    def publish_stats(self, stats):
+        """Publish the metrics of the writer of the queue to the ingest processes."""
+        self._redis.set(f"{self.key}:stats", json.dumps(stats), ex=WRITER_STATS_TTL_S)
+
+    def published_stats(self):
+        """Return the metrics last published by the writer of the queue, or None."""
+        stats = self._redis.get(f"{self.key}:stats")
+        return json.loads(stats) if stats else None
+
+    def requeue(self, items):
+        self._redis.lpush(
+            self.key, *[encode_sample(sample) for sample, _ in reversed(items)]
+        )
+
+    def take(self, max_items, max_delay_s, timeout_s):
+        first = self._redis.blpop(self.key, timeout=max(1, round(timeout_s)))
+        if first is None:
+            return []
+        deadline = time.monotonic() + max_delay_s
+        while len(self) < max_items - 1 and time.monotonic() < deadline:
+            time.sleep(max_delay_s / 10)
+        pipeline = self._redis.pipeline()
+        pipeline.lrange(self.key, 0, max_items - 2)
+        pipeline.ltrim(self.key, max_items - 1, -1)
+        rest, _ = pipeline.execute()
+        return [(decode_sample(item), None) for item in [first[1], *rest]]
+
+
+class WriteBehindBuffer:
+    """Queue ingested samples and group-commit them from a background thread."""
+
+    def __init__(
+        self,
+        queue,
+        durability,
+        max_batch_size,
+        max_delay_s,
+        commit_timeout_s,
+        name="ingest-write-behind",
+        dedicated_writer=False,
+    ):
+        self.queue = queue
+        self.name = name
+        # Whether a dedicated writer process commits the queue, see run_ingest_writer.
+        self.dedicated_writer = dedicated_writer
+        self.durability = durability
+        self.max_batch_size = max_batch_size
+        self.max_delay_s = max_delay_s
+        self.commit_timeout_s = commit_timeout_s
+        self._stopping = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "fallbacks": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "stored": 0,
+            "duplicates": 0,
+            "max_depth": 0,
+            "last_flush_size": 0,
+            "last_flush_ms": 0,
+        }
+
+    def start(self):
+        """Start the flusher thread and flush the queue when the process exits."""
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flusher thread and flush the samples still queued in memory."""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+        if self.queue.volatile:
+            try:
+                while len(self.queue) and self.flush():
+                    pass
+            except DatabaseError:
+                logger.error("Could not flush the write-behind buffer on shutdown.")
+        logger.info(
+            "Write-behind buffer stopped with %d samples queued.", len(self.queue)
+        )
+
+    def put(self, sample):
+        """Queue the sample for group commit. If the queue is full, store the sample
+        right away instead. Under the commit durability contract, return only once the
+        sample is committed. Return True if the sample was stored, False if it was a
+        duplicate, or None if it was queued without waiting for its commit."""
+        pending_commit = PendingCommit() if self.durability == COMMIT else None
+        if not self.queue.put(sample, pending_commit):
+            logger.warning("Write-behind queue is full, storing sample synchronously.")
+            self._count("fallbacks")
+            return self._store([sample])[0]
+        self._count("enqueued")
+        depth = len(self.queue)
+        with self._stats_lock:
+            self._stats["max_depth"] = max(self._stats["max_depth"], depth)
+        if pending_commit:
+            return pending_commit.wait(self.commit_timeout_s)
+        return None
+
+    def flush(self, max_delay_s=0, timeout_s=0):
+        """Group-commit up to max_batch_size queued samples. Return the number of
+        samples flushed."""
+        items = self.queue.take(self.max_batch_size, max_delay_s, timeout_s)
+        if not items:
+            return 0
+        start = time.monotonic()
+        try:
+            stored = self._store([sample for sample, _ in items])
+        except DatabaseError as error:
+            logger.error("Failed to flush %d queued samples: %s", len(items), error)
+            self._count("failed_flushes")
+            if self.durability == COMMIT:
+                for _, pending_commit in items:
+                    if pending_commit:
+                        pending_commit.resolve(error=error)
+            else:
+                self.queue.requeue(items)
+            raise
+        for (_, pending_commit), is_stored in zip(items, stored):
+            if pending_commit:
+                pending_commit.resolve(is_stored)
+        with self._stats_lock:
+            self._stats["flushes"] += 1
+            self._stats["stored"] += stored.count(True)
+            self._stats["duplicates"] += stored.count(False)
+            self._stats["last_flush_size"] = len(items)
+            self._stats["last_flush_ms"] = round((time.monotonic() - start) * 1000)
+        return len(items)
+
+    def stats(self):
+        """Return the metrics of the buffer. With a dedicated writer, the metrics of
+        the group commits are those published by the writer, and the others are those of
+        the present process."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        if self.dedicated_writer:
+            published = self.queue.published_stats()
+            stats.update({key: (published or {}).get(key, 0) for key in WRITER_STATS})
+            stats["writer_reporting"] = published is not None
+        stats.update(
+            {
+                "backend": MEMORY if self.queue.volatile else REDIS,
+                "durability": self.durability,
+                "depth": len(self.queue),
+                "capacity": self.queue.capacity,
+            }
+        )
+        return stats
+
+    def _store(self, samples):
+        close_old_connections()
+        stored = store_samples(samples)
+        if settings.IOTDP_INTEGRATION:
+            for sample, is_stored in zip(samples, stored):
+                if is_stored:
+                    publish_if_public(self.__class__, sample)
+        return stored
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def run(self, publish_stats=False):
+        """Group-commit queued samples until stopped. A dedicated writer publishes its
+        metrics to the ingest processes after each attempt."""
+        while not self._stopping.is_set():
+            try:
+                self.flush(self.max_delay_s, timeout_s=1.0)
+            except Exception:
+                logger.exception("Write-behind flush failed, retrying.")
+                time.sleep(RETRY_DELAY_S)
+            if publish_stats:
+                self._publish_stats()
+
+    def _publish_stats(self):
+        with self._stats_lock:
+            stats = {key: self._stats[key] for key in WRITER_STATS}
+        try:
+            self.queue.publish_stats(stats)
+        except redis.RedisError as error:
+            logger.warning("Could not publish the write-behind metrics: %s", error)
+
+
+def shard_of(node_id, shard_count):
+    """Return the shard of the node. The same in all processes, unlike hash()."""
+    return uuid.UUID(str(node_id)).int % shard_count
+
+
+class ShardedBuffer:
+    """Route samples by their node onto shards, each a write-behind buffer with a single
+    writer of its own. Samples of a node are thus committed in order, by the same
+    writer, and the writers of different shards insert samples of disjoint sets of
+    nodes. The shards share the durability contract and the configuration."""
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.durability = buffers[0].durability
+
+    def start(self):
+        for buffer in self.buffers:
+            buffer.start()
+
+    def stop(self):
+        for buffer in self.buffers:
+            buffer.stop()
+
+    def put(self, sample):
+        return self.buffers[shard_of(sample.node_id, len(self.buffers))].put(sample)
+
+    def flush(self, max_delay_s=0, timeout_s=0):
+        return sum(buffer.flush(max_delay_s, timeout_s) for buffer in self.buffers)
+
+    def stats(self):
+        shards = [buffer.stats() for buffer in self.buffers]
+        stats = {key: sum(shard[key] for shard in shards) for key in SUMMED_STATS}
+        stats.update(
+            {
+                "backend": shards[0]["backend"],
+                "durability": self.durability,
+                "max_depth": max(shard["max_depth"] for shard in shards),
+                "shards": shards,
+            }
+        )
+        return stats
+
+
+# Statistics of the group commits, published by dedicated writers.
+WRITER_STATS = (
+    "flushes",
+    "failed_flushes",
+    "stored",
+    "duplicates",
+    "last_flush_size",
+    "last_flush_ms",
+)
+
+# Statistics summed up over all shards of a sharded buffer.
+SUMMED_STATS = (
+    "enqueued",
+    "fallbacks",
+    "flushes",
+    "failed_flushes",
+    "stored",
+    "duplicates",
+    "depth",
+    "capacity",
+)
+
+# Writers of the write-behind buffer
+EMBEDDED = "embedded"  # A thread per shard in each ingest process.
+DEDICATED = "dedicated"  # A run_ingest_writer process per shard.
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def create_buffer(shard=None):
+    """Create a write-behind buffer as configured in the settings. With several
+    shards, create the buffer of the given shard."""
+    backend = settings.INGEST_WRITE_BEHIND_BACKEND
+    durability = settings.INGEST_WRITE_BEHIND_DURABILITY
+    if durability not in (ENQUEUE, COMMIT):
+        raise ImproperlyConfigured(f"Unknown write-behind durability {durability}.")
+    capacity = settings.INGEST_WRITE_BEHIND_CAPACITY
+    if backend == MEMORY:
+        queue = MemoryQueue(capacity)
+    elif backend == REDIS:
+        if durability == COMMIT:
+            raise ImproperlyConfigured(
+                "The Redis write-behind queue supports the enqueue durability only."
+            )
+        key = settings.INGEST_WRITE_BEHIND_REDIS_KEY
+        queue = RedisQueue(
+            capacity,
+            key if shard is None else f"{key}:{shard}",
+            redis.Redis(**settings.INGEST_WRITE_BEHIND_REDIS),
+        )
+    else:
+        raise ImproperlyConfigured(f"Unknown write-behind backend {backend}.")
+    return WriteBehindBuffer(
+        queue,
+        durability,
+        max_batch_size=settings.INGEST_WRITE_BEHIND_MAX_BATCH_SIZE,
+        max_delay_s=settings.INGEST_WRITE_BEHIND_MAX_DELAY_MS / 1000,
+        commit_timeout_s=settings.INGEST_WRITE_BEHIND_COMMIT_TIMEOUT_S,
+        name="ingest-write-behind" if shard is None else f"ingest-writer-{shard}",
+        dedicated_writer=settings.INGEST_WRITE_BEHIND_WRITERS == DEDICATED,
+    )
+
+
+def create_sharded_buffer():
+    """Create a buffer that routes samples onto INGEST_WRITE_BEHIND_SHARDS shards, or
+    a single buffer if there is only one shard."""
+    shard_count = settings.INGEST_WRITE_BEHIND_SHARDS
+    if shard_count == 1:
+        return create_buffer()
+    return ShardedBuffer([create_buffer(shard) for shard in range(shard_count)])
+
+
+def get_buffer():
+    """Return the write-behind buffer of the present process. Its writer threads are
+    started on first use, unless dedicated writer processes commit the samples."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            writers = settings.INGEST_WRITE_BEHIND_WRITERS
+            if writers not in (EMBEDDED, DEDICATED):
+                raise ImproperlyConfigured(f"Unknown write-behind writers {writers}.")
+            backend = settings.INGEST_WRITE_BEHIND_BACKEND
+            if writers == DEDICATED and backend != REDIS:
+                raise ImproperlyConfigured(
+                    "Dedicated write-behind writers require the Redis backend."
+                )
+            if (
+                writers == EMBEDDED
+                and backend == REDIS
+                and settings.INGEST_WRITE_BEHIND_SHARDS > 1
+            ):
+                # The writer threads of all ingest processes would take samples from
+                # the same shard queues, so the samples of a node would no longer be
+                # committed in order by a single writer.
+                raise ImproperlyConfigured(
+                    "Sharding the Redis write-behind buffer requires dedicated writers."
+                )
+            _buffer = create_sharded_buffer()
+            if writers == EMBEDDED:
+                _buffer.start()
+        return _buffer
@@ -224,7 +224,13 @@ DATABASES = {
 # By default, use 64-bit primary keys. 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-if NODE_FIDELITY:
+# Enable or disable third-party IOT data-platform (IOTDP) integration
+IOTDP_INTEGRATION = int(os.environ.get("IOTDP_INTEGRATION", default=0))
+# Hand publication to IOT data platforms over to the Django-Q cluster instead of
+# publishing synchronously while ingesting.
+IOTDP_DEFERRED = int(os.environ.get("IOTDP_DEFERRED", default=0))
+
+if NODE_FIDELITY or IOTDP_DEFERRED:
     # Redis used as broker for the Django_Q task scheduler.
     Q_CLUSTER = {
         "name": "node_check",
@@ -289,8 +295,39 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 # See https://docs.djangoproject.com/en/4.1/howto/static-files/
 STATIC_URL = "static/"
 
-# Enable or disable third-party IOT data-platform (IOTDP) integration
-IOTDP_INTEGRATION = int(os.environ.get("IOTDP_INTEGRATION", default=0))
+# Maximum age of the per-process index of node installations. Changes to installations
+# made in other processes become visible after this period at the latest.
+INSTALLATION_INDEX_MAX_AGE_S = int(
+    os.environ.get("INSTALLATION_INDEX_MAX_AGE_S", default=60)
+)
+
+# Size and maximum entry age of the per-process registry of nodes, which resolves the
+# nodes of ingested samples by UUID or EUI-64 without querying the DB.
+NODE_REGISTRY_CAPACITY = int(os.environ.get("NODE_REGISTRY_CAPACITY", default=10000))
+NODE_REGISTRY_MAX_AGE_S = int(os.environ.get("NODE_REGISTRY_MAX_AGE_S", default=300))
+
+# Number of upcoming months for which partitions of the sample table are created
+# ahead of time on PostgreSQL.
+SAMPLE_PARTITION_MONTHS_AHEAD = int(
+    os.environ.get("SAMPLE_PARTITION_MONTHS_AHEAD", default=3)
+)
+# Maintain hourly and daily rollups of the samples on ingest.
+SAMPLE_ROLLUPS = int(os.environ.get("SAMPLE_ROLLUPS", default=0))
+# Maintain running sample statistics of nodes and installations on ingest, and serve
+# the sample counts and latest samples of node and installation lists from them.
+SAMPLE_STATISTICS = int(os.environ.get("SAMPLE_STATISTICS", default=0))
+# Number of months after the end of a month after which its samples are packed into
+# compressed blocks of the cold storage. 0 disables the cold storage.
+SAMPLE_COLD_STORAGE_AFTER_MONTHS = int(
+    os.environ.get("SAMPLE_COLD_STORAGE_AFTER_MONTHS", default=0)
+)
+# Global retention policy of the raw samples, unless overridden per organization:
+# number of months after the end of a month after which its samples are downsampled
+# to the analysis grid or dropped, after securing their rollups. 0 keeps them forever.
+SAMPLE_RETENTION_AFTER_MONTHS = int(
+    os.environ.get("SAMPLE_RETENTION_AFTER_MONTHS", default=0)
+)
+SAMPLE_RETENTION_ACTION = os.environ.get("SAMPLE_RETENTION_ACTION", default="downsample")
 
 if (IOTDP_INTEGRATION):
     # CityLAB Berlin Stadtpuls Integration
@@ -302,6 +339,38 @@ if (IOTDP_INTEGRATION):
     SP_LOGIN_EMAIL = os.environ.get("SP_LOGIN_EMAIL")
     SP_LOGIN_PWD = get_secret_from_env_or_file("SP_LOGIN_PWD")
     SP_AUTH_TOKEN = get_secret_from_env_or_file("SP_AUTH_TOKEN")
+    SP_SENSOR_ID_CACHE_MAX_AGE_S = int(os.environ.get("SP_SENSOR_ID_CACHE_MAX_AGE_S", default=300))
+    SP_BATCH_RECORDS = int(os.environ.get("SP_BATCH_RECORDS", default=0))
+    SP_BATCH_MAX_RECORDS = int(os.environ.get("SP_BATCH_MAX_RECORDS", default=60))
+    SP_BATCH_MAX_AGE_S = int(os.environ.get("SP_BATCH_MAX_AGE_S", default=3600))
+    SP_BATCH_CLAIM_TIMEOUT_S = int(os.environ.get("SP_BATCH_CLAIM_TIMEOUT_S", default=600))
+
+# Optional write-behind buffering of ingested samples with group commit.
+INGEST_WRITE_BEHIND = int(os.environ.get("INGEST_WRITE_BEHIND", default=0))
+if INGEST_WRITE_BEHIND:
+    INGEST_WRITE_BEHIND_BACKEND = os.environ.get("INGEST_WRITE_BEHIND_BACKEND", default="memory")
+    INGEST_WRITE_BEHIND_DURABILITY = os.environ.get("INGEST_WRITE_BEHIND_DURABILITY", default="enqueue")
+    INGEST_WRITE_BEHIND_SHARDS = int(os.environ.get("INGEST_WRITE_BEHIND_SHARDS", default=1))
+    INGEST_WRITE_BEHIND_WRITERS = os.environ.get("INGEST_WRITE_BEHIND_WRITERS", default="embedded")
+
+# Optional per-node rate limiting of ingested samples.
+INGEST_RATE_LIMIT = int(os.environ.get("INGEST_RATE_LIMIT", default=0))
+if INGEST_RATE_LIMIT:
+    INGEST_RATE_LIMIT_BACKEND = os.environ.get("INGEST_RATE_LIMIT_BACKEND", default="memory")
+    INGEST_RATE_LIMIT_CADENCE_S = int(os.environ.get("INGEST_RATE_LIMIT_CADENCE_S", default=60))
+    INGEST_RATE_LIMIT_BURST = int(os.environ.get("INGEST_RATE_LIMIT_BURST", default=10))
+
+# Optional local spool of samples accepted while the DB is unreachable.
+INGEST_SPOOL = int(os.environ.get("INGEST_SPOOL", default=0))
+if INGEST_SPOOL:
+    INGEST_SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR", default=os.path.join(BASE_DIR, "spool"))
+
+# Optional tracking of the days of nodes with ingested samples.
+INGEST_DIRTY_RANGES = int(os.environ.get("INGEST_DIRTY_RANGES", default=0))
+if INGEST_DIRTY_RANGES:
+    INGEST_DIRTY_RANGES_CONSUME_LAG_S = int(
+        os.environ.get("INGEST_DIRTY_RANGES_CONSUME_LAG_S", default=60)
+    )
 
 # Logging configuration
 LOGGING = {
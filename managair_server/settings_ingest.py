@@ -0,0 +1,46 @@
+"""
+Django settings for the ingest-only profile of managair_server, run as `ingestair`.
+
+The profile takes all settings from managair_server.settings, but loads only the apps
+needed to ingest samples and serves the ingest API only. The user management, the
+admin UI, the OpenAPI schema, the browsable API, and the data analysis with pandas are
+not loaded, which makes ingest processes start faster and use less memory.
+
+Select the profile with `DJANGO_SETTINGS_MODULE=managair_server.settings_ingest`.
+"""
+
+from .settings import *  # noqa: F401, F403
+from .settings import IOTDP_DEFERRED, REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    # The inventory models refer to the user model.
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "core",
+    "ingest",
+    "stadtpuls_integration",
+]
+if IOTDP_DEFERRED:
+    INSTALLED_APPS += ["django_q"]
+
+# Protocol handlers post without sessions, CSRF tokens, or authentication.
+MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
+ROOT_URLCONF = "managair_server.urls_ingest"
+
+AUTHENTICATION_BACKENDS = ("django.contrib.auth.backends.ModelBackend",)
+
+# Without the browsable API, the OpenAPI schema, and authentication.
+REST_FRAMEWORK = {
+    key: value for key, value in REST_FRAMEWORK.items() if key != "DEFAULT_SCHEMA_CLASS"
+}
+REST_FRAMEWORK.update(
+    {
+        "DEFAULT_RENDERER_CLASSES": ("rest_framework_json_api.renderers.JSONRenderer",),
+        "DEFAULT_AUTHENTICATION_CLASSES": (),
+        "UNAUTHENTICATED_USER": None,
+    }
+)
@@ -0,0 +1,8 @@
+"""URL Configuration of the ingest-only profile, see managair_server.settings_ingest."""
+
+from django.urls import include, path
+
+urlpatterns = [
+    # Data ingestion API
+    path("ingest/v1/", include("ingest.urls")),
+]
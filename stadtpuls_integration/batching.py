@@ -0,0 +1,174 @@
+"""Batched posting of records to Stadtpuls.
+
+The records to publish are queued per Stadtpuls sensor in the PendingRecord table, so
+publishing a sample costs a local insert rather than a request to Stadtpuls, and
+pending records survive the exit of the process that queued them. The Django-Q task
+stadtpuls_integration.tasks.post_pending_records posts the batches that are due.
+"""
+
+import logging
+import time
+import uuid
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from requests import RequestException
+
+from .models import PendingRecord
+
+logger = logging.getLogger(__name__)
+
+
+class RecordAccumulator:
+    """Collect the records to publish per Stadtpuls sensor, and post them to Stadtpuls
+    in batches. The pending records of a sensor are due once there are max_records of
+    them, or once the oldest of them is max_age_s old. Records whose post failed are
+    requeued and retried after retry_delay_s, up to max_pending records per sensor.
+    Records claimed by a flush that failed to settle them, as its process exited, are
+    posted again claim_timeout_s after they were claimed."""
+
+    def __init__(
+        self,
+        post_records,
+        max_records,
+        max_age_s,
+        max_pending,
+        retry_delay_s,
+        claim_timeout_s,
+    ):
+        self.post_records = post_records
+        self.max_records = max_records
+        self.max_age_s = max_age_s
+        self.max_pending = max_pending
+        self.retry_delay_s = retry_delay_s
+        self.claim_timeout_s = claim_timeout_s
+
+    def add(self, sensor_id, record):
+        """Queue the record for the sensor. It is posted by the next flush once its
+        batch is due."""
+        PendingRecord.objects.create(
+            stadtpuls_sensor_id=sensor_id, record=record, queued_s=int(time.time())
+        )
+
+    def pending_count(self, sensor_id=None):
+        pending = PendingRecord.objects.all()
+        if sensor_id is not None:
+            pending = pending.filter(stadtpuls_sensor_id=sensor_id)
+        return pending.count()
+
+    def flush(self, force=True):
+        """Post the pending records of all sensors whose batch is due, or of all
+        sensors if forced. Return a report of the number of records posted, requeued,
+        and dropped per sensor."""
+        report = {}
+        for sensor_id in self._due_sensors(force):
+            sensor_report = self._post(sensor_id)
+            if sensor_report:
+                report[sensor_id] = sensor_report
+        return report
+
+    def _due_sensors(self, force):
+        now = int(time.time())
+        sensors = (
+            PendingRecord.objects.order_by()
+            .values("stadtpuls_sensor_id")
+            .annotate(
+                count=Count("id"), oldest_s=Min("queued_s"), retry_s=Max("retry_s")
+            )
+        )
+        due = []
+        for sensor in sensors:
+            if not force and now < sensor["retry_s"]:
+                continue
+            is_full = sensor["count"] >= self.max_records
+            is_old = now - sensor["oldest_s"] >= self.max_age_s
+            if force or is_full or is_old:
+                due.append(sensor["stadtpuls_sensor_id"])
+        return due
+
+    def _post(self, sensor_id):
+        """Post the pending records of the sensor. The records are claimed first, so
+        that concurrent flushes skip them, and posted outside of any transaction. Return
+        None if they are claimed already."""
+        claim, pending = self._claim(sensor_id)
+        if not pending:
+            return None
+        report = {"posted": 0, "requeued": 0, "dropped": 0}
+        done = []
+        failure = None
+        for start in range(0, len(pending), self.max_records):
+            batch = pending[start : start + self.max_records]
+            try:
+                self.post_records(sensor_id, [record for _, record in batch])
+            except RequestException as error:
+                status_code = getattr(error.response, "status_code", None)
+                if status_code and 400 <= status_code < 500 and status_code != 429:
+                    # Stadtpuls rejected the records themselves. Retrying won't help.
+                    logger.error(
+                        "Stadtpuls rejected %d records of sensor %s: %s",
+                        len(batch),
+                        sensor_id,
+                        error,
+                    )
+                    done += [pk for pk, _ in batch]
+                    report["dropped"] += len(batch)
+                    continue
+                failure = error
+                break
+            done += [pk for pk, _ in batch]
+            report["posted"] += len(batch)
+        with transaction.atomic():
+            PendingRecord.objects.filter(id__in=done).delete()
+            if failure is not None:
+                requeued, dropped = self._requeue(
+                    sensor_id, claim, len(pending) - len(done), failure
+                )
+                report["requeued"] += requeued
+                report["dropped"] += dropped
+        logger.debug("Posted records of Stadtpuls sensor %s: %s", sensor_id, report)
+        return report
+
+    def _claim(self, sensor_id):
+        """Claim the pending records of the sensor that are not claimed, or whose claim
+        expired as its flush failed to settle them. Return the claim and the IDs and
+        records claimed."""
+        claim = uuid.uuid4()
+        now = int(time.time())
+        with transaction.atomic():
+            ids = list(
+                PendingRecord.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(claimed_s__isnull=True)
+                    | Q(claimed_s__lte=now - self.claim_timeout_s),
+                    stadtpuls_sensor_id=sensor_id,
+                )
+                .values_list("id", flat=True)
+            )
+            PendingRecord.objects.filter(id__in=ids).update(claim=claim, claimed_s=now)
+        pending = PendingRecord.objects.filter(claim=claim).values_list("id", "record")
+        return (claim, list(pending))
+
+    def _requeue(self, sensor_id, claim, failed, error):
+        """Release the claimed records of the sensor, keep the newest max_pending
+        records not claimed by other flushes, and retry them after the retry delay."""
+        pending = PendingRecord.objects.filter(
+            Q(claim__isnull=True) | Q(claim=claim), stadtpuls_sensor_id=sensor_id
+        )
+        count = pending.count()
+        dropped = max(0, count - self.max_pending)
+        if dropped:
+            oldest = pending.order_by("id").values_list("id", flat=True)[:dropped]
+            PendingRecord.objects.filter(id__in=list(oldest)).delete()
+        pending.update(
+            claim=None,
+            claimed_s=None,
+            retry_s=int(time.time()) + self.retry_delay_s,
+        )
+        logger.error(
+            "Could not post %d records of Stadtpuls sensor %s, requeued %d: %s",
+            failed,
+            sensor_id,
+            count - dropped,
+            error,
+        )
+        return (count - dropped, dropped)
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Renew the access token this many seconds before it expires.
+TOKEN_EXPIRY_MARGIN_S = 60
+
+
+class StadtpulsClient:
+    """Client for the Stadtpuls APIs. The client keeps its connections to Stadtpuls
+    alive across requests, and logs into Stadtpuls only if it has no valid access
+    token. An access token rejected by Stadtpuls is renewed once per request."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.SP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._token_lock = threading.Lock()
+        self._access_token = None
+        self._user_id = None
+        self._token_expires_at = 0
+
+    def login(self):
+        """Return an access token and the ID of the Stadtpuls user, logging in only if
+        the cached access token has expired."""
+        with self._token_lock:
+            if self._access_token is None or time.time() >= self._token_expires_at:
+                self._login()
+            return (self._access_token, self._user_id)
+
+    def invalidate_token(self, access_token):
+        with self._token_lock:
+            if self._access_token == access_token:
+                self._access_token = None
+
+    def create_sensor(self, sensor):
+        """Register the sensor with Stadtpuls on behalf of the logged-in user and return
+        its Stadtpuls sensor ID."""
+        for attempt in range(2):
+            access_token, user_id = self.login()
+            headers = {
+                "apikey": settings.SP_API_KEY,
+                "Authorization": f"Bearer {access_token}",
+                # See discussion  https://github.com/supabase/supabase/discussions/4054
+                "prefer": "return=representation",
+            }
+            response = self.session.post(
+                settings.SP_SENSOR_ENDPOINT,
+                headers=headers,
+                json={**sensor, "user_id": user_id},
+                timeout=settings.SP_TIMEOUT_S,
+            )
+            if response.status_code != 401 or attempt:
+                break
+            logger.info("Stadtpuls rejected the access token, logging in again.")
+            self.invalidate_token(access_token)
+        response.raise_for_status()
+        return response.json()[0]["id"]
+
+    def post_records(self, stadtpuls_sensor_id, records):
+        headers = {"Authorization": f"Bearer {settings.SP_AUTH_TOKEN}"}
+        records_endpoint = (
+            f"{settings.SP_RECORDS_ENDPOINT}/{stadtpuls_sensor_id}/records"
+        )
+        response = self.session.post(
+            url=records_endpoint,
+            headers=headers,
+            json={"records": records},
+            timeout=settings.SP_TIMEOUT_S,
+        )
+        response.raise_for_status()
+
+    def _login(self):
+        headers = {"apikey": settings.SP_API_KEY}
+        params = {"grant_type": "password"}
+        req_body = {"email": settings.SP_LOGIN_EMAIL, "password": settings.SP_LOGIN_PWD}
+        logger.debug(
+            "Logging into Stadtpuls Supabase %s as user %s",
+            settings.SP_LOGIN_ENDPOINT,
+            settings.SP_LOGIN_EMAIL,
+        )
+        response = self.session.post(
+            url=settings.SP_LOGIN_ENDPOINT,
+            params=params,
+            headers=headers,
+            json=req_body,
+            timeout=settings.SP_TIMEOUT_S,
+        )
+        response.raise_for_status()
+        login_response = response.json()
+        self._access_token = login_response["access_token"]
+        self._user_id = login_response["user"]["id"]
+        expires_in_s = login_response.get("expires_in", 3600)
+        self._token_expires_at = time.time() + expires_in_s - TOKEN_EXPIRY_MARGIN_S
@@ -11,6 +11,20 @@ class StadtpulsAppConf(AppConf):
     LOGIN_EMAIL = ""
     LOGIN_PWD = ""
     AUTH_TOKEN = ""
+    # Maximum number of kept-alive connections per Stadtpuls host.
+    POOL_SIZE = 10
+    # Timeout of requests to Stadtpuls.
+    TIMEOUT_S = 10
+    # Maximum age of the Stadtpuls sensor IDs kept in memory per process.
+    SENSOR_ID_CACHE_MAX_AGE_S = 300
+    # Batched posting of records, per Stadtpuls sensor.
+    BATCH_RECORDS = False
+    BATCH_MAX_RECORDS = 60
+    BATCH_MAX_AGE_S = 3600
+    BATCH_MAX_PENDING = 1000
+    BATCH_RETRY_DELAY_S = 300
+    # Seconds after which records claimed by a flush that exited are posted again.
+    BATCH_CLAIM_TIMEOUT_S = 600
 
     class Meta:
         prefix = "sp"
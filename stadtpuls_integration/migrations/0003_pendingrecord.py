@@ -0,0 +1,41 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stadtpuls_integration", "0002_alter_stadpulssensor_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stadtpuls_sensor_id", models.IntegerField()),
+                ("record", models.JSONField()),
+                ("queued_s", models.PositiveIntegerField()),
+                ("retry_s", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="pendingrecord",
+            index=models.Index(
+                fields=["stadtpuls_sensor_id", "id"],
+                name="stadtpuls_i_stadtpu_8ae6a7_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.3 on 2026-10-17 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stadtpuls_integration", "0003_pendingrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingrecord",
+            name="claim",
+            field=models.UUIDField(null=True),
+        ),
+        migrations.AddField(
+            model_name="pendingrecord",
+            name="claimed_s",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -29,3 +29,21 @@ class StadpulsSensor(models.Model):
                 fields=["stadtpuls_sensor_id"], name="unique_statpuls_sensor")
         ]
 
+
+
+class PendingRecord(models.Model):
+    """A record queued for posting to a Stadtpuls sensor in a batch. See
+    stadtpuls_integration.batching."""
+
+    stadtpuls_sensor_id = models.IntegerField(null=False)
+    record = models.JSONField(null=False)
+    queued_s = models.PositiveIntegerField(null=False, blank=False)
+    # Earliest time to retry posting after a failed post.
+    retry_s = models.PositiveIntegerField(default=0)
+    # Flush posting the record, and when it claimed the record.
+    claim = models.UUIDField(null=True)
+    claimed_s = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["stadtpuls_sensor_id", "id"])]
@@ -1,30 +1,92 @@
 import logging
-import simplejson as json  # for correct serialization of decimal geolocation
+import threading
+import time
 import toml
-import requests
 from requests import RequestException
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
 from datetime import datetime, timezone
 from ingest.signals import publish_sample
-from ingest.views import InternalSampleView
+from ingest.tracing import traced
+from .batching import RecordAccumulator
+from .client import StadtpulsClient
 from .models import StadpulsSensor
 
 logger = logging.getLogger(__name__)
 
 
-@receiver(publish_sample, sender=InternalSampleView)
+class SensorIdCache:
+    """Per-process map from installation IDs to Stadtpuls sensor IDs. Saving or
+    deleting a Stadtpuls sensor in the present process clears the map. Changes made by
+    other processes are picked up once an entry is older than
+    SP_SENSOR_ID_CACHE_MAX_AGE_S."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensor_ids = {}  # Sensor ID and time of lookup, by installation ID.
+
+    def invalidate(self):
+        with self._lock:
+            self._sensor_ids = {}
+
+    def put(self, installation_id, sensor_id):
+        with self._lock:
+            self._sensor_ids[installation_id] = (sensor_id, time.monotonic())
+
+    def get(self, installation_id):
+        """Return the Stadtpuls sensor ID of the installation, or None if the
+        installation is not registered with Stadtpuls."""
+        with self._lock:
+            entry = self._sensor_ids.get(installation_id)
+            if entry is not None:
+                sensor_id, loaded_at_s = entry
+                age_s = time.monotonic() - loaded_at_s
+                if age_s <= settings.SP_SENSOR_ID_CACHE_MAX_AGE_S:
+                    return sensor_id
+                del self._sensor_ids[installation_id]
+        sensor_id = (
+            StadpulsSensor.objects.filter(installation=installation_id)
+            .values_list("stadtpuls_sensor_id", flat=True)
+            .first()
+        )
+        if sensor_id is not None:
+            self.put(installation_id, sensor_id)
+        return sensor_id
+
+
+sensor_ids = SensorIdCache()
+
+
+@receiver(post_save, sender=StadpulsSensor)
+@receiver(post_delete, sender=StadpulsSensor)
+def invalidate_sensor_ids(sender, **kwargs):
+    sensor_ids.invalidate()
+    transaction.on_commit(sensor_ids.invalidate)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the Stadtpuls client of the present process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = StadtpulsClient()
+        return _client
+
+
+@receiver(publish_sample)
+@traced("receiver.publish_to_stadtpuls")
 def publish_to_stadtpuls(sender, **kwargs):
     sample = kwargs["sample"]
     installation = kwargs["installation"]
-    # Query the DB if the given installation was already set up in Stadtpuls.
-    try:
-        stadtpuls_installation = StadpulsSensor.objects.get(
-            installation=installation.id
-        )
-        stadtpuls_sensor_id = stadtpuls_installation.stadtpuls_sensor_id
-    except ObjectDoesNotExist:
+    # Look up if the given installation was already set up in Stadtpuls.
+    stadtpuls_sensor_id = sensor_ids.get(installation.id)
+    if stadtpuls_sensor_id is None:
         # If no, register a new Sensor with Statdpuls and persist this fact locally
         logging.info(
             "Installation with ID %d does not yet exist with Stadtpuls, creating it...",
@@ -42,15 +104,20 @@ def publish_to_stadtpuls(sender, **kwargs):
                 stadtpuls_sensor_id=stadtpuls_sensor_id,
             )
             sp_sensor.save()
+            sensor_ids.put(installation.id, stadtpuls_sensor_id)
 
     # insert the sample into Stadpuls.
+    if settings.SP_BATCH_RECORDS:
+        logging.debug("Queueing sample from %s for Stadtpuls", sender)
+        get_record_accumulator().add(stadtpuls_sensor_id, sample_to_record(sample))
+        return
     logging.info("Publishing sample from %s to Stadtpuls", sender)
     try:
         post_sample(sample, stadtpuls_sensor_id)
     except RequestException as error:
         logging.error(
             "Could not publish sample for node %s, Stadtpuls sensor %s, at timestamp %s. %s",
-            sample.node.id,
+            sample.node_id,
             stadtpuls_sensor_id,
             sample.timestamp_s,
             error,
@@ -58,55 +125,23 @@ def publish_to_stadtpuls(sender, **kwargs):
 
 
 def register_sensor(installation):
-    login_response = stadtpuls_login()
-    user_id = login_response["user"]["id"]
-    access_token = login_response["access_token"]
-
     node = installation.node
     room = installation.room
     site = room.site
 
-    headers = {
-        "apikey": settings.SP_API_KEY,
-        "Authorization": f"Bearer {access_token}",
-        # See discussion  https://github.com/supabase/supabase/discussions/4054
-        "prefer": "return=representation",
-    }
     # sensor_name = f"{node.id}::{installation.from_timestamp_s}"
     sensor_name = f"{node.alias} in {room.name}"
-    req_body = {
+    sensor = {
         "name": sensor_name[0:49],  # Stadpuls sensor name is limited to 50 characters.
         "description": installation_to_toml(installation),
         "connection_type": "http",
         "location": site.address.city,
         "longitude": site.address.longitude,
         "latitude": site.address.latitude,
-        "user_id": user_id,
         "category_id": 1,  # CO2 measurements
     }
     logging.debug("Setting up new sensor %s at %s", node.id, settings.SP_SUPABASE_URL)
-    response = requests.post(
-        settings.SP_SENSOR_ENDPOINT, headers=headers, json=req_body
-    )
-    response.raise_for_status()
-    json_response = json.loads(response.content)
-    return json_response[0]["id"]
-
-
-def stadtpuls_login():
-    headers = {"apikey": settings.SP_API_KEY}
-    params = {"grant_type": "password"}
-    req_body = {"email": settings.SP_LOGIN_EMAIL, "password": settings.SP_LOGIN_PWD}
-    logging.debug(
-        "Logging into Stadtpuls Supabase %s as user %s",
-        settings.SP_LOGIN_ENDPOINT,
-        settings.SP_LOGIN_EMAIL,
-    )
-    response = requests.post(
-        url=settings.SP_LOGIN_ENDPOINT, params=params, headers=headers, json=req_body
-    )
-    response.raise_for_status()
-    return response.json()
+    return get_client().create_sensor(sensor)
 
 
 def installation_to_toml(installation):
@@ -139,13 +174,35 @@ def installation_to_toml(installation):
     return toml.dumps(sp_sensor)
 
 
-def post_sample(sample, stadtpuls_sensor_id):
-    headers = {"Authorization": f"Bearer {settings.SP_AUTH_TOKEN}"}
+def sample_to_record(sample):
     timestamp = datetime.fromtimestamp(sample.timestamp_s, timezone.utc)
-    timestamp_iso = timestamp.isoformat()
-    req_body = {
-        "records": [{"recorded_at": timestamp_iso, "measurements": [sample.co2_ppm]}]
-    }
-    records_endpoint = f"{settings.SP_RECORDS_ENDPOINT}/{stadtpuls_sensor_id}/records"
-    response = requests.post(url=records_endpoint, headers=headers, json=req_body)
-    response.raise_for_status()
+    return {"recorded_at": timestamp.isoformat(), "measurements": [sample.co2_ppm]}
+
+
+def post_sample(sample, stadtpuls_sensor_id):
+    post_records(stadtpuls_sensor_id, [sample_to_record(sample)])
+
+
+def post_records(stadtpuls_sensor_id, records):
+    get_client().post_records(stadtpuls_sensor_id, records)
+
+
+_record_accumulator = None
+_record_accumulator_lock = threading.Lock()
+
+
+def get_record_accumulator():
+    """Return the record accumulator of the present process. Its pending records are
+    posted by the task stadtpuls_integration.tasks.post_pending_records."""
+    global _record_accumulator
+    with _record_accumulator_lock:
+        if _record_accumulator is None:
+            _record_accumulator = RecordAccumulator(
+                post_records,
+                max_records=settings.SP_BATCH_MAX_RECORDS,
+                max_age_s=settings.SP_BATCH_MAX_AGE_S,
+                max_pending=settings.SP_BATCH_MAX_PENDING,
+                retry_delay_s=settings.SP_BATCH_RETRY_DELAY_S,
+                claim_timeout_s=settings.SP_BATCH_CLAIM_TIMEOUT_S,
+            )
+        return _record_accumulator
@@ -0,0 +1,5 @@
+from .publisher import get_record_accumulator
+
+
+def post_pending_records():
+    get_record_accumulator().flush(force=False)
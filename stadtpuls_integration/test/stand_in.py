@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StadtpulsStandIn:
+    """Local HTTP server that stands in for the Stadtpuls login, sensor, and records
+    APIs. It records the requests it serves, with the client port of each request to
+    tell the connections apart."""
+
+    def __init__(self):
+        self.reset()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or "null")
+                stand_in.requests.append(
+                    (self.path, self.client_address[1], dict(self.headers), body)
+                )
+                status, response = stand_in.respond(self.path, self.headers, body)
+                content = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.settings = {
+            "SP_LOGIN_ENDPOINT": f"{self.url}/auth/v1/token",
+            "SP_SENSOR_ENDPOINT": f"{self.url}/rest/v1/sensors",
+            "SP_RECORDS_ENDPOINT": f"{self.url}/api/v3/sensors",
+        }
+
+    def reset(self):
+        self.requests = []
+        self.logins = 0
+        self.sensors = 0
+        self.rejected_tokens = set()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path, headers, body):
+        if path.startswith("/auth/v1/token"):
+            self.logins += 1
+            return (
+                200,
+                {
+                    "access_token": f"token-{self.logins}",
+                    "expires_in": 3600,
+                    "user": {"id": "user-1"},
+                },
+            )
+        if path == "/rest/v1/sensors":
+            access_token = headers["Authorization"].removeprefix("Bearer ")
+            if access_token in self.rejected_tokens:
+                return (401, {"message": "JWT expired"})
+            self.sensors += 1
+            return (201, [{"id": self.sensors, **body}])
+        if path.startswith("/api/v3/sensors/"):
+            return (201, {"data": body["records"]})
+        return (404, {})
@@ -0,0 +1,149 @@
+from unittest import mock
+
+from django.test import TestCase
+from requests import ConnectionError, HTTPError, Response
+
+from stadtpuls_integration import tasks
+from stadtpuls_integration.batching import RecordAccumulator
+from stadtpuls_integration.models import PendingRecord
+
+
+def record(timestamp_s):
+    return {"recorded_at": timestamp_s, "measurements": [500]}
+
+
+def http_error(status_code):
+    response = Response()
+    response.status_code = status_code
+    return HTTPError(response=response)
+
+
+@mock.patch("stadtpuls_integration.batching.time.time", return_value=1000)
+class RecordAccumulatorTestCase(TestCase):
+    def setUp(self):
+        self.posted = []
+        self.accumulator = RecordAccumulator(
+            self.post_records,
+            max_records=3,
+            max_age_s=600,
+            max_pending=5,
+            retry_delay_s=60,
+            claim_timeout_s=120,
+        )
+
+    def post_records(self, sensor_id, records):
+        self.posted.append((sensor_id, records))
+
+    def test_queue_without_posting(self, now):
+        for timestamp_s in range(4):
+            self.accumulator.add(1, record(timestamp_s))
+        self.assertEqual(self.posted, [])
+        self.assertEqual(self.accumulator.pending_count(1), 4)
+
+    def test_post_full_batch(self, now):
+        self.accumulator.add(1, record(1))
+        self.accumulator.add(1, record(2))
+        self.accumulator.add(2, record(3))
+        self.assertEqual(self.accumulator.flush(force=False), {})
+        self.accumulator.add(1, record(4))
+        report = self.accumulator.flush(force=False)
+        self.assertEqual(self.posted, [(1, [record(1), record(2), record(4)])])
+        self.assertEqual(report, {1: {"posted": 3, "requeued": 0, "dropped": 0}})
+        self.assertEqual(self.accumulator.pending_count(), 1)
+
+    def test_post_old_batch(self, now):
+        self.accumulator.add(1, record(1))
+        now.return_value = 1600
+        self.accumulator.add(2, record(2))
+        # A quiet sensor is posted by the next flush once its records are old.
+        self.accumulator.flush(force=False)
+        self.assertEqual(self.posted, [(1, [record(1)])])
+        self.assertEqual(self.accumulator.pending_count(2), 1)
+
+    def test_flush(self, now):
+        self.accumulator.add(1, record(1))
+        self.accumulator.add(2, record(2))
+        report = self.accumulator.flush()
+        self.assertEqual(len(self.posted), 2)
+        self.assertEqual(set(report), {1, 2})
+        self.assertEqual(self.accumulator.pending_count(), 0)
+
+    def test_requeue_on_failure(self, now):
+        self.accumulator.post_records = mock.Mock(side_effect=ConnectionError)
+        for timestamp_s in range(1, 4):
+            self.accumulator.add(1, record(timestamp_s))
+        report = self.accumulator.flush(force=False)
+        self.assertEqual(report, {1: {"posted": 0, "requeued": 3, "dropped": 0}})
+        # Retry only after the retry delay.
+        self.accumulator.post_records = self.post_records
+        self.accumulator.add(1, record(4))
+        self.accumulator.add(1, record(5))
+        self.accumulator.flush(force=False)
+        self.assertEqual(self.posted, [])
+        now.return_value = 1060
+        self.accumulator.flush(force=False)
+        self.assertEqual(
+            self.posted,
+            [(1, [record(1), record(2), record(3)]), (1, [record(4), record(5)])],
+        )
+
+    def test_requeue_bounded(self, now):
+        self.accumulator.post_records = mock.Mock(side_effect=http_error(503))
+        for timestamp_s in range(4):
+            self.accumulator.add(1, record(timestamp_s))
+        report = self.accumulator.flush()
+        self.assertEqual(report, {1: {"posted": 0, "requeued": 4, "dropped": 0}})
+        for timestamp_s in range(4, 7):
+            self.accumulator.add(1, record(timestamp_s))
+        report = self.accumulator.flush()
+        self.assertEqual(report, {1: {"posted": 0, "requeued": 5, "dropped": 2}})
+        self.accumulator.post_records = self.post_records
+        self.accumulator.flush()
+        self.assertEqual(
+            [r for _, records in self.posted for r in records],
+            [record(timestamp_s) for timestamp_s in range(2, 7)],
+        )
+
+    def test_drop_rejected_records(self, now):
+        self.accumulator.post_records = mock.Mock(side_effect=[http_error(400), None])
+        for timestamp_s in range(5):
+            self.accumulator.add(1, record(timestamp_s))
+        self.accumulator.add(1, record(5))
+        report = self.accumulator.flush()
+        self.assertEqual(report, {1: {"posted": 3, "requeued": 0, "dropped": 3}})
+        self.assertEqual(self.accumulator.pending_count(), 0)
+
+    def test_post_outside_transaction(self, now):
+        def post_records(sensor_id, records):
+            # The records are claimed meanwhile, a concurrent flush skips them.
+            self.assertEqual(self.accumulator.flush(), {})
+            self.assertFalse(PendingRecord.objects.filter(claim=None).exists())
+            self.post_records(sensor_id, records)
+
+        self.accumulator.post_records = post_records
+        self.accumulator.add(1, record(1))
+        self.accumulator.flush()
+        self.assertEqual(self.posted, [(1, [record(1)])])
+        self.assertFalse(PendingRecord.objects.exists())
+
+    def test_post_records_of_exited_flush_again(self, now):
+        self.accumulator.post_records = mock.Mock(side_effect=KeyboardInterrupt)
+        self.accumulator.add(1, record(1))
+        with self.assertRaises(KeyboardInterrupt):
+            self.accumulator.flush()
+        self.accumulator.post_records = self.post_records
+        self.assertEqual(self.accumulator.flush(), {})
+        now.return_value = 1120
+        self.accumulator.flush()
+        self.assertEqual(self.posted, [(1, [record(1)])])
+
+    def test_post_pending_records_task(self, now):
+        self.accumulator.add(1, record(1))
+        now.return_value = 1600
+        with mock.patch(
+            "stadtpuls_integration.tasks.get_record_accumulator",
+            return_value=self.accumulator,
+        ):
+            tasks.post_pending_records()
+        self.assertEqual(self.posted, [(1, [record(1)])])
+        self.assertFalse(PendingRecord.objects.exists())
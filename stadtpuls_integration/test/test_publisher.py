@@ -0,0 +1,131 @@
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from core.models import RoomNodeInstallation, Sample
+from core.test.utils import setup_basic_test_data
+from stadtpuls_integration.client import StadtpulsClient
+from stadtpuls_integration.models import StadpulsSensor
+from stadtpuls_integration import publisher
+from .stand_in import StadtpulsStandIn
+
+
+class PublisherTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stand_in = StadtpulsStandIn()
+        cls.stand_in.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_data = setup_basic_test_data()
+        cls.installation1 = RoomNodeInstallation.objects.create(
+            node=cls.test_data["node1"],
+            room=cls.test_data["room1"],
+            from_timestamp_s=1000,
+            is_public=True,
+        )
+        cls.installation2 = RoomNodeInstallation.objects.create(
+            node=cls.test_data["node2"],
+            room=cls.test_data["room2"],
+            from_timestamp_s=1000,
+            is_public=True,
+        )
+
+    def setUp(self):
+        self.settings_override = override_settings(
+            SP_BATCH_RECORDS=False, **self.stand_in.settings
+        )
+        self.settings_override.enable()
+        self.stand_in.reset()
+        publisher.sensor_ids.invalidate()
+        publisher._client = StadtpulsClient()
+
+    def tearDown(self):
+        publisher._client = None
+        self.settings_override.disable()
+
+    def publish(self, installation, timestamp_s):
+        sample = Sample(node=installation.node, timestamp_s=timestamp_s, co2_ppm=500)
+        publisher.publish_to_stadtpuls(
+            self.__class__, sample=sample, installation=installation
+        )
+
+    def paths(self):
+        return [path.split("?")[0] for path, _, _, _ in self.stand_in.requests]
+
+    def test_register_and_post(self):
+        self.publish(self.installation1, 1600)
+        sensor = StadpulsSensor.objects.get(installation=self.installation1)
+        self.assertEqual(
+            self.paths(),
+            [
+                "/auth/v1/token",
+                "/rest/v1/sensors",
+                f"/api/v3/sensors/{sensor.stadtpuls_sensor_id}/records",
+            ],
+        )
+        _, _, headers, body = self.stand_in.requests[1]
+        self.assertEqual(headers["Authorization"], "Bearer token-1")
+        self.assertEqual(body["user_id"], "user-1")
+
+    def test_reuse_connection_and_token(self):
+        self.publish(self.installation1, 1600)
+        self.publish(self.installation2, 1600)
+        self.publish(self.installation1, 1700)
+        self.assertEqual(self.paths().count("/auth/v1/token"), 1)
+        self.assertEqual(self.paths().count("/rest/v1/sensors"), 2)
+        client_ports = {port for _, port, _, _ in self.stand_in.requests}
+        self.assertEqual(len(client_ports), 1)
+
+    def test_login_again_on_rejected_token(self):
+        self.publish(self.installation1, 1600)
+        self.stand_in.rejected_tokens.add("token-1")
+        self.publish(self.installation2, 1600)
+        sensor_requests = [
+            headers["Authorization"]
+            for path, _, headers, _ in self.stand_in.requests
+            if path == "/rest/v1/sensors"
+        ]
+        self.assertEqual(sensor_requests[1:], ["Bearer token-1", "Bearer token-2"])
+        self.assertTrue(
+            StadpulsSensor.objects.filter(installation=self.installation2).exists()
+        )
+
+    def test_cache_sensor_ids(self):
+        self.publish(self.installation1, 1600)
+        with self.assertNumQueries(0):
+            self.publish(self.installation1, 1700)
+
+    def test_invalidate_sensor_ids(self):
+        self.publish(self.installation1, 1600)
+        StadpulsSensor.objects.filter(installation=self.installation1).delete()
+        StadpulsSensor.objects.create(
+            installation=self.installation1, inserted_s=1650, stadtpuls_sensor_id=42
+        )
+        self.stand_in.requests.clear()
+        self.publish(self.installation1, 1700)
+        self.assertEqual(self.paths(), ["/api/v3/sensors/42/records"])
+
+    @override_settings(SP_SENSOR_ID_CACHE_MAX_AGE_S=300)
+    def test_expire_sensor_ids(self):
+        self.publish(self.installation1, 1600)
+        # Changed by another process, without signals in the present one.
+        StadpulsSensor.objects.filter(installation=self.installation1).update(
+            stadtpuls_sensor_id=42
+        )
+        self.stand_in.requests.clear()
+        self.publish(self.installation1, 1700)
+        later_s = time.monotonic() + 301
+        with mock.patch("stadtpuls_integration.publisher.time.monotonic") as monotonic:
+            monotonic.return_value = later_s
+            self.publish(self.installation1, 1800)
+        self.assertEqual(self.paths()[-1], "/api/v3/sensors/42/records")
+        self.assertNotEqual(self.paths()[0], "/api/v3/sensors/42/records")